@@ -0,0 +1,13 @@
+import os
+
+# Placeholder settings so `src.config` can be imported without a `.env` file.
+DEFAULT_ENV = {
+    "BACKEND_URL": "http://127.0.0.1:3000",
+    "API_KEY": "benchmark",
+    "CLINIC_API_KEY": "benchmark",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "cache+memory://",
+}
+
+for name, value in DEFAULT_ENV.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,107 @@
+"""
+Measure peak memory of fetching and decoding one DICOM file.
+
+Compares the legacy path (whole body in `response.content`, copied into a
+BytesIO and parsed completely by `dcmread`) with the streaming path of
+`DicomService.fetch_dicom` and `read_pixel_array`, with the disk cache
+disabled and enabled. Peak memory is taken from tracemalloc, which also
+tracks NumPy buffers.
+
+    python -m benchmarks.dicom_memory --size 4096
+"""
+
+import argparse
+import asyncio
+import functools
+import io
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+import pydicom as dicom
+
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from benchmarks.windowing import legacy_render
+from src.dicom import service as service_module
+from src.dicom.cache import DicomFileCache
+from src.dicom.service import DicomService
+from src.http_client import http_client_pool
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+async def legacy_path(dicom_service: DicomService, file_url: str) -> np.ndarray:
+    async with httpx.AsyncClient() as client:
+        response = await client.get(file_url, timeout=300)
+    ds = dicom.dcmread(io.BytesIO(response.content))
+    return legacy_render(ds.pixel_array)
+
+
+async def streaming_path(dicom_service: DicomService, file_url: str) -> np.ndarray:
+    with await dicom_service.fetch_dicom(file_url) as fetched:
+        return dicom_service.read_pixel_array(fetched.file)
+
+
+def peak_mib(loop, coroutine_factory) -> float:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    loop.run_until_complete(coroutine_factory())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024**2, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=4096, help="Image size in pixels")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "instance.dcm")
+        with open(path, "wb") as file:
+            file.write(make_dicom(make_pixel_array(args.size, args.size, "uint16")))
+        file_size = os.path.getsize(path)
+
+        handler = functools.partial(QuietHandler, directory=directory)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        file_url = f"http://127.0.0.1:{server.server_port}/instance.dcm"
+
+        loop = asyncio.new_event_loop()
+        dicom_service = DicomService()
+        report = {"file_mib": round(file_size / 1024**2, 1)}
+        report["legacy_peak_mib"] = peak_mib(
+            loop, lambda: legacy_path(dicom_service, file_url)
+        )
+
+        service_module.dicom_file_cache = None
+        report["streaming_peak_mib"] = peak_mib(
+            loop, lambda: streaming_path(dicom_service, file_url)
+        )
+
+        service_module.dicom_file_cache = DicomFileCache(
+            os.path.join(directory, "cache"), 2 * file_size, 3600
+        )
+        # First call fills the cache, the second one is measured as a hit
+        loop.run_until_complete(streaming_path(dicom_service, file_url))
+        report["cached_peak_mib"] = peak_mib(
+            loop, lambda: streaming_path(dicom_service, file_url)
+        )
+
+        loop.run_until_complete(http_client_pool.shutdown())
+        loop.close()
+        server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Time each stage of the DICOM and inference hot paths on synthetic data.
+
+Synthetic DICOM files are generated for every combination of pixel type, size,
+transfer syntax and frame count, and each stage is timed on its own: parsing,
+pixel decoding, with the selected plugin and with every installed plugin of the
+transfer syntax, a 256 pixel thumbnail, the legacy normalization, auto
+contrast, the full rendering, image encoding and model preprocessing. The forward pass of every registered
+model is timed with random weights. Results are written as JSON; with
+`--baseline`, they are compared to an earlier run and regressions make the
+script exit with status 1.
+
+    python -m benchmarks.hot_paths --output current.json
+    python -m benchmarks.hot_paths --baseline current.json --threshold 0.15
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+import pydicom
+import torch
+from PIL import Image
+from pydicom.pixels import get_decoder, pixel_array as pixel_array_from_file
+
+from benchmarks.synthetic import (
+    TRANSFER_SYNTAXES,
+    can_encode,
+    make_dicom,
+    make_pixel_array,
+)
+from src.dicom.decoders import decoding_plugin
+from src.dicom.schema import RenderParams
+from src.dicom.service import DicomService
+from src.inference.service import ClassificationService, build_model
+from src.inference.specs import MODEL_SPECS
+
+
+def build_services(weights_dir: str) -> dict[str, ClassificationService]:
+    """
+    Instantiate an eager service for every registered model with random weights.
+    """
+    torch.manual_seed(0)
+    services = {}
+    for name, spec in MODEL_SPECS.items():
+        weights_path = os.path.join(weights_dir, f"{name}.pt")
+        torch.save(build_model(spec).state_dict(), weights_path)
+        services[name] = ClassificationService(
+            spec.model_copy(update={"weights_path": weights_path, "backend": "eager"})
+        )
+    return services
+
+
+def timed(
+    fn: Callable, setup: Optional[Callable[[], tuple]] = None, repeat: int = 10
+) -> dict:
+    """
+    Time a function, calling `setup` untimed before each run for its arguments.
+    """
+    samples = []
+    for index in range(repeat + 1):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        # The first run pays for imports and allocator warm-up
+        if index > 0:
+            samples.append(elapsed)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+    }
+
+
+def legacy_normalize(pixel_array: np.ndarray) -> np.ndarray:
+    return np.uint8(cv2.normalize(pixel_array, None, 0, 255, cv2.NORM_MINMAX))
+
+
+def bench_decoders(data: bytes, transfer_syntax: pydicom.uid.UID, repeat: int) -> dict:
+    """
+    Time the decoding of the first frame with every installed plugin of a
+    compressed transfer syntax.
+    """
+    if not transfer_syntax.is_compressed:
+        return {}
+    return {
+        f"decode_{plugin}": timed(
+            lambda: pixel_array_from_file(io.BytesIO(data), decoding_plugin=plugin),
+            repeat=repeat,
+        )
+        for plugin in get_decoder(transfer_syntax).available_plugins
+    }
+
+
+def bench_dicom(
+    data: bytes,
+    transfer_syntax: pydicom.uid.UID,
+    service: ClassificationService,
+    repeat: int,
+) -> dict[str, dict]:
+    dicom_service = DicomService()
+    dataset = pydicom.dcmread(io.BytesIO(data))
+    frame = dataset.pixel_array
+    frame = frame[0] if "NumberOfFrames" in dataset else frame
+    normalized = legacy_normalize(frame)
+    rendered = dicom_service.render_pixel_array(frame)
+    image = Image.fromarray(rendered).convert("RGB")
+
+    return {
+        "dcmread": timed(lambda: pydicom.dcmread(io.BytesIO(data)), repeat=repeat),
+        "pixel_array": timed(
+            lambda ds: ds.pixel_array,
+            lambda: (pydicom.dcmread(io.BytesIO(data)),),
+            repeat,
+        ),
+        "decode_pixel_data": timed(
+            lambda: dicom_service.decode_pixel_data(io.BytesIO(data)), repeat=repeat
+        ),
+        **bench_decoders(data, transfer_syntax, repeat),
+        "thumbnail_256": timed(
+            lambda: dicom_service.read_pixel_array(
+                io.BytesIO(data), RenderParams(max_size=256)
+            ),
+            repeat=repeat,
+        ),
+        "cv2.normalize": timed(lambda: legacy_normalize(frame), repeat=repeat),
+        "apply_auto_contrast": timed(
+            lambda: dicom_service.apply_auto_contrast(normalized), repeat=repeat
+        ),
+        "render_pixel_array": timed(
+            lambda: dicom_service.render_pixel_array(frame), repeat=repeat
+        ),
+        "imencode_png": timed(lambda: cv2.imencode(".png", rendered), repeat=repeat),
+        "imencode_jpeg": timed(lambda: cv2.imencode(".jpg", rendered), repeat=repeat),
+        "torchvision_transforms": timed(
+            lambda: service.transform(image), repeat=repeat
+        ),
+        "array_to_tensor": timed(
+            lambda: service.preprocess_array(rendered), repeat=repeat
+        ),
+    }
+
+
+def bench_models(
+    services: dict[str, ClassificationService], batch_sizes: list[int], repeat: int
+) -> dict[str, dict]:
+    results = {}
+    for name, service in services.items():
+        for batch_size in batch_sizes:
+            images = torch.randn(batch_size, 3, *service.spec.input_size)
+            results.setdefault(name, {})[f"forward_batch_{batch_size}"] = timed(
+                lambda: service.forward_batch(images), repeat=repeat
+            )
+    return results
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_delta_ms: float
+) -> dict:
+    """
+    Compare the medians of two runs stage by stage.
+
+    A stage regresses when it got slower by more than `threshold` relative and
+    `min_delta_ms` absolute, so that timer noise on sub-millisecond stages is
+    not reported.
+    """
+    comparison = {"regressions": [], "improvements": [], "missing": []}
+    for section in ("dicom", "models"):
+        for case, stages in baseline.get(section, {}).items():
+            for stage, base in stages.items():
+                current = results[section].get(case, {}).get(stage)
+                if current is None:
+                    comparison["missing"].append(f"{section}/{case}/{stage}")
+                    continue
+                delta = current["median_ms"] - base["median_ms"]
+                ratio = current["median_ms"] / max(base["median_ms"], 1e-9)
+                entry = {
+                    "stage": f"{section}/{case}/{stage}",
+                    "baseline_ms": base["median_ms"],
+                    "current_ms": current["median_ms"],
+                    "ratio": round(ratio, 3),
+                }
+                if abs(delta) < min_delta_ms:
+                    continue
+                if ratio > 1 + threshold:
+                    comparison["regressions"].append(entry)
+                elif ratio < 1 / (1 + threshold):
+                    comparison["improvements"].append(entry)
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024])
+    parser.add_argument("--dtypes", nargs="+", default=["uint8", "uint16"])
+    parser.add_argument(
+        "--syntaxes",
+        nargs="+",
+        choices=list(TRANSFER_SYNTAXES),
+        default=list(TRANSFER_SYNTAXES),
+        help="Transfer syntaxes, those without an installed encoder are skipped",
+    )
+    parser.add_argument("--frames", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs per stage")
+    parser.add_argument("--output", help="Write the results to a file")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare")
+    parser.add_argument(
+        "--threshold", type=float, default=0.15, help="Relative slowdown to flag"
+    )
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=0.05, help="Absolute slowdown to flag"
+    )
+    args = parser.parse_args()
+
+    weights_dir = tempfile.TemporaryDirectory()
+    services = build_services(weights_dir.name)
+    service = next(iter(services.values()))
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "pydicom": pydicom.__version__,
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+            "decoders": {
+                name: decoding_plugin(syntax) or "native"
+                for name, syntax in TRANSFER_SYNTAXES.items()
+            },
+        },
+        "skipped": [],
+        "dicom": {},
+    }
+    for syntax in args.syntaxes:
+        for dtype in args.dtypes:
+            if not can_encode(TRANSFER_SYNTAXES[syntax], dtype):
+                results["skipped"].append(f"{syntax}-{dtype}: no encoder installed")
+                continue
+            for size in args.sizes:
+                for frames in args.frames:
+                    pixels = np.stack(
+                        [make_pixel_array(size, size, dtype, i) for i in range(frames)]
+                    )
+                    data = make_dicom(
+                        pixels[0] if frames == 1 else pixels, TRANSFER_SYNTAXES[syntax]
+                    )
+                    case = f"{syntax}-{dtype}-{size}x{size}-{frames}f"
+                    print(f"Timing {case}", file=sys.stderr)
+                    results["dicom"][case] = bench_dicom(
+                        data, TRANSFER_SYNTAXES[syntax], service, args.repeat
+                    )
+    results["models"] = bench_models(services, args.batch_sizes, args.repeat)
+    weights_dir.cleanup()
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        results["comparison"] = compare(
+            results, baseline, args.threshold, args.min_delta_ms
+        )
+        for entry in results["comparison"]["regressions"]:
+            print(
+                f"Regression {entry['stage']}: {entry['baseline_ms']} ms -> "
+                f"{entry['current_ms']} ms (x{entry['ratio']})",
+                file=sys.stderr,
+            )
+        failed = bool(results["comparison"]["regressions"])
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare per-task HTTP latency with fresh clients against the shared client pool.
+
+A local stand-in server plays both the file host (GET of a DICOM-sized body)
+and the backend (PATCH of a prediction result). Each simulated task performs
+one download and one write-back, like the Celery prediction tasks do.
+
+    python -m benchmarks.http_pool --tasks 200
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from src.http_client import http_client_pool
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"\0" * 512 * 1024
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dicom")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def do_PATCH(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+async def fresh_client_task(file_url: str, backend_url: str):
+    async with httpx.AsyncClient() as client:
+        await client.get(file_url, timeout=300)
+    async with httpx.AsyncClient() as client:
+        await client.patch(backend_url, json={"result": "normal", "probability": 1})
+
+
+async def pooled_client_task(file_url: str, backend_url: str):
+    client = http_client_pool.get()
+    await client.get(file_url)
+    await client.patch(backend_url, json={"result": "normal", "probability": 1})
+
+
+def run(task, tasks: int, file_url: str, backend_url: str, loop) -> dict:
+    latencies = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        loop.run_until_complete(task(file_url, backend_url))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks per mode")
+    parser.add_argument("--file-url", help="Use a real file URL instead")
+    parser.add_argument("--backend-url", help="Use a real PATCH target instead")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    file_url = args.file_url or f"{base_url}/instance.dcm"
+    backend_url = args.backend_url or f"{base_url}/cdss/benchmark"
+
+    loop = asyncio.new_event_loop()
+    report = {
+        "fresh_client": run(fresh_client_task, args.tasks, file_url, backend_url, loop),
+        "pooled_client": run(
+            pooled_client_task, args.tasks, file_url, backend_url, loop
+        ),
+    }
+    loop.run_until_complete(http_client_pool.shutdown())
+    loop.close()
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
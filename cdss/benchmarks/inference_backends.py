@@ -0,0 +1,208 @@
+"""
+Compare accuracy, latency, throughput and memory of the inference backends.
+
+Every backend of every registered model is exported from the same weights and
+run on synthetic DICOM images preprocessed the way the prediction tasks do.
+Outputs are compared against eager PyTorch, then timed at each thread count
+and batch size. Float backends must match eager within `--tolerance`, int8
+backends within `--int8-tolerance`; the fastest backend within tolerance is
+reported per model. Models use random weights unless `--registry-weights`.
+
+    python -m benchmarks.inference_backends --threads 1 2 4 --batch-sizes 1 8
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import torch
+
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from src.dicom.schema import RenderParams
+from src.dicom.service import DicomService
+from src.inference.export import export_model
+from src.inference.registry import current_rss_bytes
+from src.inference.service import ClassificationService, build_model
+from src.inference.specs import MODEL_SPECS, ModelSpec
+
+# (backend, channels_last) variants, eager first as the reference
+VARIANTS = [
+    ("eager", False),
+    ("eager", True),
+    ("torchscript", False),
+    ("torchscript", True),
+    ("onnx", False),
+    ("int8_dynamic", False),
+    ("int8_static", False),
+]
+
+
+def variant_name(backend: str, channels_last: bool) -> str:
+    return f"{backend}+channels_last" if channels_last else backend
+
+
+def make_images(
+    service: ClassificationService, count: int, size: int, seed: int
+) -> torch.Tensor:
+    dicom_service = DicomService()
+    images = []
+    for index in range(count):
+        pixels = make_pixel_array(size, size, "uint16", seed + index)
+        pixel_array = dicom_service.read_pixel_array(
+            io.BytesIO(make_dicom(pixels)), RenderParams()
+        )
+        images.append(service.preprocess_array(pixel_array))
+    return torch.stack(images)
+
+
+def compare(reference: torch.Tensor, logits: torch.Tensor) -> dict:
+    probabilities = torch.softmax(logits, dim=1)
+    reference_probabilities = torch.softmax(reference, dim=1)
+    agreement = probabilities.argmax(1) == reference_probabilities.argmax(1)
+    return {
+        "max_logit_diff": float((logits - reference).abs().max()),
+        "max_probability_diff": float(
+            (probabilities - reference_probabilities).abs().max()
+        ),
+        "top1_agreement": round(float(agreement.float().mean()), 4),
+    }
+
+
+def time_batches(
+    service: ClassificationService, images: torch.Tensor, batch_size: int, repeat: int
+) -> dict:
+    batch = images[:batch_size]
+    if len(batch) < batch_size:
+        batch = images.repeat(batch_size // len(images) + 1, 1, 1, 1)[:batch_size]
+    for _ in range(2):
+        service.forward_batch(batch)
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        service.forward_batch(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50 = statistics.median(latencies)
+    return {
+        "p50_ms": round(p50, 2),
+        "min_ms": round(min(latencies), 2),
+        "images_per_s": round(batch_size / p50 * 1000, 1),
+    }
+
+
+def load_service(spec: ModelSpec, threads: int) -> ClassificationService:
+    torch.set_num_threads(threads)
+    return ClassificationService(spec)
+
+
+def benchmark_model(spec: ModelSpec, args, directory: str) -> dict:
+    eager = load_service(spec, args.threads[0])
+    calibration = list(make_images(eager, args.calibration, args.size, seed=1000))
+    images = make_images(eager, args.samples, args.size, seed=0)
+    reference = eager.forward_batch(images)
+
+    report = {}
+    for backend, channels_last in VARIANTS:
+        name = variant_name(backend, channels_last)
+        if args.backends and backend not in args.backends:
+            continue
+        variant = spec.model_copy(
+            update={
+                "backend": backend,
+                "channels_last": channels_last,
+                "artifacts_dir": os.path.join(directory, spec.name, name),
+            }
+        )
+        if backend != "eager":
+            export_model(variant, [backend], [], calibration)
+
+        rss_before = current_rss_bytes()
+        service = load_service(variant, args.threads[0])
+        service.warm_up()
+        stats = {
+            "load_ms": round(service.load_seconds * 1000, 1),
+            "size_mib": round(service.parameter_bytes / 1024**2, 1),
+            "rss_delta_mib": round((current_rss_bytes() - rss_before) / 1024**2, 1),
+            **compare(reference, service.forward_batch(images)),
+        }
+        tolerance = args.int8_tolerance if "int8" in backend else args.tolerance
+        stats["within_tolerance"] = stats["max_probability_diff"] <= tolerance
+
+        stats["latency"] = {}
+        for threads in args.threads:
+            if threads != args.threads[0]:
+                service = load_service(variant, threads)
+            stats["latency"][str(threads)] = {
+                str(batch_size): time_batches(service, images, batch_size, args.repeat)
+                for batch_size in args.batch_sizes
+            }
+        report[name] = stats
+        del service
+
+    candidates = [
+        (
+            max(
+                level[str(args.batch_sizes[-1])]["images_per_s"]
+                for level in stats["latency"].values()
+            ),
+            name,
+        )
+        for name, stats in report.items()
+        if stats["within_tolerance"]
+    ]
+    report["fastest_within_tolerance"] = max(candidates)[1] if candidates else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_SPECS))
+    parser.add_argument(
+        "--backends", nargs="+", choices=sorted({backend for backend, _ in VARIANTS})
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--size", type=int, default=512, help="Image size in pixels")
+    parser.add_argument("--samples", type=int, default=16, help="Parity images")
+    parser.add_argument("--calibration", type=int, default=16, help="int8 images")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed runs")
+    parser.add_argument("--tolerance", type=float, default=1e-3)
+    parser.add_argument("--int8-tolerance", type=float, default=0.05)
+    parser.add_argument(
+        "--registry-weights",
+        action="store_true",
+        help="Use the weights of the registry instead of random ones",
+    )
+    args = parser.parse_args()
+    if args.backends and "eager" not in args.backends:
+        args.backends.append("eager")
+
+    report, failed = {}, False
+    with tempfile.TemporaryDirectory() as directory:
+        torch.manual_seed(0)
+        for name in args.models or list(MODEL_SPECS):
+            spec = MODEL_SPECS[name]
+            if not args.registry_weights:
+                weights_path = os.path.join(directory, f"{name}.pt")
+                torch.save(build_model(spec).state_dict(), weights_path)
+                spec = spec.model_copy(update={"weights_path": weights_path})
+            report[name] = benchmark_model(spec, args, directory)
+            failed |= any(
+                not stats["within_tolerance"]
+                for variant, stats in report[name].items()
+                if isinstance(stats, dict) and "int8" not in variant
+            )
+
+    print(json.dumps(report, indent=2))
+    if failed:
+        print("Float backends differ from eager beyond tolerance", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Compare the throughput of the sequential and pipelined worker modes.
+
+A local stand-in server plays the file host, serving synthetic DICOM files
+after `--latency-ms`, and the backend, answering write-backs after the same
+delay. Prediction tasks run in-process the way the worker pools run them: one
+at a time in the sequential mode, as in one prefork process, and `--window` at
+a time on threads in the pipelined mode. Both are compared to the model-bound
+limit, the throughput of forward passes alone at the maximum batch size.
+Models use random weights, and the DICOM file and prediction caches are
+disabled.
+
+    python -m benchmarks.pipelined_worker --latency-ms 50 --tasks 200
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from src.config import Config
+from src.dicom import service as service_module
+from src.inference import celery_jobs
+from src.inference.result_cache import PredictionCache
+from src.inference.service import build_model
+from src.inference.specs import MODEL_SPECS
+from src.inference.threads import available_cores, set_intra_op_threads
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    files = {}
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = self.files[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/dicom")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PATCH(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def run_tasks(model_name: str, urls: list[str], window: int) -> dict:
+    jobs = [(model_name, f"prediction-{index}", url) for index, url in enumerate(urls)]
+    start = time.perf_counter()
+    if window == 1:
+        for job in jobs:
+            celery_jobs.predict_task(*job)
+    else:
+        with ThreadPoolExecutor(window) as pool:
+            list(pool.map(lambda job: celery_jobs.predict_task(*job), jobs))
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 2),
+        "images_per_s": round(len(jobs) / seconds, 1),
+    }
+
+
+def model_bound(model_name: str, repeat: int) -> float:
+    service = celery_jobs.model_registry.get_service(model_name)
+    images = torch.randn(service.spec.max_batch_size, 3, *service.spec.input_size)
+    service.forward_batch(images)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        service.forward_batch(images)
+    seconds = time.perf_counter() - start
+    return round(len(images) * repeat / seconds, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_SPECS))
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks per mode")
+    parser.add_argument("--files", type=int, default=16, help="Distinct files")
+    parser.add_argument("--size", type=int, default=512, help="Image size in pixels")
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--window", type=int, default=Config.PIPELINE_WINDOW)
+    parser.add_argument("--repeat", type=int, default=20, help="Model-bound runs")
+    args = parser.parse_args()
+
+    StandInHandler.latency = args.latency_ms / 1000
+    for index in range(args.files):
+        pixels = make_pixel_array(args.size, args.size, "uint16", index)
+        StandInHandler.files[f"/{index}.dcm"] = make_dicom(pixels)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    urls = [f"{base_url}/{index % args.files}.dcm" for index in range(args.tasks)]
+
+    celery_jobs.result_writer.backend_url = base_url
+    service_module.dicom_file_cache = None
+    celery_jobs.prediction_cache = PredictionCache(None)
+    set_intra_op_threads(available_cores())
+
+    report = {"cores": available_cores(), "latency_ms": args.latency_ms}
+    with tempfile.TemporaryDirectory() as directory:
+        torch.manual_seed(0)
+        for name in args.models or list(MODEL_SPECS):
+            spec = MODEL_SPECS[name]
+            weights_path = os.path.join(directory, f"{name}.pt")
+            torch.save(build_model(spec).state_dict(), weights_path)
+            celery_jobs.model_registry.specs[name] = spec.model_copy(
+                update={"weights_path": weights_path}
+            )
+
+            sequential = run_tasks(name, urls, 1)
+            celery_jobs.start_pipeline([name])
+            try:
+                pipelined = run_tasks(name, urls, args.window)
+            finally:
+                celery_jobs.stop_pipeline()
+            bound = model_bound(name, args.repeat)
+            report[name] = {
+                "sequential": sequential,
+                "pipelined": pipelined,
+                "model_bound_images_per_s": bound,
+                "pipelined_share_of_bound": round(pipelined["images_per_s"] / bound, 3),
+            }
+
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
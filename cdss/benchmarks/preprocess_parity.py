@@ -0,0 +1,136 @@
+"""
+Check that the direct array inference path matches the legacy image path.
+
+The legacy path encodes the processed pixel array, decodes it with PIL and
+applies the torchvision transforms. The direct path feeds the array to
+`predict_array`. PNG is compared for exact preprocessing parity, JPEG to show
+what the lossy round trip used to cost. Models use random weights.
+
+    python -m benchmarks.preprocess_parity
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import torch
+from PIL import Image
+
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from src.dicom.service import DicomService
+from src.inference.preprocessing import array_to_tensor
+from src.inference.service import ClassificationService, build_model
+from src.inference.specs import MODEL_SPECS
+
+# Maximum absolute difference allowed against the lossless legacy path
+TENSOR_TOLERANCE = 0.05
+PROBABILITY_TOLERANCE = 0.01
+
+
+def build_services(weights_dir: str) -> dict:
+    """
+    Instantiate a service for every registered model with freshly initialized weights.
+    """
+    torch.manual_seed(0)
+    services = {}
+    for name, spec in MODEL_SPECS.items():
+        weights_path = os.path.join(weights_dir, f"{name}.pt")
+        torch.save(build_model(spec).state_dict(), weights_path)
+        services[name] = ClassificationService(
+            spec.model_copy(update={"weights_path": weights_path})
+        )
+    return services
+
+
+def legacy_tensor(service, image_bytes: bytes) -> torch.Tensor:
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return service.transform(image)
+
+
+def timed(fn, *args, repeat: int = 5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args)
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="Image size in pixels")
+    parser.add_argument("--samples", type=int, default=5, help="Images per dtype")
+    args = parser.parse_args()
+
+    dicom_service = DicomService()
+    report, failed = {}, False
+    with tempfile.TemporaryDirectory() as weights_dir:
+        services = build_services(weights_dir)
+        for name, service in services.items():
+            stats = {
+                "max_tensor_diff_png": 0.0,
+                "max_probability_diff_png": 0.0,
+                "max_probability_diff_jpeg": 0.0,
+                "class_mismatches_png": 0,
+                "class_mismatches_jpeg": 0,
+                "legacy_jpeg_ms": 0.0,
+                "array_ms": 0.0,
+            }
+            for dtype in ("uint8", "uint16"):
+                for seed in range(args.samples):
+                    pixels = make_pixel_array(args.size, args.size, dtype, seed)
+                    dicom_bytes = make_dicom(pixels)
+                    array = dicom_service.read_pixel_array(io.BytesIO(dicom_bytes))
+
+                    png = dicom_service.encode_image(array, "png").getvalue()
+                    jpeg, legacy_ms = timed(
+                        lambda: dicom_service.process_dicom_data(
+                            io.BytesIO(dicom_bytes), "jpeg"
+                        ).getvalue()
+                    )
+                    legacy_png = service.predict(png)
+                    legacy_jpeg, predict_ms = timed(service.predict, jpeg)
+                    direct, array_ms = timed(
+                        lambda: service.predict_array(
+                            dicom_service.read_pixel_array(io.BytesIO(dicom_bytes))
+                        )
+                    )
+
+                    tensor_diff = (
+                        (legacy_tensor(service, png) - array_to_tensor(array))
+                        .abs()
+                        .max()
+                        .item()
+                    )
+                    stats["max_tensor_diff_png"] = max(
+                        stats["max_tensor_diff_png"], tensor_diff
+                    )
+                    for key, legacy in (("png", legacy_png), ("jpeg", legacy_jpeg)):
+                        diff = abs(legacy["probability"] - direct["probability"])
+                        stats[f"max_probability_diff_{key}"] = max(
+                            stats[f"max_probability_diff_{key}"], diff
+                        )
+                        stats[f"class_mismatches_{key}"] += (
+                            legacy["class"] != direct["class"]
+                        )
+                    stats["legacy_jpeg_ms"] += legacy_ms + predict_ms
+                    stats["array_ms"] += array_ms
+
+            count = 2 * args.samples
+            stats["legacy_jpeg_ms"] = round(stats["legacy_jpeg_ms"] / count, 2)
+            stats["array_ms"] = round(stats["array_ms"] / count, 2)
+            failed |= (
+                stats["max_tensor_diff_png"] > TENSOR_TOLERANCE
+                or stats["max_probability_diff_png"] > PROBABILITY_TOLERANCE
+                or stats["class_mismatches_png"] > 0
+            )
+            report[name] = stats
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare preview throughput of the thread and process rendering backends.
+
+Renders full-size previews of synthetic DICOM files served by a local file
+server, at increasing numbers of concurrent requests. The on-disk DICOM cache
+is warmed first and the preview cache is disabled, so the numbers reflect
+decoding, windowing and encoding only.
+
+    python -m benchmarks.render_backends --size 1024 --concurrency 1 4 16 64
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from src.dicom import service as service_module
+from src.dicom.cache import DicomFileCache
+from src.dicom.preview_cache import PreviewCache
+from src.dicom.render_pool import RenderPool
+from src.dicom.schema import RenderParams
+from src.dicom.service import DicomService
+from src.http_client import http_client_pool
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+async def run_level(
+    dicom_service: DicomService, file_urls: list[str], concurrency: int, requests: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def preview(index: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await dicom_service.render_preview(
+                file_urls[index % len(file_urls)], "png", None, RenderParams()
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(preview(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "previews_per_s": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="Image size in pixels")
+    parser.add_argument("--files", type=int, default=8, help="Distinct DICOM files")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="Render processes"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(args.files):
+            pixels = make_pixel_array(args.size, args.size, "uint16", index)
+            with open(os.path.join(directory, f"{index}.dcm"), "wb") as file:
+                file.write(make_dicom(pixels))
+
+        handler = functools.partial(QuietHandler, directory=directory)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        file_urls = [
+            f"http://127.0.0.1:{server.server_port}/{index}.dcm"
+            for index in range(args.files)
+        ]
+
+        service_module.preview_cache = PreviewCache(0)
+        service_module.dicom_file_cache = DicomFileCache(
+            os.path.join(directory, "cache"), 1024**3, 3600
+        )
+        pool = RenderPool(args.processes, queue_size=1024, timeout=300)
+        pool.startup()
+
+        loop = asyncio.new_event_loop()
+        dicom_service = DicomService()
+        report = {"processes": args.processes}
+        for backend, render_pool in (("thread", None), ("process", pool)):
+            service_module.render_pool = render_pool
+            # Warm up the DICOM cache and, for the pool, the render processes
+            loop.run_until_complete(
+                run_level(dicom_service, file_urls, args.processes, 2 * args.files)
+            )
+            report[backend] = {
+                str(concurrency): loop.run_until_complete(
+                    run_level(
+                        dicom_service,
+                        file_urls,
+                        concurrency,
+                        max(4 * concurrency, 2 * args.files),
+                    )
+                )
+                for concurrency in args.concurrency
+            }
+
+        pool.shutdown()
+        loop.run_until_complete(http_client_pool.shutdown())
+        loop.close()
+        server.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
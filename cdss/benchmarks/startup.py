@@ -0,0 +1,79 @@
+"""
+Measure startup time and resident memory of the API and worker processes.
+
+Each target is imported in a fresh interpreter so the numbers reflect a cold
+process start. Run from the `cdss` directory:
+
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks import DEFAULT_ENV
+
+TARGETS = {
+    "api": "import main",
+    "worker": "import src.inference.celery_jobs",
+}
+
+PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss_kb, "torch" in sys.modules)
+"""
+
+
+def measure(statement: str, runs: int) -> dict:
+    """
+    Import a target in fresh interpreters and collect timing and memory samples.
+
+    Args:
+        statement (str): Python statement that imports the target.
+        runs (int): Number of cold starts to sample.
+
+    Returns:
+        dict: Median/min import time in milliseconds, peak RSS in MiB and
+        whether torch ended up loaded.
+    """
+    env = {**DEFAULT_ENV, **os.environ}
+    times, rss = [], []
+    torch_loaded = False
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(statement=statement)],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        times.append(float(output[0]) * 1000)
+        rss.append(int(output[1]) / 1024)
+        torch_loaded = output[2] == "True"
+
+    return {
+        "import_ms_median": round(statistics.median(times), 1),
+        "import_ms_min": round(min(times), 1),
+        "peak_rss_mib": round(statistics.median(rss), 1),
+        "torch_loaded": torch_loaded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Cold starts per target")
+    args = parser.parse_args()
+
+    results = {name: measure(stmt, args.runs) for name, stmt in TARGETS.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Synthetic DICOM generation for benchmarks and parity checks.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image, features
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.encaps import encapsulate
+from pydicom.pixels import get_encoder
+from pydicom.uid import (
+    CTImageStorage,
+    ExplicitVRLittleEndian,
+    JPEG2000Lossless,
+    JPEGBaseline8Bit,
+    JPEGLSLossless,
+    RLELossless,
+    UID,
+    generate_uid,
+)
+
+# Transfer syntaxes of the synthetic files, by short name
+TRANSFER_SYNTAXES = {
+    "explicit": ExplicitVRLittleEndian,
+    "rle": RLELossless,
+    "jpeg": JPEGBaseline8Bit,
+    "jpegls": JPEGLSLossless,
+    "j2k": JPEG2000Lossless,
+}
+# Pillow encoders of the syntaxes pydicom cannot write without extra plugins,
+# and the pixel types they take
+PILLOW_ENCODERS = {
+    JPEGBaseline8Bit: ("jpg", {"format": "JPEG", "quality": 90}, ("uint8",)),
+    JPEG2000Lossless: (
+        "jpg_2000",
+        {"format": "JPEG2000", "irreversible": False, "no_jp2": True},
+        ("uint8", "uint16"),
+    ),
+}
+
+
+def can_encode(transfer_syntax: UID, dtype: str = "uint16") -> bool:
+    """
+    Check whether a transfer syntax can be written for a pixel type, with the
+    installed pydicom plugins or with Pillow.
+    """
+    if not transfer_syntax.is_compressed or pydicom_can_encode(transfer_syntax):
+        return True
+    if transfer_syntax in PILLOW_ENCODERS:
+        feature, _, dtypes = PILLOW_ENCODERS[transfer_syntax]
+        return dtype in dtypes and features.check(feature)
+    return False
+
+
+def pydicom_can_encode(transfer_syntax: UID) -> bool:
+    try:
+        return get_encoder(transfer_syntax).is_available
+    except NotImplementedError:
+        return False
+
+
+def pillow_encode(pixel_array: np.ndarray, transfer_syntax: UID) -> bytes:
+    """
+    Encode a single frame with Pillow, see `PILLOW_ENCODERS`.
+    """
+    _, options, _ = PILLOW_ENCODERS[transfer_syntax]
+    buffer = io.BytesIO()
+    Image.fromarray(pixel_array).save(buffer, **options)
+    return buffer.getvalue()
+
+
+def make_pixel_array(
+    rows: int = 512, columns: int = 512, dtype: str = "uint16", seed: int = 0
+) -> np.ndarray:
+    """
+    Build a smooth, CT-like test image with some noise.
+
+    Args:
+        rows (int): Image height.
+        columns (int): Image width.
+        dtype (str): 'uint8' or 'uint16'.
+        seed (int): Random seed for the noise.
+
+    Returns:
+        np.ndarray: Pixel array of shape (rows, columns).
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:rows, 0:columns]
+    cy, cx = rows / 2, columns / 2
+    radius = np.hypot((y - cy) / rows, (x - cx) / columns)
+    body = np.clip(1.0 - radius * 2.2, 0, 1)
+    image = body * 0.7 + 0.2 * np.sin(x / 17.0) * np.cos(y / 23.0) * body
+    image += rng.normal(0, 0.03, size=image.shape)
+    image = np.clip(image, 0, 1)
+
+    max_value = 255 if dtype == "uint8" else 4095
+    return (image * max_value).astype(dtype)
+
+
+def make_dicom(
+    pixel_array: np.ndarray, transfer_syntax: UID = ExplicitVRLittleEndian
+) -> bytes:
+    """
+    Wrap a pixel array into a DICOM file.
+
+    Args:
+        pixel_array (np.ndarray): uint8 or uint16 pixel array of shape
+            (rows, columns), or (frames, rows, columns) for a multi-frame file.
+        transfer_syntax (UID): Transfer syntax, compressed ones need an encoder,
+            see `can_encode`.
+
+    Returns:
+        bytes: Encoded DICOM file.
+    """
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = CTImageStorage
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = CTImageStorage
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = "CT"
+    if pixel_array.ndim == 3:
+        ds.NumberOfFrames = pixel_array.shape[0]
+    ds.Rows, ds.Columns = pixel_array.shape[-2:]
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = pixel_array.dtype.itemsize * 8
+    ds.BitsStored = 8 if pixel_array.dtype == np.uint8 else 12
+    ds.HighBit = ds.BitsStored - 1
+    ds.PixelRepresentation = 0
+    ds.PixelData = pixel_array.tobytes()
+    if transfer_syntax.is_compressed and pydicom_can_encode(transfer_syntax):
+        ds.compress(transfer_syntax, pixel_array)
+    elif transfer_syntax.is_compressed:
+        frames = pixel_array if pixel_array.ndim == 3 else [pixel_array]
+        ds.PixelData = encapsulate(
+            [pillow_encode(frame, transfer_syntax) for frame in frames]
+        )
+        ds["PixelData"].VR = "OB"
+        ds.file_meta.TransferSyntaxUID = transfer_syntax
+
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
@@ -0,0 +1,98 @@
+"""
+Compare the lookup-table windowing engine with the legacy float rendering.
+
+The legacy path min-max normalizes with `cv2.normalize` and stretches the
+1st to 99th percentile in float32. Auto mode of `render_window` must match it
+exactly, since the inference models were trained on that output. Presets and
+DICOM windows are timed alongside for reference.
+
+    python -m benchmarks.windowing --size 512
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from benchmarks.synthetic import make_pixel_array
+from src.dicom.windowing import ModalityInfo, render_window
+
+
+def legacy_render(pixel_array: np.ndarray) -> np.ndarray:
+    """
+    Render a pixel array the way `DicomService` did before the windowing engine.
+    """
+    if pixel_array.dtype != np.uint8:
+        pixel_array = cv2.normalize(pixel_array, None, 0, 255, cv2.NORM_MINMAX)
+        pixel_array = np.uint8(pixel_array)
+
+    hist, _ = np.histogram(pixel_array.ravel(), bins=np.arange(257))
+    cdf = np.cumsum(hist)
+    cdf_normalized = cdf / cdf[-1]
+
+    p_low = np.argmax(cdf_normalized >= 0.01)
+    p_high = np.argmax(cdf_normalized >= 0.99)
+
+    if p_high > p_low:
+        scale = 255.0 / (p_high - p_low)
+        offset = -scale * p_low
+        pixel_array = (pixel_array.astype(np.float32) * scale + offset).clip(0, 255)
+    return pixel_array.astype(np.uint8)
+
+
+def timed(fn, *args, repeat: int = 20) -> float:
+    fn(*args)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return round((time.perf_counter() - start) / repeat * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="Image size in pixels")
+    parser.add_argument("--samples", type=int, default=5, help="Images per dtype")
+    args = parser.parse_args()
+
+    # CT-like modality LUT, so that presets land on meaningful values
+    modality = ModalityInfo(
+        slope=1.0, intercept=-1024.0, window_center=40.0, window_width=400.0
+    )
+    report, failed = {}, False
+    for dtype in ("uint8", "uint16", "int16"):
+        stats = {
+            "auto_mismatched_pixels": 0,
+            "legacy_ms": 0.0,
+            "auto_ms": 0.0,
+            "lung_ms": 0.0,
+            "dicom_ms": 0.0,
+        }
+        for seed in range(args.samples):
+            pixels = make_pixel_array(
+                args.size, args.size, "uint8" if dtype == "uint8" else "uint16", seed
+            )
+            if dtype == "int16":
+                pixels = (pixels.astype(np.int32) - 1024).astype(np.int16)
+
+            stats["auto_mismatched_pixels"] += int(
+                np.count_nonzero(legacy_render(pixels) != render_window(pixels))
+            )
+            stats["legacy_ms"] += timed(legacy_render, pixels)
+            stats["auto_ms"] += timed(render_window, pixels, modality)
+            stats["lung_ms"] += timed(render_window, pixels, modality, "lung")
+            stats["dicom_ms"] += timed(render_window, pixels, modality, "dicom")
+
+        for key in ("legacy_ms", "auto_ms", "lung_ms", "dicom_ms"):
+            stats[key] = round(stats[key] / args.samples, 3)
+        failed |= stats["auto_mismatched_pixels"] > 0
+        report[dtype] = stats
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Check and time the result writer against a local stand-in backend.
+
+The stand-in answers the individual result and failure PATCHes, and the bulk
+endpoint in the bulk scenario only. Each scenario submits `--results`
+write-backs from several threads and waits for the outbox to drain:
+
+- fallback: the backend has no bulk endpoint, results are sent one by one
+- bulk: results are sent in batches to the bulk endpoint
+- flaky: `--error-rate` of the requests fail with 503 and are retried
+- outage_restart: the backend is down for `--outage-seconds`, the writer is
+  stopped meanwhile, and a new writer replays the outbox
+
+Every submitted write-back must reach the backend, with its latest payload;
+the script exits with status 1 otherwise.
+
+    python -m benchmarks.writeback --results 500
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.inference.writeback import FAILED_PAYLOAD, ResultOutbox, ResultWriter
+
+BULK_PATH = "/cdss/bulk"
+
+
+class StandInBackend(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    bulk = False
+    error_rate = 0.0
+    down_until = 0.0
+    delivered = {}
+    requests = Counter()
+
+    def do_PATCH(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == BULK_PATH:
+            kind = "bulk"
+        elif self.path.endswith("/fail"):
+            kind = "failure"
+        else:
+            kind = "result"
+        with self.lock:
+            self.requests[kind] += 1
+
+        if time.time() < self.down_until or random.random() < self.error_rate:
+            return self.reply(503)
+        if kind == "bulk" and not self.bulk:
+            return self.reply(404)
+
+        prediction_id = self.path.split("/")[2]
+        with self.lock:
+            if kind == "bulk":
+                for item in json.loads(body)["predictions"]:
+                    self.delivered[item.pop("predictionId")] = item
+            elif kind == "failure":
+                self.delivered[prediction_id] = FAILED_PAYLOAD
+            else:
+                self.delivered[prediction_id] = json.loads(body)
+        self.reply(200)
+
+    def reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def make_writer(outbox: ResultOutbox, base_url: str, args) -> ResultWriter:
+    return ResultWriter(
+        outbox,
+        base_url,
+        "stand-in",
+        bulk_path=BULK_PATH,
+        batch_size=args.batch_size,
+        flush_ms=args.flush_ms,
+        timeout=5.0,
+        backoff_base_seconds=0.05,
+        backoff_max_seconds=1.0,
+    )
+
+
+def run_scenario(
+    name: str,
+    base_url: str,
+    directory: str,
+    args,
+    bulk: bool = False,
+    error_rate: float = 0.0,
+    outage_seconds: float = 0.0,
+    restart: bool = False,
+) -> dict:
+    StandInBackend.bulk = bulk
+    StandInBackend.error_rate = error_rate
+    StandInBackend.down_until = time.time() + outage_seconds
+    StandInBackend.delivered = {}
+    StandInBackend.requests = Counter()
+
+    expected = {}
+    for index in range(args.results):
+        expected[f"{name}-{index}"] = (
+            FAILED_PAYLOAD
+            if index % 10 == 9
+            else {"result": "normal", "probability": index / args.results}
+        )
+
+    outbox = ResultOutbox(os.path.join(directory, f"{name}.db"))
+    writer = make_writer(outbox, base_url, args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda item: writer.submit(*item), expected.items()))
+    if restart:
+        writer.stop()
+        writer = make_writer(outbox, base_url, args)
+        writer.start()
+
+    deadline = time.monotonic() + args.timeout
+    while outbox.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    seconds = time.perf_counter() - start
+    writer.stop()
+
+    missing = [
+        prediction_id
+        for prediction_id, payload in expected.items()
+        if StandInBackend.delivered.get(prediction_id) != payload
+    ]
+    return {
+        "seconds": round(seconds, 2),
+        "requests": dict(StandInBackend.requests),
+        "results_per_request": round(
+            len(expected) / max(1, sum(StandInBackend.requests.values())), 2
+        ),
+        "left_in_outbox": outbox.pending(),
+        "missing": len(missing),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--results", type=int, default=500, help="Per scenario")
+    parser.add_argument("--threads", type=int, default=8, help="Submitting threads")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--flush-ms", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.3)
+    parser.add_argument("--outage-seconds", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Drain timeout")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInBackend)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        scenarios = {
+            "fallback": {},
+            "bulk": {"bulk": True},
+            "flaky": {"error_rate": args.error_rate},
+            "outage_restart": {"outage_seconds": args.outage_seconds, "restart": True},
+        }
+        report = {
+            name: run_scenario(name, base_url, directory, args, **options)
+            for name, options in scenarios.items()
+        }
+    server.shutdown()
+
+    print(json.dumps(report, indent=2))
+    if any(result["missing"] for result in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
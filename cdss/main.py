@@ -1,12 +1,38 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from src.config import Config
+from src.http_client import http_client_pool
+from src.dicom.render_pool import render_pool
 from src.dicom.routes import dicom_router
 from src.inference.routes import inference_router
+from src.inference.sync import sync_inference
+from src.metrics import metrics_registry, trace
 
 version = "v1"
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await http_client_pool.startup()
+    if render_pool is not None:
+        render_pool.startup()
+    if sync_inference is not None:
+        await run_in_threadpool(sync_inference.startup)
+    yield
+    if sync_inference is not None:
+        await run_in_threadpool(sync_inference.shutdown)
+    if render_pool is not None:
+        render_pool.shutdown()
+    await http_client_pool.shutdown()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Vita CDSS",
     description="Vita CDSS API",
     version=version,
@@ -29,5 +55,21 @@ app.include_router(
     inference_router, prefix=f"/api/{version}/inference", tags=["Inference"]
 )
 
+if Config.METRICS_ENABLED:
+    registry = metrics_registry()
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+if Config.TRACE_ENABLED:
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        with trace(f"{request.method} {request.url.path}"):
+            return await call_next(request)
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
@@ -13,6 +13,6 @@ class ApiKeyHeader(APIKeyHeader):
 
     async def __call__(self, request: Request) -> str:
         api_key = await super().__call__(request)
-        if api_key == Config.API_KEY:
+        if api_key == Config.API_KEY or api_key in Config.API_KEYS:
             return api_key
         raise HTTPException(status_code=403, detail="Invalid API Key")
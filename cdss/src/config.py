@@ -1,13 +1,143 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     BACKEND_URL: str
     API_KEY: str
+    # Keys of other clients, each rate limited on its own
+    API_KEYS: list[str] = []
     CLINIC_API_KEY: str
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
 
+    BRAIN_TUMORS_MAX_BATCH_SIZE: int = 8
+    BRAIN_TUMORS_MAX_WAIT_MS: float = 5.0
+    CHEST_CT_MAX_BATCH_SIZE: int = 8
+    CHEST_CT_MAX_WAIT_MS: float = 5.0
+    SERIES_FETCH_CONCURRENCY: int = 8
+
+    MODEL_REGISTRY_FILE: Optional[str] = None
+    MODEL_PRELOAD: Literal["parent", "process", "lazy"] = "parent"
+    MODEL_WARMUP: bool = True
+    # Unset: the cores are split evenly between the concurrent tasks of a worker
+    INFERENCE_NUM_THREADS: Optional[int] = None
+    INFERENCE_INTEROP_THREADS: Optional[int] = None
+
+    # Queue of a model, unless its registry entry sets one
+    CELERY_MODEL_QUEUE_PREFIX: str = "inference."
+    CELERY_PREFETCH_MULTIPLIER: int = 1
+    CELERY_ACKS_LATE: bool = True
+    CELERY_REJECT_ON_WORKER_LOST: bool = False
+
+    # A prediction ID is enqueued once while its task has not failed. Submissions
+    # are limited per API key and minute, and rejected with a 429 while the queue
+    # of the model holds SUBMISSION_MAX_QUEUE_DEPTH tasks; 0 disables a limit.
+    # `auto` shares the submissions through the result backend if it is Redis
+    SUBMISSION_STORE: Literal["auto", "redis", "local"] = "auto"
+    SUBMISSION_REDIS_URL: Optional[str] = None
+    SUBMISSION_DEDUP_TTL_SECONDS: int = 24 * 3600
+    SUBMISSION_RATE_LIMIT_PER_MINUTE: int = 0
+    SUBMISSION_MAX_QUEUE_DEPTH: int = 0
+    SUBMISSION_QUEUE_CHECK_SECONDS: float = 1.0
+    SUBMISSION_RETRY_AFTER_SECONDS: int = 5
+
+    # Running tasks store their stage in the result backend
+    TASK_PROGRESS_ENABLED: bool = True
+    TASK_EVENTS_MAX_TASKS: int = 500
+    TASK_EVENTS_TIMEOUT: float = 600.0
+    TASK_EVENTS_HEARTBEAT_SECONDS: float = 15.0
+    # Used when the result backend is not Redis, which has no pub/sub
+    TASK_EVENTS_POLL_SECONDS: float = 1.0
+
+    # `pipelined` runs PIPELINE_WINDOW tasks per worker process on the threads
+    # pool and overlaps their downloads, decoding, inference and write-backs
+    WORKER_MODE: Literal["sequential", "pipelined"] = "sequential"
+    PIPELINE_WINDOW: int = 32
+    PIPELINE_DOWNLOAD_CONCURRENCY: int = 8
+    PIPELINE_DECODE_WORKERS: int = 2
+
+    # Models served in-process by `POST .../predict`, none by default. A request
+    # whose estimated wait for its batch exceeds the budget is enqueued instead
+    SYNC_INFERENCE_MODELS: list[str] = []
+    SYNC_INFERENCE_BUDGET_MS: float = 500.0
+
+    # Results wait in this SQLite outbox until the backend accepts them
+    WRITEBACK_OUTBOX_PATH: str = "/tmp/vita_cdss/writeback-outbox.db"
+    # Path of a bulk update endpoint, e.g. "/cdss/bulk"; unset sends one PATCH
+    # per result
+    WRITEBACK_BULK_PATH: Optional[str] = None
+    WRITEBACK_BATCH_SIZE: int = 32
+    WRITEBACK_FLUSH_MS: float = 100.0
+    WRITEBACK_TIMEOUT: float = 10.0
+    WRITEBACK_MAX_ATTEMPTS: int = 20
+    WRITEBACK_BACKOFF_BASE_SECONDS: float = 1.0
+    WRITEBACK_BACKOFF_MAX_SECONDS: float = 300.0
+
+    PREDICTION_CACHE: Literal["auto", "redis", "local", "off"] = "auto"
+    PREDICTION_CACHE_REDIS_URL: Optional[str] = None
+    PREDICTION_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    PREDICTION_CACHE_MAX_BYTES: int = 16 * 1024**2
+    PREDICTION_CACHE_DIR: Optional[str] = None
+    PREDICTION_CACHE_DISK_MAX_BYTES: int = 256 * 1024**2
+
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_TIMEOUT: float = 300.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP2: bool = False
+
+    DICOM_MAX_BYTES: int = 512 * 1024**2
+    DICOM_SPOOL_MEMORY_BYTES: int = 8 * 1024**2
+    DICOM_MAX_CONCURRENT_DECODES: int = 4
+    # pydicom decoding plugin by transfer syntax UID or keyword, e.g.
+    # {"JPEG2000Lossless": "gdcm"}; other compressed syntaxes use the first
+    # installed plugin of DICOM_DECODER_PREFERENCE
+    DICOM_DECODERS: dict[str, str] = {}
+    DICOM_DECODER_PREFERENCE: list[str] = [
+        "pylibjpeg",
+        "gdcm",
+        "pyjpegls",
+        "pillow",
+        "pydicom",
+    ]
+    # Decode JPEG 2000 frames of resized previews at a reduced resolution
+    DICOM_J2K_REDUCED_DECODE: bool = True
+
+    DICOM_CACHE_ENABLED: bool = True
+    DICOM_CACHE_DIR: str = "/tmp/vita_cdss/dicom"
+    DICOM_CACHE_MAX_BYTES: int = 2 * 1024**3
+    DICOM_CACHE_TTL_SECONDS: float = 3600.0
+    DICOM_CACHE_VERIFY: bool = True
+
+    PREVIEW_CACHE_MAX_BYTES: int = 256 * 1024**2
+    PREVIEW_CACHE_DIR: Optional[str] = None
+    PREVIEW_CACHE_DISK_MAX_BYTES: int = 1024**3
+    PREVIEW_CACHE_CONTROL: str = "private, max-age=3600"
+    PREVIEW_PYRAMID_SIZES: list[int] = []
+
+    # Batch previews: instances per request, and fetched and rendered at a time
+    PREVIEW_BATCH_MAX_INSTANCES: int = 1000
+    PREVIEW_BATCH_CONCURRENCY: int = 8
+    # Contact sheet tiles are shrunk to fit; WebP images are at most 16383 px
+    PREVIEW_SHEET_MAX_SIDE: int = 16383
+    PREVIEW_SHEET_MAX_PIXELS: int = 16 * 1024**2
+
+    PREVIEW_RENDER_BACKEND: Literal["thread", "process"] = "thread"
+    PREVIEW_RENDER_PROCESSES: Optional[int] = None
+    PREVIEW_RENDER_QUEUE_SIZE: int = 64
+    PREVIEW_RENDER_TIMEOUT: float = 30.0
+
+    METRICS_ENABLED: bool = True
+    # Needed when metrics are recorded in child processes: the Celery prefork
+    # pool, or the process render backend. One directory per service.
+    PROMETHEUS_MULTIPROC_DIR: Optional[str] = None
+    WORKER_METRICS_PORT: Optional[int] = 9808
+    TRACE_ENABLED: bool = False
+    TRACE_SLOW_MS: float = 1000.0
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from filelock import AsyncFileLock, FileLock, Timeout
+
+from src.config import Config
+from src.dicom.download import CHUNK_SIZE, FetchedDicom, download_to_file
+from src.metrics import CacheStats
+
+
+class DicomFileCache:
+    """
+    Content-addressed on-disk cache for downloaded DICOM files.
+
+    Entries are keyed by the SHA-256 of their URL. Each entry holds the file and
+    a JSON metadata sidecar with its content hash, size and HTTP validators.
+    Fresh entries (younger than the TTL) are served straight from disk; stale
+    ones are revalidated with `If-None-Match` / `If-Modified-Since`. The total
+    size is bounded with least-recently-used eviction, using the file's mtime as
+    the last-access time.
+
+    All writes go through a temporary file and `os.replace`, and downloads,
+    revalidations and evictions are serialized with file locks, so the directory
+    can be shared by the API process and several Celery worker processes on the
+    same node. Entries are locked through a fixed set of lock files striped by
+    the first byte of their key, so lock files do not pile up with the entries.
+    Reading, verifying and writing entries and evicting run in the thread pool,
+    so large files do not block the event loop.
+
+    Attributes:
+        directory (str): Directory holding the cached files.
+        max_bytes (int): Upper bound for the total size of cached files.
+        ttl_seconds (float): Age after which an entry is revalidated.
+        stats (CacheStats): Hit, miss, revalidation, refresh and eviction counts of
+            this process.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        ttl_seconds: float,
+        verify: bool = True,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str): Directory holding the cached files.
+            max_bytes (int): Upper bound for the total size of cached files.
+            ttl_seconds (float): Age after which an entry is revalidated.
+            verify (bool): Check the content hash of an entry whenever it is read.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.verify = verify
+        self.stats = CacheStats("dicom_file")
+        os.makedirs(os.path.join(directory, "locks"), exist_ok=True)
+
+    async def fetch(self, file_url: str, client: httpx.AsyncClient) -> FetchedDicom:
+        """
+        Return a DICOM file from the cache, downloading it only when needed.
+
+        Args:
+            file_url (str): URL of the DICOM file.
+            client (httpx.AsyncClient): Client used for downloads and revalidation.
+
+        Returns:
+            FetchedDicom: The cached file, opened for reading, and its hash.
+        """
+        key = hashlib.sha256(file_url.encode()).hexdigest()
+        cached = await run_in_threadpool(self._read_fresh, key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+
+        async with AsyncFileLock(self._lock_path(key)):
+            # Another process may have fetched the file while we were waiting
+            cached = await run_in_threadpool(self._read_fresh, key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+
+            meta, cached = await run_in_threadpool(self._read_stale, key)
+            headers = {}
+            if cached is not None:
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+
+            async with client.stream("GET", file_url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    meta["fetched_at"] = time.time()
+                    await run_in_threadpool(self._write_meta, key, meta)
+                    self.stats["revalidations"] += 1
+                    return cached
+
+                if cached is not None:
+                    await run_in_threadpool(cached.close)
+                return await self._store(key, response, refreshed=meta is not None)
+
+    async def _store(
+        self, key: str, response: httpx.Response, refreshed: bool
+    ) -> FetchedDicom:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        tmp_file = os.fdopen(fd, "w+b")
+        try:
+            sha256, size = await download_to_file(
+                response, tmp_file, Config.DICOM_MAX_BYTES
+            )
+            os.replace(tmp_path, self._path(key, ".dcm"))
+        except BaseException:
+            tmp_file.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        meta = {
+            "url": str(response.url),
+            "sha256": sha256,
+            "size": size,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        await run_in_threadpool(self._commit, key, meta)
+        self.stats["refreshes" if refreshed else "misses"] += 1
+        # The open handle stays valid even if the entry is evicted meanwhile
+        return FetchedDicom(tmp_file, sha256, size)
+
+    def _commit(self, key: str, meta: dict):
+        self._write_meta(key, meta)
+        self._evict(keep=key)
+
+    def _read_stale(self, key: str) -> tuple[dict | None, FetchedDicom | None]:
+        # The metadata and file of an entry to revalidate, if both are there
+        meta = self._read_meta(key)
+        return meta, self._read_entry(key, meta) if meta is not None else None
+
+    def _read_fresh(self, key: str) -> FetchedDicom | None:
+        meta = self._read_meta(key)
+        if meta is None or time.time() - meta["fetched_at"] > self.ttl_seconds:
+            return None
+        return self._read_entry(key, meta)
+
+    def _read_entry(self, key: str, meta: dict) -> FetchedDicom | None:
+        path = self._path(key, ".dcm")
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+        valid = os.fstat(file.fileno()).st_size == meta["size"]
+        if valid and self.verify:
+            sha256 = hashlib.sha256()
+            while chunk := file.read(CHUNK_SIZE):
+                sha256.update(chunk)
+            valid = sha256.hexdigest() == meta["sha256"]
+            file.seek(0)
+        if not valid:
+            file.close()
+            self.stats["corrupt"] += 1
+            return None
+
+        # The mtime doubles as the last-access time for LRU eviction
+        os.utime(path)
+        return FetchedDicom(file, meta["sha256"], meta["size"])
+
+    def _read_meta(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key, ".json")) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, key: str, meta: dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(meta, tmp_file)
+        os.replace(tmp_path, self._path(key, ".json"))
+
+    def _evict(self, keep: str):
+        # The caller holds the lock of `keep`, and so of every key in its stripe
+        with FileLock(os.path.join(self.directory, "evict.lock")):
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".dcm"):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+                    total += stat.st_size
+
+            for _, size, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                if self._lock_path(key) == self._lock_path(keep):
+                    self._remove(key)
+                else:
+                    try:
+                        with FileLock(self._lock_path(key), timeout=0):
+                            self._remove(key)
+                    except Timeout:
+                        # Being fetched or revalidated, so not the least recently used
+                        continue
+                total -= size
+                self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        for suffix in (".dcm", ".json"):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.directory, "locks", key[:2] + ".lock")
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+
+dicom_file_cache = (
+    DicomFileCache(
+        Config.DICOM_CACHE_DIR,
+        Config.DICOM_CACHE_MAX_BYTES,
+        Config.DICOM_CACHE_TTL_SECONDS,
+        Config.DICOM_CACHE_VERIFY,
+    )
+    if Config.DICOM_CACHE_ENABLED
+    else None
+)
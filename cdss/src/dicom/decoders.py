@@ -0,0 +1,221 @@
+import functools
+import io
+import math
+import struct
+from typing import BinaryIO
+
+import numpy as np
+import pydicom
+from PIL import Image, features
+from pydicom.dataset import Dataset
+from pydicom.encaps import get_frame
+from pydicom.pixels import get_decoder
+from pydicom.pixels.utils import get_j2k_parameters
+from pydicom.uid import UID, JPEG2000, JPEG2000Lossless
+
+from src.config import Config
+from src.dicom.windowing import MODALITY_TAGS
+
+# Header attributes needed to pick a decoder, plan a reduced decode and render
+# the decoded frame
+HEADER_TAGS = [
+    "Rows",
+    "Columns",
+    "NumberOfFrames",
+    "SamplesPerPixel",
+    "BitsStored",
+    "PixelRepresentation",
+    "PhotometricInterpretation",
+    "RescaleSlope",
+    "RescaleIntercept",
+    "WindowCenter",
+    "WindowWidth",
+    *MODALITY_TAGS,
+]
+# Transfer syntaxes Pillow can decode at a reduced resolution
+REDUCIBLE_SYNTAXES = {JPEG2000, JPEG2000Lossless}
+# Markers of the coding style segment and of the first tile of a JPEG 2000
+# codestream, which ends its main header
+J2K_COD_MARKER = b"\xff\x52"
+J2K_SOT_MARKER = b"\xff\x90"
+# Header of an encapsulated pixel data element in explicit VR little endian:
+# tag, VR, reserved bytes and the undefined length
+PIXEL_DATA_HEADER = struct.Struct("<HH2sHI")
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+
+def read_decode_header(dicom_data: BinaryIO) -> Dataset:
+    """
+    Read the transfer syntax, image size and modality attributes of a DICOM file,
+    without its pixel data.
+    :param dicom_data: File-like object containing the DICOM file, rewound afterwards.
+    :return: Dataset holding the file meta and the `HEADER_TAGS` attributes.
+    """
+    header = pydicom.dcmread(
+        dicom_data, stop_before_pixels=True, specific_tags=HEADER_TAGS
+    )
+    dicom_data.seek(0)
+    return header
+
+
+def transfer_syntax_of(header: Dataset) -> str | None:
+    """
+    Transfer syntax UID of a header from `read_decode_header`, if it has file meta.
+    """
+    file_meta = getattr(header, "file_meta", None)
+    return file_meta.get("TransferSyntaxUID") if file_meta is not None else None
+
+
+@functools.lru_cache(maxsize=None)
+def decoding_plugin(transfer_syntax: str | None) -> str:
+    """
+    Pick the pydicom decoding plugin of a transfer syntax.
+    A plugin configured in DICOM_DECODERS, by UID or keyword, wins if it is installed;
+    otherwise the first installed plugin of DICOM_DECODER_PREFERENCE is used.
+    :param transfer_syntax: Transfer syntax UID of the file.
+    :return: Plugin name, or an empty string to let pydicom choose, e.g. for native
+        transfer syntaxes or when none of the plugins is installed.
+    """
+    if transfer_syntax is None:
+        return ""
+    uid = UID(transfer_syntax)
+    if not uid.is_compressed:
+        return ""
+    try:
+        available = get_decoder(uid).available_plugins
+    except NotImplementedError:
+        return ""
+
+    configured = Config.DICOM_DECODERS.get(uid) or Config.DICOM_DECODERS.get(
+        uid.keyword
+    )
+    if configured is not None:
+        if configured in available:
+            return configured
+        print(
+            f"Decoder '{configured}' is not installed for {uid.name}, "
+            f"installed: {list(available)}"
+        )
+    for plugin in Config.DICOM_DECODER_PREFERENCE:
+        if plugin in available:
+            return plugin
+    return ""
+
+
+def j2k_reduction(header: Dataset, size: tuple[int, int] | None) -> int:
+    """
+    Number of resolution levels a JPEG 2000 frame can be reduced by while still
+    covering an output size. Each level halves the width and height.
+    :param header: Header from `read_decode_header`.
+    :param size: Output (width, height) the frame is resized to, None for the full size.
+    :return: Levels to reduce by, 0 when the frame must be decoded in full.
+    """
+    if (
+        size is None
+        or not Config.DICOM_J2K_REDUCED_DECODE
+        or transfer_syntax_of(header) not in REDUCIBLE_SYNTAXES
+        or not features.check("jpg_2000")
+    ):
+        return 0
+    width, height = size
+    reduction = 0
+    while (
+        math.ceil(header.Columns / 2 ** (reduction + 1)) >= width
+        and math.ceil(header.Rows / 2 ** (reduction + 1)) >= height
+    ):
+        reduction += 1
+    return reduction
+
+
+def j2k_decomposition_levels(codestream: bytes) -> int:
+    """
+    Read the number of wavelet decomposition levels of a JPEG 2000 codestream, the
+    most resolution levels it can be reduced by.
+    :param codestream: JPEG 2000 codestream of a frame.
+    :return: Decomposition levels from the COD segment, 0 if it is missing.
+    """
+    # Walk the segments of the main header, after the start of codestream marker
+    offset = 2
+    while offset + 4 <= len(codestream):
+        marker = codestream[offset : offset + 2]
+        if marker == J2K_SOT_MARKER:
+            break
+        if marker == J2K_COD_MARKER and offset + 9 < len(codestream):
+            # Segment length, coding style, progression order, layers and
+            # multiple component transform come before the levels
+            return codestream[offset + 9]
+        offset += 2 + int.from_bytes(codestream[offset + 2 : offset + 4], "big")
+    return 0
+
+
+def read_encapsulated_frame(dicom_data: BinaryIO, header: Dataset, frame: int) -> bytes:
+    """
+    Read the fragments of one frame of encapsulated pixel data, seeking over those
+    of the other frames instead of reading the whole pixel data.
+    :param dicom_data: File-like object containing the DICOM file, rewound afterwards.
+    :param header: Header from `read_decode_header`.
+    :param frame: Index of the frame to read.
+    :return: The encoded frame, e.g. a JPEG 2000 codestream.
+    """
+    try:
+        dataset = pydicom.dcmread(
+            dicom_data,
+            stop_before_pixels=True,
+            specific_tags=["ExtendedOffsetTable", "ExtendedOffsetTableLengths"],
+        )
+        # Reading stops at the start of the pixel data element
+        group, element, _, _, length = PIXEL_DATA_HEADER.unpack(
+            dicom_data.read(PIXEL_DATA_HEADER.size)
+        )
+        if (group, element) != (0x7FE0, 0x0010) or length != UNDEFINED_LENGTH:
+            raise ValueError("Pixel data is not encapsulated")
+        extended_offsets = None
+        if "ExtendedOffsetTable" in dataset and "ExtendedOffsetTableLengths" in dataset:
+            extended_offsets = (
+                dataset.ExtendedOffsetTable,
+                dataset.ExtendedOffsetTableLengths,
+            )
+        return get_frame(
+            dicom_data,
+            frame,
+            extended_offsets=extended_offsets,
+            number_of_frames=int(header.get("NumberOfFrames") or 1),
+        )
+    finally:
+        dicom_data.seek(0)
+
+
+def decode_j2k_reduced(
+    dicom_data: BinaryIO, header: Dataset, frame: int, reduction: int
+) -> np.ndarray:
+    """
+    Decode a JPEG 2000 frame at a reduced resolution with Pillow, skipping the
+    wavelet levels of the finer resolutions instead of decoding and resizing them.
+    :param dicom_data: File-like object containing the DICOM file, rewound afterwards.
+    :param header: Header from `read_decode_header`.
+    :param frame: Index of the frame to decode.
+    :param reduction: Resolution levels to reduce by, from `j2k_reduction`, capped to
+        the decomposition levels of the codestream.
+    :return: Pixel array of the frame in its stored data type, up to
+        `2 ** reduction` times smaller in each dimension.
+    """
+    codestream = read_encapsulated_frame(dicom_data, header, frame)
+    j2k_params = get_j2k_parameters(codestream)
+    precision = j2k_params.get("precision", header.get("BitsStored", 8))
+    if header.get("SamplesPerPixel", 1) > 1 and precision > 8:
+        raise ValueError(f"Pillow cannot decode {precision}-bit color data")
+
+    image = Image.open(io.BytesIO(codestream), formats=("JPEG2000",))
+    image.reduce = min(reduction, j2k_decomposition_levels(codestream))
+    image.load()
+    pixel_array = np.array(image)
+
+    # Pillow scales N-bit data up to 8 or 16 bits, and shifts signed data to
+    # unsigned, see pydicom's own Pillow decoder
+    bits = pixel_array.dtype.itemsize * 8
+    if header.get("PixelRepresentation", 0) == 1 and j2k_params.get("is_signed", True):
+        pixel_array = pixel_array.view(f"i{pixel_array.dtype.itemsize}")
+        pixel_array -= np.int32(2 ** (bits - 1))
+    if bit_shift := bits - precision:
+        np.right_shift(pixel_array, bit_shift, out=pixel_array)
+    return pixel_array
@@ -0,0 +1,76 @@
+import hashlib
+from typing import BinaryIO
+
+import httpx
+from fastapi import HTTPException
+
+from src.metrics import DOWNLOAD_BYTES
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class FetchedDicom:
+    """
+    A downloaded DICOM file with the SHA-256 of its content.
+
+    The file is positioned at its start and is either a file in the on-disk
+    cache or a spooled temporary file, so its content is never held in memory
+    more than once. Use it as a context manager to close the file.
+
+    Attributes:
+        file (BinaryIO): Readable file object holding the DICOM file.
+        sha256 (str): Hex digest of the file content.
+        size (int): Size of the file in bytes.
+    """
+
+    def __init__(self, file: BinaryIO, sha256: str, size: int):
+        self.file = file
+        self.sha256 = sha256
+        self.size = size
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def download_to_file(
+    response: httpx.Response, file: BinaryIO, max_bytes: int
+) -> tuple[str, int]:
+    """
+    Stream a response body into a file, rejecting oversized files early.
+
+    Args:
+        response (httpx.Response): Response opened with `client.stream`.
+        file (BinaryIO): Writable file object receiving the body.
+        max_bytes (int): Largest accepted body size.
+
+    Returns:
+        tuple[str, int]: SHA-256 hex digest and size of the body.
+    """
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=404, detail="DICOM file not found at the provided URL"
+        )
+
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None and int(content_length) > max_bytes:
+        raise HTTPException(status_code=413, detail="DICOM file is too large")
+
+    sha256 = hashlib.sha256()
+    size = 0
+    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail="DICOM file is too large")
+        file.write(chunk)
+        sha256.update(chunk)
+
+    file.flush()
+    file.seek(0)
+    DOWNLOAD_BYTES.observe(size)
+    return sha256.hexdigest(), size
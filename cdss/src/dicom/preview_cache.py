@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+from filelock import FileLock
+
+from src.config import Config
+from src.metrics import CacheStats
+
+# Fraction of the disk bound an eviction brings the disk tier down to
+DISK_LOW_WATERMARK = 0.9
+
+
+class PreviewCache:
+    """
+    Two-tier cache for rendered DICOM previews.
+
+    Entries are keyed by the content hash of the source DICOM file, the output
+    format and the render parameters, so a key also serves as a strong ETag.
+    The first tier is an in-memory LRU bounded in bytes; the optional second tier
+    is a directory bounded in bytes with mtime-based LRU eviction, which can be
+    shared between processes. The size of the directory is tracked as entries
+    are written and measured again whenever it crosses the bound, which is
+    the only time the directory is scanned. Eviction then brings it down to
+    DISK_LOW_WATERMARK of the bound, so that the next scan is many writes away.
+
+    Attributes:
+        max_memory_bytes (int): Upper bound for the in-memory tier.
+        directory (str | None): Directory of the disk tier, None to disable it.
+        max_disk_bytes (int): Upper bound for the disk tier.
+        stats (CacheStats): Memory/disk hit, miss and eviction counts of this process.
+    """
+
+    def __init__(
+        self,
+        max_memory_bytes: int,
+        directory: str | None = None,
+        max_disk_bytes: int = 0,
+        name: str = "preview",
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_memory_bytes (int): Upper bound for the in-memory tier.
+            directory (str | None): Directory of the disk tier, None to disable it.
+            max_disk_bytes (int): Upper bound for the disk tier.
+            name (str): Name of the cache in the metrics.
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = CacheStats(name)
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # Size of the disk tier as last measured, plus the entries written since
+        self._disk_bytes = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def key(content_hash: str, extension: str, params: dict | None = None) -> str:
+        """
+        Build the cache key of a rendered preview.
+
+        Args:
+            content_hash (str): SHA-256 of the source DICOM file.
+            extension (str): Output image format.
+            params (dict | None): Render parameters that affect the output.
+
+        Returns:
+            str: Hex digest identifying the rendered image.
+        """
+        payload = json.dumps(
+            [content_hash, extension.lower(), params or {}], sort_keys=True
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Look up a rendered preview, promoting disk hits to memory.
+
+        Args:
+            key (str): Cache key from `key`.
+
+        Returns:
+            bytes | None: The encoded image, or None on a miss.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+
+        data = self._read_disk(key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["disk_hits"] += 1
+        self._put_memory(key, data)
+        return data
+
+    async def aget(self, key: str) -> bytes | None:
+        """
+        Look up a rendered preview from a coroutine, reading the disk tier in
+        the thread pool.
+
+        Args:
+            key (str): Cache key from `key`.
+
+        Returns:
+            bytes | None: The encoded image, or None on a miss.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+        if self.directory is None:
+            self.stats["misses"] += 1
+            return None
+        return await run_in_threadpool(self.get, key)
+
+    def contains(self, key: str) -> bool:
+        """
+        Check for a rendered preview without counting a hit or a miss.
+
+        Args:
+            key (str): Cache key from `key`.
+
+        Returns:
+            bool: Whether either tier holds the preview.
+        """
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self.directory is not None and os.path.exists(
+            os.path.join(self.directory, key)
+        )
+
+    def put(self, key: str, data: bytes):
+        """
+        Store a rendered preview in both tiers.
+
+        Args:
+            key (str): Cache key from `key`.
+            data (bytes): The encoded image.
+        """
+        self._put_memory(key, data)
+        self._write_disk(key, data)
+
+    async def aput(self, key: str, data: bytes):
+        """
+        Store a rendered preview in both tiers from a coroutine, writing the
+        disk tier in the thread pool.
+
+        Args:
+            key (str): Cache key from `key`.
+            data (bytes): The encoded image.
+        """
+        self._put_memory(key, data)
+        if self.directory is not None:
+            await run_in_threadpool(self._write_disk, key, data)
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._entries[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+                self.stats["memory_evictions"] += 1
+
+    def _read_disk(self, key: str) -> bytes | None:
+        if self.directory is None:
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return data
+
+    def _write_disk(self, key: str, data: bytes):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, key)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._disk_bytes += len(data) - replaced
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        # Other processes sharing the directory write to it too, so its size is
+        # measured again under the lock rather than trusted
+        with FileLock(os.path.join(self.directory, "evict.lock")):
+            entries = sorted(self._disk_entries())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_disk_bytes:
+                target = self.max_disk_bytes * DISK_LOW_WATERMARK
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    self.stats["disk_evictions"] += 1
+        with self._lock:
+            self._disk_bytes = total
+
+    def _disk_entries(self) -> list[tuple[float, int, str]]:
+        # Last access time, size and path of every entry of the disk tier
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith((".tmp", ".lock")):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+
+preview_cache = PreviewCache(
+    Config.PREVIEW_CACHE_MAX_BYTES,
+    Config.PREVIEW_CACHE_DIR,
+    Config.PREVIEW_CACHE_DISK_MAX_BYTES,
+)
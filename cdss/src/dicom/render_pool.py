@@ -0,0 +1,357 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from src.config import Config
+from src.dicom.download import CHUNK_SIZE, FetchedDicom
+from src.dicom.schema import RenderParams
+
+# DicomService of a render process, created by the pool initializer
+_worker_service = None
+
+
+class RenderRejected(Exception):
+    """
+    An HTTPException raised in a render process. HTTPException itself cannot be
+    unpickled, so it crosses the process boundary as (status_code, detail).
+    """
+
+
+class SharedMemoryFile(io.RawIOBase):
+    """
+    Read-only, seekable file over a shared memory buffer, so that pydicom can
+    parse a DICOM file in place instead of from a private copy.
+    """
+
+    def __init__(self, buffer: memoryview):
+        super().__init__()
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        end = min(self._position + len(target), len(self._buffer))
+        count = max(0, end - self._position)
+        target[:count] = self._buffer[self._position : end]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self):
+        # Releases the view, so that the shared memory block can be closed
+        self._buffer.release()
+        super().close()
+
+
+class RenderJob:
+    """
+    Shared memory blocks of one render submitted to the pool.
+
+    The input block and the pool slot of the job are released once the job is
+    done, even if its request gave up waiting. Output blocks are released by
+    whoever comes last: the request collecting them, or the job completing
+    after its request gave up.
+    """
+
+    def __init__(self, source: SharedMemory, release_slot: Callable[[], None]):
+        self.source = source
+        self.release_slot = release_slot
+        self.abandoned = False
+        self._released = False
+        self._lock = threading.Lock()
+
+    def on_done(self, future: Future):
+        release_shared_memory(self.source.name, self.source)
+        self.release_slot()
+        with self._lock:
+            if self.abandoned:
+                self._release_outputs(future)
+
+    def abandon(self, future: Future):
+        with self._lock:
+            self.abandoned = True
+            if future.done():
+                self._release_outputs(future)
+
+    def _release_outputs(self, future: Future):
+        if self._released or future.cancelled() or future.exception() is not None:
+            return
+        self._released = True
+        for _, name, _ in future.result():
+            release_shared_memory(name)
+
+
+class RenderPool:
+    """
+    Process pool rendering DICOM previews off the event loop process.
+
+    Decoding and windowing partly hold the GIL, so previews rendered in the
+    threadpool of a single uvicorn worker do not scale across cores. The pool
+    renders them in separate processes instead. DICOM files are handed over
+    and encoded images handed back through shared memory blocks rather than
+    pickled bytes, the number of renders in flight is bounded, and each render
+    is given a deadline. A render that misses its deadline keeps its slot
+    until its process finishes it, so timed-out renders cannot pile up in the
+    executor.
+
+    Attributes:
+        processes (int): Number of render processes.
+        queue_size (int): Largest number of renders queued or running at once.
+        timeout (float): Seconds a request waits for its render.
+    """
+
+    def __init__(self, processes: int, queue_size: int, timeout: float):
+        """
+        Initialize the pool; processes are started by `startup` or on first use.
+
+        Args:
+            processes (int): Number of render processes.
+            queue_size (int): Largest number of renders queued or running at once.
+            timeout (float): Seconds a request waits for its render.
+        """
+        self.processes = processes
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._in_flight = 0
+        # Slots are released from the executor thread completing the renders
+        self._in_flight_lock = threading.Lock()
+
+    def startup(self):
+        """
+        Start the render processes.
+        """
+        self._get_executor()
+
+    def shutdown(self):
+        """
+        Stop the render processes, dropping queued renders.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    async def render(
+        self,
+        fetched: FetchedDicom,
+        extension: str,
+        params: RenderParams,
+        levels: list[RenderParams],
+    ) -> list[tuple[RenderParams, bytes]]:
+        """
+        Render a DICOM file, and optionally smaller levels of it, in the pool.
+
+        Args:
+            fetched (FetchedDicom): The DICOM file to render.
+            extension (str): Output image format.
+            params (RenderParams): Render parameters of the requested image.
+            levels (list[RenderParams]): Thumbnail pyramid levels to render as well.
+
+        Returns:
+            list[tuple[RenderParams, bytes]]: The requested image first, then the
+                levels smaller than the image.
+        """
+        with self._in_flight_lock:
+            if self._in_flight >= self.queue_size:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many previews are being rendered",
+                    headers={"Retry-After": "1"},
+                )
+            self._in_flight += 1
+
+        try:
+            source = await run_in_threadpool(copy_to_shared_memory, fetched)
+        except BaseException:
+            self._release_slot()
+            raise
+        job = RenderJob(source, self._release_slot)
+        try:
+            future = self._get_executor().submit(
+                render_shared, source.name, fetched.size, extension, params, levels
+            )
+        except BaseException as e:
+            release_shared_memory(source.name, source)
+            self._release_slot()
+            if isinstance(e, BrokenProcessPool):
+                self._executor = None
+            raise
+        # From here on the slot is released when the render is done
+        future.add_done_callback(job.on_done)
+
+        try:
+            outputs = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            job.abandon(future)
+            raise HTTPException(
+                status_code=504, detail="Rendering the preview timed out"
+            )
+        except RenderRejected as e:
+            raise HTTPException(status_code=e.args[0], detail=e.args[1])
+        except BrokenProcessPool:
+            # A render process died; start a fresh pool for the next request
+            self._executor = None
+            raise
+        except BaseException:
+            job.abandon(future)
+            raise
+
+        return [
+            (level, collect_shared_memory(name, size)) for level, name, size in outputs
+        ]
+
+    def _release_slot(self):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned processes do not inherit the event loop, threads or
+            # connections of the API process
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_render_process,
+            )
+        return self._executor
+
+
+def init_render_process():
+    global _worker_service
+    from src.dicom.service import DicomService
+
+    # One process per core already; OpenCV threads would only oversubscribe
+    cv2.setNumThreads(1)
+    _worker_service = DicomService()
+
+
+def render_shared(
+    source_name: str,
+    size: int,
+    extension: str,
+    params: RenderParams,
+    levels: list[RenderParams],
+) -> list[tuple[RenderParams, str, int]]:
+    """
+    Render a DICOM file held in shared memory, inside a render process.
+
+    Args:
+        source_name (str): Name of the shared memory block holding the file.
+        size (int): Size of the file in bytes.
+        extension (str): Output image format.
+        params (RenderParams): Render parameters of the requested image.
+        levels (list[RenderParams]): Thumbnail pyramid levels to render as well.
+
+    Returns:
+        list[tuple[RenderParams, str, int]]: Render parameters, shared memory
+            block name and size of each encoded image.
+    """
+    source = SharedMemory(name=source_name)
+    try:
+        with SharedMemoryFile(source.buf[:size]) as file:
+            pixel_array, modality = _worker_service.decode_pixel_data(
+                file, params.frame, params
+            )
+    except HTTPException as e:
+        raise RenderRejected(e.status_code, e.detail) from None
+    finally:
+        source.close()
+
+    outputs = []
+    try:
+        image = _worker_service.render_pixel_array(pixel_array, params, modality)
+        encoded = _worker_service.encode_image(image, extension, params.quality)
+        outputs.append((params, *share_bytes(encoded.getbuffer())))
+        for level, content in _worker_service.render_levels(
+            pixel_array, modality, extension, levels
+        ):
+            outputs.append((level, *share_bytes(content)))
+    except BaseException:
+        for _, name, _ in outputs:
+            release_shared_memory(name)
+        raise
+    return outputs
+
+
+def copy_to_shared_memory(fetched: FetchedDicom) -> SharedMemory:
+    """
+    Copy a fetched DICOM file into a new shared memory block.
+
+    Args:
+        fetched (FetchedDicom): The DICOM file, positioned at its start.
+
+    Returns:
+        SharedMemory: Block holding the file; the caller releases it.
+    """
+    block = SharedMemory(create=True, size=max(fetched.size, 1))
+    try:
+        offset = 0
+        while chunk := fetched.file.read(CHUNK_SIZE):
+            block.buf[offset : offset + len(chunk)] = chunk
+            offset += len(chunk)
+        fetched.file.seek(0)
+    except BaseException:
+        release_shared_memory(block.name, block)
+        raise
+    return block
+
+
+def share_bytes(content) -> tuple[str, int]:
+    block = SharedMemory(create=True, size=max(len(content), 1))
+    block.buf[: len(content)] = content
+    name = block.name
+    block.close()
+    return name, len(content)
+
+
+def collect_shared_memory(name: str, size: int) -> bytes:
+    block = SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        release_shared_memory(name, block)
+
+
+def release_shared_memory(name: str, block: SharedMemory | None = None):
+    try:
+        block = block or SharedMemory(name=name)
+        block.close()
+        block.unlink()
+    except FileNotFoundError:
+        pass
+
+
+render_pool = (
+    RenderPool(
+        Config.PREVIEW_RENDER_PROCESSES or os.cpu_count() or 1,
+        Config.PREVIEW_RENDER_QUEUE_SIZE,
+        Config.PREVIEW_RENDER_TIMEOUT,
+    )
+    if Config.PREVIEW_RENDER_BACKEND == "process"
+    else None
+)
@@ -1,18 +1,54 @@
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import StreamingResponse
+import json
+import zipfile
 
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+
+from src.dicom.schema import (
+    BatchPreviewSchema,
+    DicomFramesInfo,
+    RenderParams,
+    WindowMode,
+)
 from src.dicom.service import DicomService
 from src.auth.dependencies import ApiKeyHeader
+from src.config import Config
 
 dicom_router = APIRouter()
 dicom_service = DicomService()
 
+FRAME_BOUNDARY = "dicom-frame"
+PREVIEW_BOUNDARY = "dicom-preview"
+
+
+class ZipStream:
+    """
+    Write-only file collecting the bytes a ZipFile writes, so that an archive can
+    be streamed member by member without being held in memory.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
 
 @dicom_router.get(
     "/preview",
-    response_class=StreamingResponse,
-    summary="Preview DICOM file as JPEG or PNG",
-    description="Returns a DICOM image as JPEG or PNG format",
+    response_class=Response,
+    summary="Preview DICOM file as JPEG, PNG or WebP",
+    description="Returns a DICOM image as JPEG, PNG or WebP format, optionally resized",
     dependencies=[Depends(ApiKeyHeader())],
     include_in_schema=True,
     responses={
@@ -20,9 +56,12 @@ dicom_service = DicomService()
             "content": {
                 "image/png": {},
                 "image/jpeg": {},
+                "image/webp": {},
             },
             "description": "DICOM image",
         },
+        304: {"description": "Preview matches the If-None-Match ETag"},
+        400: {"description": "Frame index out of range"},
         401: {"description": "Unauthorized"},
         404: {"description": "DICOM file not found at the provided URL"},
     },
@@ -37,9 +76,291 @@ async def preview_dicom_file(
     ),
     extension: str = Query(
         "jpeg",
-        enum=["jpeg", "png"],
+        enum=["jpeg", "png", "webp"],
         description="Image format to convert to",
     ),
+    width: int | None = Query(
+        None, ge=1, le=4096, description="Output width in pixels"
+    ),
+    height: int | None = Query(
+        None, ge=1, le=4096, description="Output height in pixels"
+    ),
+    max_size: int | None = Query(
+        None,
+        ge=1,
+        le=4096,
+        alias="maxSize",
+        description="Upper bound for the longest output side, never upscales",
+    ),
+    quality: int | None = Query(None, ge=1, le=100, description="JPEG/WebP quality"),
+    frame: int = Query(
+        0, ge=0, description="Frame to render for multi-frame files, from 0"
+    ),
+    window: WindowMode = Query(
+        "auto",
+        description="Auto contrast, the window stored in the file, or a named preset",
+    ),
+    window_center: float | None = Query(
+        None,
+        alias="windowCenter",
+        description="Custom window center in modality units, with windowWidth",
+    ),
+    window_width: float | None = Query(
+        None,
+        gt=0,
+        alias="windowWidth",
+        description="Custom window width in modality units, with windowCenter",
+    ),
+    if_none_match: str | None = Header(None, include_in_schema=False),
+) -> Response:
+    params = RenderParams(
+        width=width,
+        height=height,
+        max_size=max_size,
+        quality=quality,
+        frame=frame,
+        window=window,
+        window_center=window_center,
+        window_width=window_width,
+    )
+    preview = await dicom_service.render_preview(
+        file_url, extension, if_none_match, params
+    )
+    if not preview.cacheable:
+        return Response(
+            preview.content,
+            media_type=f"image/{extension.lower()}",
+            headers={"Cache-Control": "no-store"},
+        )
+
+    headers = {"ETag": preview.etag, "Cache-Control": Config.PREVIEW_CACHE_CONTROL}
+    if preview.content is None:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        preview.content, media_type=f"image/{extension.lower()}", headers=headers
+    )
+
+
+@dicom_router.post(
+    "/preview/batch",
+    response_class=StreamingResponse,
+    summary="Preview many DICOM files at once",
+    description="Renders the previews of many DICOM files, e.g. the instances of a "
+    "series, with bounded concurrency and through the preview cache. They are "
+    "streamed as a multipart/mixed response or a zip archive as soon as each is "
+    "ready, or once the previous ones are when ordered, or tiled into a single "
+    "contact sheet image. Files that cannot be fetched get an error part, an "
+    "entry in errors.json, or a blank tile",
+    dependencies=[Depends(ApiKeyHeader())],
+    responses={
+        200: {
+            "content": {
+                "multipart/mixed": {},
+                "application/zip": {},
+                "image/png": {},
+                "image/jpeg": {},
+                "image/webp": {},
+            },
+            "description": "One image part or zip member per instance, with an "
+            "X-Instance-Index header or a zero-padded index as name, or the contact "
+            "sheet with its tiles in the order of the instances",
+        },
+        401: {"description": "Unauthorized"},
+    },
+)
+async def preview_dicom_batch(batchPreviewSchema: BatchPreviewSchema):
+    schema = batchPreviewSchema
+    media_type = f"image/{schema.extension}"
+    params = schema.render_params()
+    if schema.layout == "sheet":
+        # Previews are rendered no larger than the cells of the sheet
+        tile_size, _, _ = dicom_service.contact_sheet_grid(
+            len(schema.instances), schema.maxSize, schema.columns
+        )
+        params = params.model_copy(update={"max_size": tile_size})
+    previews = dicom_service.render_previews(
+        schema.instances,
+        schema.extension,
+        params,
+        ordered=schema.ordered or schema.layout == "sheet",
+    )
+
+    if schema.layout == "sheet":
+        tiles = [
+            preview.content if not isinstance(preview, Exception) else None
+            async for _, preview in previews
+        ]
+        sheet = await run_in_threadpool(
+            dicom_service.compose_contact_sheet,
+            tiles,
+            params.max_size,
+            schema.extension,
+            schema.quality,
+            schema.columns,
+        )
+        return Response(
+            sheet, media_type=media_type, headers={"Cache-Control": "no-store"}
+        )
+
+    async def multipart():
+        async for index, preview in previews:
+            if isinstance(preview, Exception):
+                content = str(preview.detail).encode()
+                headers = (
+                    "Content-Type: text/plain\r\n"
+                    f"X-Status-Code: {preview.status_code}\r\n"
+                )
+            else:
+                content = preview.content
+                headers = f"Content-Type: {media_type}\r\n"
+            yield (
+                f"--{PREVIEW_BOUNDARY}\r\n{headers}"
+                f"Content-Length: {len(content)}\r\n"
+                f"X-Instance-Index: {index}\r\n\r\n"
+            ).encode() + content + b"\r\n"
+        yield f"--{PREVIEW_BOUNDARY}--\r\n".encode()
+
+    async def archive():
+        stream = ZipStream()
+        digits = len(str(len(schema.instances) - 1))
+        errors = {}
+        # Previews are already compressed, so they are stored as they are
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as zip_file:
+            async for index, preview in previews:
+                if isinstance(preview, Exception):
+                    errors[index] = {
+                        "instance": schema.instances[index],
+                        "statusCode": preview.status_code,
+                        "detail": preview.detail,
+                    }
+                    continue
+                zip_file.writestr(
+                    f"{index:0{digits}d}.{schema.extension}", preview.content
+                )
+                yield stream.take()
+            if errors:
+                zip_file.writestr("errors.json", json.dumps(errors, indent=2))
+        yield stream.take()
+
+    if schema.layout == "zip":
+        return StreamingResponse(
+            archive(),
+            media_type="application/zip",
+            headers={
+                "Cache-Control": "no-store",
+                "Content-Disposition": 'attachment; filename="previews.zip"',
+            },
+        )
+    return StreamingResponse(
+        multipart(),
+        media_type=f"multipart/mixed; boundary={PREVIEW_BOUNDARY}",
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@dicom_router.get(
+    "/frames",
+    response_model=DicomFramesInfo,
+    summary="Describe the frames of a DICOM file",
+    description="Returns the frame count, size and encoding of a DICOM file without decoding it",
+    dependencies=[Depends(ApiKeyHeader())],
+    responses={
+        401: {"description": "Unauthorized"},
+        404: {"description": "DICOM file not found at the provided URL"},
+    },
+)
+async def get_dicom_frames(
+    file_url: str = Query(
+        ...,
+        pattern="^https?://.*$",
+        alias="fileURL",
+        description="URL of the DICOM file",
+        example="https://example.com/dicom.dcm",
+    ),
+) -> DicomFramesInfo:
+    return await dicom_service.get_frames_info(file_url)
+
+
+@dicom_router.get(
+    "/frames/stream",
+    response_class=StreamingResponse,
+    summary="Stream the frames of a DICOM file",
+    description="Streams the frames of a DICOM file as a multipart/mixed response, "
+    "decoding and sending one frame at a time",
+    dependencies=[Depends(ApiKeyHeader())],
+    responses={
+        200: {
+            "content": {"multipart/mixed": {}},
+            "description": "One image part per frame, with an X-Frame-Index header",
+        },
+        400: {"description": "Frame range is empty"},
+        401: {"description": "Unauthorized"},
+        404: {"description": "DICOM file not found at the provided URL"},
+    },
+)
+async def stream_dicom_frames(
+    file_url: str = Query(
+        ...,
+        pattern="^https?://.*$",
+        alias="fileURL",
+        description="URL of the DICOM file",
+        example="https://example.com/dicom.dcm",
+    ),
+    extension: str = Query(
+        "jpeg",
+        enum=["jpeg", "png", "webp"],
+        description="Image format to convert each frame to",
+    ),
+    max_size: int | None = Query(
+        None,
+        ge=1,
+        le=4096,
+        alias="maxSize",
+        description="Upper bound for the longest output side, never upscales",
+    ),
+    quality: int | None = Query(None, ge=1, le=100, description="JPEG/WebP quality"),
+    start: int = Query(0, ge=0, description="First frame to stream"),
+    stop: int | None = Query(
+        None, ge=1, description="Frame after the last one to stream"
+    ),
+    window: WindowMode = Query(
+        "auto",
+        description="Auto contrast, the window stored in the file, or a named preset",
+    ),
+    window_center: float | None = Query(
+        None,
+        alias="windowCenter",
+        description="Custom window center in modality units, with windowWidth",
+    ),
+    window_width: float | None = Query(
+        None,
+        gt=0,
+        alias="windowWidth",
+        description="Custom window width in modality units, with windowCenter",
+    ),
 ) -> StreamingResponse:
-    image = await dicom_service.convert_dicom_to_image(file_url, extension)
-    return StreamingResponse(image, media_type=f"image/{extension.lower()}")
+    params = RenderParams(
+        max_size=max_size,
+        quality=quality,
+        window=window,
+        window_center=window_center,
+        window_width=window_width,
+    )
+    frames = await dicom_service.stream_frames(file_url, extension, params, start, stop)
+    media_type = f"image/{extension.lower()}"
+
+    async def multipart():
+        async for index, content in frames:
+            yield (
+                f"--{FRAME_BOUNDARY}\r\n"
+                f"Content-Type: {media_type}\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                f"X-Frame-Index: {index}\r\n\r\n"
+            ).encode() + content + b"\r\n"
+        yield f"--{FRAME_BOUNDARY}--\r\n".encode()
+
+    return StreamingResponse(
+        multipart(),
+        media_type=f"multipart/mixed; boundary={FRAME_BOUNDARY}",
+        headers={"Cache-Control": "no-store"},
+    )
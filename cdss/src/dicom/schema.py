@@ -0,0 +1,67 @@
+from typing import Annotated, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from src.config import Config
+
+WindowMode = Literal["auto", "dicom", "lung", "mediastinum", "brain", "bone"]
+
+
+class RenderParams(BaseModel):
+    width: Optional[int] = Field(None, ge=1, le=4096)
+    height: Optional[int] = Field(None, ge=1, le=4096)
+    max_size: Optional[int] = Field(None, ge=1, le=4096)
+    quality: Optional[int] = Field(None, ge=1, le=100)
+    frame: int = Field(0, ge=0)
+    window: WindowMode = "auto"
+    window_center: Optional[float] = None
+    window_width: Optional[float] = Field(None, gt=0)
+
+    def is_resized(self) -> bool:
+        return any(
+            size is not None for size in (self.width, self.height, self.max_size)
+        )
+
+    def cache_params(self) -> dict:
+        # Defaults are left out, so that equivalent requests share a cache key
+        return self.model_dump(exclude_defaults=True)
+
+
+class BatchPreviewSchema(BaseModel):
+    instances: list[Annotated[str, Field(pattern="^https?://.*$")]] = Field(
+        ..., min_length=1, max_length=Config.PREVIEW_BATCH_MAX_INSTANCES
+    )
+    layout: Literal["multipart", "zip", "sheet"] = "multipart"
+    extension: Literal["jpeg", "png", "webp"] = "jpeg"
+    maxSize: int = Field(256, ge=1, le=1024)
+    quality: Optional[int] = Field(None, ge=1, le=100)
+    frame: int = Field(0, ge=0)
+    window: WindowMode = "auto"
+    windowCenter: Optional[float] = None
+    windowWidth: Optional[float] = Field(None, gt=0)
+    # Stream the previews in the order of the instances, or as they are ready
+    ordered: bool = True
+    # Tiles per row of the contact sheet, a square grid by default
+    columns: Optional[int] = Field(None, ge=1, le=100)
+
+    def render_params(self) -> RenderParams:
+        return RenderParams(
+            max_size=self.maxSize,
+            quality=self.quality,
+            frame=self.frame,
+            window=self.window,
+            window_center=self.windowCenter,
+            window_width=self.windowWidth,
+        )
+
+
+class DicomFramesInfo(BaseModel):
+    numberOfFrames: int
+    rows: int
+    columns: int
+    samplesPerPixel: int
+    bitsAllocated: int
+    photometricInterpretation: Optional[str] = None
+    transferSyntaxUID: Optional[str] = None
+    modality: Optional[str] = None
+    frameTime: Optional[float] = None
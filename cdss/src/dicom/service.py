@@ -1,15 +1,76 @@
 from fastapi import HTTPException
 from fastapi.concurrency import run_in_threadpool
 
+import asyncio
 import io
-import httpx
+import math
+import tempfile
+import threading
+from typing import AsyncIterator, BinaryIO, Iterator, NamedTuple
+
 import cv2
-import pydicom as dicom
+import httpx
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.pixels import iter_pixels, pixel_array as pixel_array_from_file
 import numpy as np
 from PIL import Image
 
+from src.config import Config
+from src.http_client import http_client_pool
+from src.dicom.cache import dicom_file_cache
+from src.dicom.decoders import (
+    decode_j2k_reduced,
+    decoding_plugin,
+    j2k_reduction,
+    read_decode_header,
+    transfer_syntax_of,
+)
+from src.dicom.download import FetchedDicom, download_to_file
+from src.dicom.preview_cache import preview_cache
+from src.dicom.render_pool import render_pool
+from src.dicom.schema import DicomFramesInfo, RenderParams
+from src.metrics import (
+    BLACK_IMAGE_FALLBACKS,
+    CONTRAST_SECONDS,
+    DECODE_SECONDS,
+    DOWNLOAD_SECONDS,
+    ENCODE_SECONDS,
+    span,
+)
+from src.dicom.windowing import (
+    MODALITY_TAGS,
+    ModalityInfo,
+    apply_lut,
+    normalized_stretch_lut,
+    render_window,
+)
+
+QUALITY_FLAGS = {
+    "jpeg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+}
+RESIZABLE_DTYPES = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+
+
+class RenderedPreview(NamedTuple):
+    """
+    An encoded preview image with its strong ETag.
+    `content` is None when the client already holds the current version, and
+    `cacheable` is False for fallback images that must not be cached.
+    """
+
+    content: bytes | None
+    etag: str | None
+    cacheable: bool
+
 
 class DicomService:
+    # Bounds the number of concurrent pixel decodes, and so their peak memory
+    _decode_slots = threading.BoundedSemaphore(Config.DICOM_MAX_CONCURRENT_DECODES)
+    # Keeps fire-and-forget pyramid renders alive until they finish
+    _background_tasks = set()
+
     async def convert_dicom_to_image(
         self, file_url: str, extension: str = "jpeg"
     ) -> io.BytesIO:
@@ -19,48 +80,636 @@ class DicomService:
         :param extension: Desired output image format ('jpeg' or 'png').
         :return: BytesIO object containing the encoded image.
         """
-        async with httpx.AsyncClient() as client:
-            response = await client.get(file_url, timeout=300)
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=404, detail="DICOM file not found at the provided URL"
+        with await self.fetch_dicom(file_url) as fetched:
+            try:
+                # Run DICOM reading and image processing in a separate thread
+                img_bytes = await run_in_threadpool(
+                    self.process_dicom_data, fetched.file, extension
+                )
+            except Exception as e:
+                print("Failed to process DICOM file. Returning a black image.")
+                print("Error:", e)
+                img_bytes = self.create_black_image(extension)
+
+        return img_bytes
+
+    async def convert_dicom_to_array(self, file_url: str, frame: int = 0) -> np.ndarray:
+        """
+        Fetch a DICOM file from a URL and return its processed pixel array.
+        Unlike `convert_dicom_to_image`, decoding errors are raised instead of
+        falling back to a black image, and no image encoding takes place.
+        :param file_url: URL of the DICOM file.
+        :param frame: Index of the frame to decode for multi-frame instances.
+        :return: Contrast-enhanced uint8 pixel array.
+        """
+        params = RenderParams(frame=frame)
+        with await self.fetch_dicom(file_url) as fetched:
+            return await run_in_threadpool(self.read_pixel_array, fetched.file, params)
+
+    async def get_frames_info(self, file_url: str) -> DicomFramesInfo:
+        """
+        Fetch a DICOM file from a URL and describe its frames without decoding them.
+        :param file_url: URL of the DICOM file.
+        :return: DicomFramesInfo with the frame count, size and encoding.
+        """
+        with await self.fetch_dicom(file_url) as fetched:
+            return await run_in_threadpool(self.read_frames_info, fetched.file)
+
+    async def stream_frames(
+        self,
+        file_url: str,
+        extension: str = "jpeg",
+        params: RenderParams | None = None,
+        start: int = 0,
+        stop: int | None = None,
+    ) -> AsyncIterator[tuple[int, bytes]]:
+        """
+        Fetch a DICOM file from a URL and render its frames one at a time.
+        The file is fetched before returning, so that download errors surface as
+        HTTP errors; frames are then decoded lazily as the iterator is consumed.
+        :param file_url: URL of the DICOM file.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param params: Output size and quality of every frame.
+        :param start: Index of the first frame to render.
+        :param stop: Index after the last frame to render, defaults to the frame count.
+        :return: Async iterator of (frame index, encoded image) pairs.
+        """
+        fetched = await self.fetch_dicom(file_url)
+        try:
+            info = await run_in_threadpool(self.read_frames_info, fetched.file)
+        except BaseException:
+            fetched.close()
+            raise
+
+        stop = info.numberOfFrames if stop is None else min(stop, info.numberOfFrames)
+        if start >= stop:
+            fetched.close()
+            raise HTTPException(status_code=400, detail="Frame range is empty")
+        return self._iter_frames(fetched, extension, params, range(start, stop))
+
+    async def _iter_frames(
+        self,
+        fetched: FetchedDicom,
+        extension: str,
+        params: RenderParams | None,
+        indices: range,
+    ) -> AsyncIterator[tuple[int, bytes]]:
+        with fetched:
+            plugin = decoding_plugin(
+                transfer_syntax_of(
+                    await run_in_threadpool(read_decode_header, fetched.file)
+                )
             )
-        dicom_data = io.BytesIO(response.content)
+            header = Dataset()
+            frames = iter_pixels(
+                fetched.file,
+                indices=indices,
+                ds_out=header,
+                specific_tags=MODALITY_TAGS,
+                decoding_plugin=plugin,
+            )
+            try:
+                for index in indices:
+                    content = await run_in_threadpool(
+                        self._render_next_frame, frames, header, extension, params
+                    )
+                    yield index, content
+            finally:
+                # Finish the decoder before its file is closed
+                frames.close()
+
+    def _render_next_frame(
+        self,
+        frames: Iterator[np.ndarray],
+        header: Dataset,
+        extension: str,
+        params: RenderParams | None,
+    ) -> bytes:
+        with self._decode_slots:
+            pixel_array = next(frames)
+        modality = ModalityInfo.from_dataset(header)
+        image = self.render_pixel_array(pixel_array, params, modality)
+        return self.encode_image(
+            image, extension, params.quality if params else None
+        ).getvalue()
+
+    async def fetch_dicom(self, file_url: str) -> FetchedDicom:
+        """
+        Download a DICOM file, going through the on-disk cache when enabled.
+        The body is streamed to disk, or to a spooled temporary file when the cache
+        is disabled, and files larger than DICOM_MAX_BYTES are rejected early.
+        :param file_url: URL of the DICOM file.
+        :return: FetchedDicom with the open file and the hash of its content.
+        """
+        client = http_client_pool.get()
+        with span("download", DOWNLOAD_SECONDS):
+            if dicom_file_cache is not None:
+                return await dicom_file_cache.fetch(file_url, client)
+
+            spool = tempfile.SpooledTemporaryFile(
+                max_size=Config.DICOM_SPOOL_MEMORY_BYTES
+            )
+            try:
+                async with client.stream("GET", file_url) as response:
+                    sha256, size = await download_to_file(
+                        response, spool, Config.DICOM_MAX_BYTES
+                    )
+            except BaseException:
+                spool.close()
+                raise
+            return FetchedDicom(spool, sha256, size)
 
+    async def render_preview(
+        self,
+        file_url: str,
+        extension: str = "jpeg",
+        if_none_match: str | None = None,
+        params: RenderParams | None = None,
+    ) -> RenderedPreview:
+        """
+        Render a DICOM file as a PNG, JPEG or WebP preview, going through the preview cache.
+        :param file_url: URL of the DICOM file.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param if_none_match: Value of the request's If-None-Match header, if any.
+        :param params: Output size and quality.
+        :return: RenderedPreview; its content is None when the client's copy is current.
+        """
+        params = params or RenderParams()
+        with await self.fetch_dicom(file_url) as fetched:
+            key = preview_cache.key(fetched.sha256, extension, params.cache_params())
+            etag = f'"{key}"'
+            if if_none_match is not None and etag in (
+                tag.strip() for tag in if_none_match.split(",")
+            ):
+                return RenderedPreview(None, etag, True)
+
+            content = await preview_cache.aget(key)
+            if content is not None:
+                return RenderedPreview(content, etag, True)
+
+            levels = await run_in_threadpool(
+                self.pyramid_levels, fetched.sha256, extension, params
+            )
+            try:
+                if render_pool is not None:
+                    rendered = await render_pool.render(
+                        fetched, extension, params, levels
+                    )
+                else:
+                    content, pixel_array, modality = await run_in_threadpool(
+                        self._render_full, fetched.file, extension, params
+                    )
+            except HTTPException:
+                raise
+            except Exception as e:
+                print("Failed to process DICOM file. Returning a black image.")
+                print("Error:", e)
+                return RenderedPreview(
+                    self.create_black_image(extension).getvalue(), None, False
+                )
+
+        if render_pool is not None:
+            # The pool renders the pyramid levels along with the requested image
+            (_, content), *rendered_levels = rendered
+            for level, level_content in rendered_levels:
+                await run_in_threadpool(
+                    self._put_level, fetched.sha256, extension, level, level_content
+                )
+        elif levels:
+            self._schedule_pyramid(
+                pixel_array, modality, fetched.sha256, extension, levels
+            )
+        await preview_cache.aput(key, content)
+        return RenderedPreview(content, etag, True)
+
+    async def render_previews(
+        self,
+        file_urls: list[str],
+        extension: str = "jpeg",
+        params: RenderParams | None = None,
+        ordered: bool = True,
+    ) -> AsyncIterator[tuple[int, RenderedPreview | HTTPException]]:
+        """
+        Render the previews of many DICOM files, fetching and rendering up to
+        PREVIEW_BATCH_CONCURRENCY of them at a time.
+        Each preview goes through the preview cache like a single one, and is yielded
+        as soon as it is ready, or once the previous ones are when `ordered` is set.
+        :param file_urls: URLs of the DICOM files.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param params: Output size and quality of every preview.
+        :param ordered: Yield the previews in the order of `file_urls`.
+        :return: Async iterator of (index in `file_urls`, preview) pairs, with the
+            HTTPException instead of the preview for files that could not be fetched.
+        """
+        semaphore = asyncio.Semaphore(Config.PREVIEW_BATCH_CONCURRENCY)
+
+        async def render(index: int, file_url: str):
+            async with semaphore:
+                try:
+                    preview = await self.render_preview(
+                        file_url, extension, None, params
+                    )
+                except HTTPException as e:
+                    return index, e
+                except httpx.HTTPError as e:
+                    return index, HTTPException(
+                        status_code=502, detail=f"Failed to fetch the DICOM file: {e}"
+                    )
+                return index, preview
+
+        tasks = [
+            asyncio.create_task(render(index, file_url))
+            for index, file_url in enumerate(file_urls)
+        ]
         try:
-            # Run DICOM reading and image processing in a separate thread
-            img_bytes = await run_in_threadpool(
-                self.process_dicom_data, dicom_data, extension
+            for task in tasks if ordered else asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # The client went away, or the caller stopped early
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def contact_sheet_grid(
+        count: int, tile_size: int, columns: int | None = None
+    ) -> tuple[int, int, int]:
+        """
+        Lay out a contact sheet, shrinking its tiles so that it stays within
+        PREVIEW_SHEET_MAX_SIDE pixels on each side and PREVIEW_SHEET_MAX_PIXELS in all.
+        :param count: Number of tiles.
+        :param tile_size: Requested side of the square cell of each tile.
+        :param columns: Tiles per row, a square grid by default.
+        :return: Side of the cells, columns and rows of the sheet.
+        """
+        columns = columns or math.ceil(math.sqrt(count))
+        rows = math.ceil(count / columns)
+        tile_size = min(
+            tile_size,
+            Config.PREVIEW_SHEET_MAX_SIDE // max(columns, rows),
+            math.isqrt(Config.PREVIEW_SHEET_MAX_PIXELS // (columns * rows)),
+        )
+        if tile_size < 1:
+            raise HTTPException(
+                status_code=400, detail="Too many tiles for a contact sheet"
             )
-        except Exception as e:
-            print("Failed to process DICOM file. Returning a black image.")
-            print("Error:", e)
-            img_bytes = self.create_black_image(extension)
+        return tile_size, columns, rows
 
-        return img_bytes
+    def compose_contact_sheet(
+        self,
+        tiles: list[bytes | None],
+        tile_size: int,
+        extension: str = "jpeg",
+        quality: int | None = None,
+        columns: int | None = None,
+    ) -> bytes:
+        """
+        Tile encoded previews into a single contact sheet image, row by row.
+        :param tiles: Encoded previews, None for a blank tile.
+        :param tile_size: Side of the square cell of each tile; larger previews are
+            shrunk to fit and smaller ones centered.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param quality: JPEG/WebP quality from 1 to 100; ignored for PNG.
+        :param columns: Tiles per row, a square grid by default.
+        :return: The encoded contact sheet.
+        """
+        tile_size, columns, rows = self.contact_sheet_grid(
+            len(tiles), tile_size, columns
+        )
+        images = [
+            (
+                cv2.imdecode(np.frombuffer(tile, np.uint8), cv2.IMREAD_ANYCOLOR)
+                if tile is not None
+                else None
+            )
+            for tile in tiles
+        ]
+        color = any(image is not None and image.ndim == 3 for image in images)
+        shape = (rows * tile_size, columns * tile_size) + ((3,) if color else ())
+        sheet = np.zeros(shape, dtype=np.uint8)
+
+        for index, image in enumerate(images):
+            if image is None:
+                continue
+            if color and image.ndim == 2:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            image = self.resize_pixel_array(image, RenderParams(max_size=tile_size))
+            height, width = image.shape[:2]
+            top = index // columns * tile_size + (tile_size - height) // 2
+            left = index % columns * tile_size + (tile_size - width) // 2
+            sheet[top : top + height, left : left + width] = image
+        return self.encode_image(sheet, extension, quality).getvalue()
+
+    def _render_full(
+        self, dicom_data: BinaryIO, extension: str, params: RenderParams
+    ) -> tuple[bytes, np.ndarray, ModalityInfo]:
+        # Keeps the decoded pixels so that the thumbnail pyramid can be rendered
+        # without decoding the file again
+        pixel_array, modality = self.decode_pixel_data(dicom_data, params.frame, params)
+        image = self.render_pixel_array(pixel_array, params, modality)
+        return (
+            self.encode_image(image, extension, params.quality).getvalue(),
+            pixel_array,
+            modality,
+        )
+
+    def _schedule_pyramid(
+        self,
+        pixel_array: np.ndarray,
+        modality: ModalityInfo,
+        content_hash: str,
+        extension: str,
+        levels: list[RenderParams],
+    ):
+        async def render():
+            try:
+                await run_in_threadpool(
+                    self.render_pyramid,
+                    pixel_array,
+                    modality,
+                    content_hash,
+                    extension,
+                    levels,
+                )
+            except Exception as e:
+                print("Failed to render preview pyramid:", e)
+
+        task = asyncio.get_running_loop().create_task(render())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def render_pyramid(
+        self,
+        pixel_array: np.ndarray,
+        modality: ModalityInfo,
+        content_hash: str,
+        extension: str,
+        levels: list[RenderParams],
+    ):
+        """
+        Precompute the standard thumbnail sizes of a full image into the preview cache.
+        :param pixel_array: Decoded pixel data of the DICOM file.
+        :param modality: Rescale and window attributes of the DICOM file.
+        :param content_hash: SHA-256 of the DICOM file.
+        :param extension: Output image format of the full image.
+        :param levels: Render parameters of the thumbnails, from `pyramid_levels`.
+        """
+        for level, content in self.render_levels(
+            pixel_array, modality, extension, levels
+        ):
+            self._put_level(content_hash, extension, level, content)
 
-    def process_dicom_data(self, dicom_data: io.BytesIO, extension: str) -> io.BytesIO:
+    def pyramid_levels(
+        self, content_hash: str, extension: str, params: RenderParams
+    ) -> list[RenderParams]:
+        """
+        List the thumbnail pyramid levels to render along with a full-size preview.
+        :param content_hash: SHA-256 of the DICOM file.
+        :param extension: Output image format of the full image.
+        :param params: Render parameters of the full image.
+        :return: Render parameters of the levels that are not cached yet.
+        """
+        if params.is_resized():
+            return []
+
+        levels = []
+        for size in Config.PREVIEW_PYRAMID_SIZES:
+            level = params.model_copy(update={"max_size": size})
+            key = preview_cache.key(content_hash, extension, level.cache_params())
+            if not preview_cache.contains(key):
+                levels.append(level)
+        return levels
+
+    def render_levels(
+        self,
+        pixel_array: np.ndarray,
+        modality: ModalityInfo,
+        extension: str,
+        levels: list[RenderParams],
+    ) -> Iterator[tuple[RenderParams, bytes]]:
+        """
+        Render the pyramid levels that are smaller than the decoded image.
+        :param pixel_array: Decoded pixel data of the DICOM file.
+        :param modality: Rescale and window attributes of the DICOM file.
+        :param extension: Output image format.
+        :param levels: Render parameters of the thumbnails.
+        :return: Iterator of (level, encoded image) pairs.
+        """
+        for level in levels:
+            if level.max_size >= max(pixel_array.shape[:2]):
+                continue
+            image = self.render_pixel_array(pixel_array, level, modality)
+            yield level, self.encode_image(image, extension, level.quality).getvalue()
+
+    def _put_level(
+        self, content_hash: str, extension: str, level: RenderParams, content: bytes
+    ):
+        preview_cache.put(
+            preview_cache.key(content_hash, extension, level.cache_params()), content
+        )
+
+    def process_dicom_data(
+        self,
+        dicom_data: BinaryIO,
+        extension: str,
+        params: RenderParams | None = None,
+    ) -> io.BytesIO:
         """
         Process the DICOM data to extract an image and enhance contrast.
-        :param dicom_data: BytesIO object containing the DICOM file.
-        :param extension: Desired output image format ('jpeg' or 'png').
+        :param dicom_data: File-like object containing the DICOM file.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param params: Output size and quality.
         :return: BytesIO object containing the encoded image.
         """
-        # Read the DICOM file
-        ds = dicom.dcmread(dicom_data)
-        pixel_array = ds.pixel_array
+        pixel_array = self.read_pixel_array(dicom_data, params)
+        return self.encode_image(
+            pixel_array, extension, params.quality if params else None
+        )
 
-        # Normalize the image to 0-255
-        if pixel_array.dtype != np.uint8:
-            pixel_array = cv2.normalize(pixel_array, None, 0, 255, cv2.NORM_MINMAX)
-            pixel_array = np.uint8(pixel_array)
+    def read_pixel_array(
+        self, dicom_data: BinaryIO, params: RenderParams | None = None
+    ) -> np.ndarray:
+        """
+        Read the DICOM data, resize it, normalize it to 8 bits and enhance contrast.
+        :param dicom_data: File-like object containing the DICOM file.
+        :param params: Output size and frame; the native size and first frame are kept when omitted.
+        :return: Contrast-enhanced uint8 pixel array.
+        """
+        frame = params.frame if params is not None else 0
+        pixel_array, modality = self.decode_pixel_data(dicom_data, frame, params)
+        return self.render_pixel_array(pixel_array, params, modality)
 
-        # Apply auto contrast
-        pixel_array = self.apply_auto_contrast(pixel_array)
+    def decode_pixel_data(
+        self, dicom_data: BinaryIO, frame: int = 0, params: RenderParams | None = None
+    ) -> tuple[np.ndarray, ModalityInfo]:
+        """
+        Decode a single frame of the pixel data of a DICOM file, with the decoding
+        plugin selected for its transfer syntax.
+        :param dicom_data: File-like object containing the DICOM file.
+        :param frame: Index of the frame to decode; single-frame files only have frame 0.
+        :param params: Output size of the image rendered from the frame; JPEG 2000
+            frames are decoded at the lowest resolution that still covers it.
+        :return: Pixel array of the frame in its stored data type, and its rescale and
+            window attributes.
+        """
+        if frame > 0:
+            self.check_frame(dicom_data, frame)
+
+        header = read_decode_header(dicom_data)
+        reduction = 0
+        if params is not None and params.is_resized() and "Rows" in header:
+            reduction = j2k_reduction(
+                header, self.output_size(header.Columns, header.Rows, params)
+            )
+
+        with self._decode_slots, span("decode", DECODE_SECONDS):
+            pixel_array = None
+            if reduction:
+                try:
+                    pixel_array = decode_j2k_reduced(
+                        dicom_data, header, frame, reduction
+                    )
+                except Exception as e:
+                    print("Reduced JPEG 2000 decode failed, decoding in full:", e)
+            if pixel_array is None:
+                # Decode only the requested frame, straight from the file, without
+                # building the full dataset or the other frames in memory first
+                pixel_array = pixel_array_from_file(
+                    dicom_data,
+                    index=frame,
+                    decoding_plugin=decoding_plugin(transfer_syntax_of(header)),
+                )
+        return pixel_array, ModalityInfo.from_dataset(header)
 
+    def check_frame(self, dicom_data: BinaryIO, frame: int):
+        """
+        Reject frame indices past the last frame of a DICOM file.
+        :param dicom_data: File-like object containing the DICOM file.
+        :param frame: Requested frame index.
+        """
+        number_of_frames = self.read_frames_info(dicom_data).numberOfFrames
+        if frame >= number_of_frames:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Frame {frame} is out of range, the file has {number_of_frames} frame(s)",
+            )
+
+    def read_frames_info(self, dicom_data: BinaryIO) -> DicomFramesInfo:
+        """
+        Read the frame count, size and encoding of a DICOM file from its header.
+        :param dicom_data: File-like object containing the DICOM file.
+        :return: DicomFramesInfo describing the pixel data.
+        """
+        dataset = pydicom.dcmread(dicom_data, stop_before_pixels=True)
+        dicom_data.seek(0)
+        frame_time = dataset.get("FrameTime")
+        return DicomFramesInfo(
+            numberOfFrames=int(dataset.get("NumberOfFrames") or 1),
+            rows=dataset.Rows,
+            columns=dataset.Columns,
+            samplesPerPixel=dataset.get("SamplesPerPixel", 1),
+            bitsAllocated=dataset.BitsAllocated,
+            photometricInterpretation=dataset.get("PhotometricInterpretation"),
+            transferSyntaxUID=dataset.file_meta.get("TransferSyntaxUID"),
+            modality=dataset.get("Modality"),
+            frameTime=float(frame_time) if frame_time is not None else None,
+        )
+
+    def render_pixel_array(
+        self,
+        pixel_array: np.ndarray,
+        params: RenderParams | None = None,
+        modality: ModalityInfo | None = None,
+    ) -> np.ndarray:
+        """
+        Turn decoded pixel data into a display-ready uint8 image.
+        :param pixel_array: Pixel array in its stored data type.
+        :param params: Output size and window; the native size and auto contrast are
+            used when omitted.
+        :param modality: Rescale and window attributes of the DICOM file.
+        :return: Windowed uint8 pixel array.
+        """
+        params = params or RenderParams()
+        with span("contrast", CONTRAST_SECONDS, window=params.window):
+            # Resize first, so that the following steps work on fewer pixels
+            if params.is_resized():
+                pixel_array = self.resize_pixel_array(pixel_array, params)
+
+            # Map the stored values to 0-255 through the window, or auto contrast
+            return render_window(
+                pixel_array,
+                modality,
+                params.window,
+                params.window_center,
+                params.window_width,
+            )
+
+    def resize_pixel_array(
+        self, pixel_array: np.ndarray, params: RenderParams
+    ) -> np.ndarray:
+        """
+        Resize an image to the requested width/height, bounded by max_size.
+        A missing width or height keeps the aspect ratio, and max_size never upscales.
+        :param pixel_array: Image as a numpy array.
+        :param params: Requested width, height and max_size.
+        :return: Resized image as a numpy array.
+        """
+        height, width = pixel_array.shape[:2]
+        target_width, target_height = self.output_size(width, height, params)
+        if (target_width, target_height) == (width, height):
+            return pixel_array
+        if pixel_array.dtype not in RESIZABLE_DTYPES:
+            pixel_array = pixel_array.astype(np.float32)
+
+        shrinking = target_width * target_height < width * height
+        return cv2.resize(
+            pixel_array,
+            (target_width, target_height),
+            interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR,
+        )
+
+    def output_size(
+        self, width: int, height: int, params: RenderParams
+    ) -> tuple[int, int]:
+        """
+        Compute the size an image is resized to by `resize_pixel_array`.
+        :param width: Width of the image.
+        :param height: Height of the image.
+        :param params: Requested width, height and max_size.
+        :return: Output width and height.
+        """
+        target_width, target_height = params.width, params.height
+        if target_width is None and target_height is None:
+            target_width, target_height = width, height
+        elif target_height is None:
+            target_height = max(1, round(height * target_width / width))
+        elif target_width is None:
+            target_width = max(1, round(width * target_height / height))
+
+        if params.max_size is not None:
+            scale = min(1.0, params.max_size / max(target_width, target_height))
+            target_width = max(1, round(target_width * scale))
+            target_height = max(1, round(target_height * scale))
+        return target_width, target_height
+
+    def encode_image(
+        self, pixel_array: np.ndarray, extension: str, quality: int | None = None
+    ) -> io.BytesIO:
+        """
+        Encode a uint8 pixel array as a PNG, JPEG or WebP image.
+        :param pixel_array: Image as a numpy array.
+        :param extension: Desired output image format ('jpeg', 'png' or 'webp').
+        :param quality: JPEG/WebP quality from 1 to 100; ignored for PNG.
+        :return: BytesIO object containing the encoded image.
+        """
         # Encode the image to the desired format
-        is_png = extension.lower() == "png"
-        _, img_encoded = cv2.imencode(".png" if is_png else ".jpeg", pixel_array)
+        extension = extension.lower()
+        if extension not in ("png", "webp"):
+            extension = "jpeg"
+        encode_params = []
+        if quality is not None and extension in QUALITY_FLAGS:
+            encode_params = [QUALITY_FLAGS[extension], quality]
+        with span("encode", ENCODE_SECONDS, format=extension):
+            _, img_encoded = cv2.imencode(f".{extension}", pixel_array, encode_params)
         if img_encoded is None:
             raise HTTPException(status_code=500, detail="Failed to encode image")
 
@@ -73,18 +722,9 @@ class DicomService:
         :param image: Input image as a numpy array.
         :return: Contrast-enhanced image as a numpy array.
         """
-        hist, _ = np.histogram(image.ravel(), bins=np.arange(257))
-        cdf = np.cumsum(hist)
-        cdf_normalized = cdf / cdf[-1]
-
-        p_low = np.argmax(cdf_normalized >= 0.01)
-        p_high = np.argmax(cdf_normalized >= 0.99)
-
-        if p_high > p_low:
-            scale = 255.0 / (p_high - p_low)
-            offset = -scale * p_low
-            image = (image.astype(np.float32) * scale + offset).clip(0, 255)
-        return image.astype(np.uint8)
+        image = image.astype(np.uint8, copy=False)
+        hist = np.bincount(image.ravel(), minlength=256)
+        return apply_lut(image, normalized_stretch_lut(hist))
 
     def create_black_image(self, extension: str) -> io.BytesIO:
         """
@@ -92,6 +732,7 @@ class DicomService:
         :param extension: Desired output image format ('jpeg' or 'png').
         :return: BytesIO object containing the black image.
         """
+        BLACK_IMAGE_FALLBACKS.labels(format=extension.lower()).inc()
         black_image = Image.new("RGB", (512, 512), (0, 0, 0))
         img_bytes = io.BytesIO()
         black_image.save(img_bytes, format=extension.upper())
@@ -0,0 +1,287 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+from pydicom.dataset import Dataset
+
+# Window center and width of the named VOI presets, in Hounsfield units
+VOI_PRESETS = {
+    "lung": (-600.0, 1500.0),
+    "mediastinum": (40.0, 400.0),
+    "brain": (40.0, 80.0),
+    "bone": (400.0, 1800.0),
+}
+WINDOW_MODES = ("auto", "dicom", *VOI_PRESETS)
+
+# Tags needed to window a frame besides the image pixel module (group 0x0028),
+# which pydicom always reads alongside the pixel data
+MODALITY_TAGS = [0x52009229]
+
+# Stored data types whose values can index a lookup table directly
+LUT_DTYPES = (np.uint8, np.int8, np.uint16, np.int16)
+
+
+class ModalityInfo(NamedTuple):
+    """
+    How to turn stored pixel values into modality units and display them.
+    `slope` and `intercept` are the modality LUT, `window_center` and
+    `window_width` the VOI window stored in the file, if any, and `invert` is set
+    for MONOCHROME1 images, where low values are displayed white.
+    """
+
+    slope: float = 1.0
+    intercept: float = 0.0
+    window_center: float | None = None
+    window_width: float | None = None
+    invert: bool = False
+
+    @classmethod
+    def from_dataset(cls, dataset: Dataset) -> "ModalityInfo":
+        """
+        Read the modality and VOI LUT attributes of a dataset.
+
+        Enhanced multi-frame files keep them in the shared functional groups
+        instead of the top-level dataset.
+
+        Args:
+            dataset (Dataset): Dataset holding at least the image pixel module.
+
+        Returns:
+            ModalityInfo: Rescale, window and polarity of the image.
+        """
+        rescale = voi = dataset
+        shared = dataset.get("SharedFunctionalGroupsSequence")
+        if shared:
+            rescale = _first_item(
+                shared[0], "PixelValueTransformationSequence", rescale
+            )
+            voi = _first_item(shared[0], "FrameVOILUTSequence", voi)
+
+        return cls(
+            slope=float(rescale.get("RescaleSlope", 1.0) or 1.0),
+            intercept=float(rescale.get("RescaleIntercept", 0.0) or 0.0),
+            window_center=_first_value(voi.get("WindowCenter")),
+            window_width=_first_value(voi.get("WindowWidth")),
+            invert=dataset.get("PhotometricInterpretation") == "MONOCHROME1",
+        )
+
+
+def render_window(
+    pixel_array: np.ndarray,
+    modality: ModalityInfo | None = None,
+    mode: str = "auto",
+    center: float | None = None,
+    width: float | None = None,
+) -> np.ndarray:
+    """
+    Map stored pixel values to a displayable uint8 image through a lookup table.
+
+    `auto` stretches the 1st to 99th percentile of the min-max normalized image,
+    `dicom` uses the window stored in the file (falling back to `auto`), and the
+    preset names use the windows of `VOI_PRESETS`. An explicit center and width
+    override the mode. Integer images of up to 16 bits are mapped with a single
+    table lookup per pixel; other data types are converted in floating point.
+
+    Args:
+        pixel_array (np.ndarray): Pixel array in its stored data type.
+        modality (ModalityInfo | None): Rescale, window and polarity of the image.
+        mode (str): One of `WINDOW_MODES`.
+        center (float | None): Window center in modality units.
+        width (float | None): Window width in modality units.
+
+    Returns:
+        np.ndarray: The uint8 image.
+    """
+    modality = modality or ModalityInfo()
+    if center is None or width is None:
+        center, width = _window_of_mode(mode, modality)
+    # Windows only make sense for grayscale images
+    if pixel_array.ndim == 3 and pixel_array.shape[-1] > 1:
+        center = width = None
+
+    if pixel_array.dtype.type not in LUT_DTYPES:
+        return _render_float(pixel_array, modality, center, width)
+
+    if center is None:
+        lut = build_auto_lut(pixel_array)
+    else:
+        lut = build_window_lut(
+            pixel_array.dtype.str,
+            modality.slope,
+            modality.intercept,
+            center,
+            width,
+            modality.invert,
+        )
+    return apply_lut(pixel_array, lut)
+
+
+def apply_lut(pixel_array: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """
+    Look up every pixel of an integer image in a table built by this module.
+
+    Args:
+        pixel_array (np.ndarray): Image with one of the `LUT_DTYPES`.
+        lut (np.ndarray): uint8 table indexed by the unsigned bit pattern.
+
+    Returns:
+        np.ndarray: The uint8 image.
+    """
+    if pixel_array.dtype == np.uint8:
+        return cv2.LUT(pixel_array, lut)
+    # Signed values are looked up through their unsigned bit pattern, so the
+    # table covers the whole range without an offset pass over the image
+    unsigned = pixel_array.view(np.dtype(pixel_array.dtype.str.replace("i", "u")))
+    return np.take(lut, unsigned)
+
+
+def build_auto_lut(pixel_array: np.ndarray) -> np.ndarray:
+    """
+    Build the auto-contrast table of an integer image.
+
+    The table composes the min-max normalization to 0-255 with a linear stretch
+    of the 1st to 99th percentile, both derived from a single histogram of the
+    stored values.
+
+    Args:
+        pixel_array (np.ndarray): Image with one of the `LUT_DTYPES`.
+
+    Returns:
+        np.ndarray: uint8 table indexed by the unsigned bit pattern.
+    """
+    domain = _lut_domain(pixel_array.dtype.str)
+    if pixel_array.dtype == np.uint8:
+        counts = np.bincount(pixel_array.ravel(), minlength=256)
+        normalized = np.arange(256, dtype=np.uint8)
+    else:
+        unsigned = pixel_array.view(np.dtype(pixel_array.dtype.str.replace("i", "u")))
+        counts = np.bincount(unsigned.ravel(), minlength=domain.size)
+        present = domain[counts > 0]
+        low, high = int(present.min()), int(present.max())
+        # Same single-precision fused multiply-add as cv2.normalize, so that
+        # values halfway between two levels round the same way
+        scale = 255.0 / (high - low) if high > low else 0.0
+        normalized = domain * np.float32(scale) + np.float32(-low * scale)
+        normalized = np.rint(normalized.astype(np.float32)).clip(0, 255)
+        normalized = normalized.astype(np.uint8)
+        counts = np.bincount(normalized, weights=counts, minlength=256)
+
+    return normalized_stretch_lut(counts)[normalized]
+
+
+def normalized_stretch_lut(hist: np.ndarray) -> np.ndarray:
+    """
+    Build the 256-entry table stretching the 1st to 99th percentile to 0-255.
+
+    Args:
+        hist (np.ndarray): Histogram of a uint8 image.
+
+    Returns:
+        np.ndarray: uint8 table, the identity if the image is nearly uniform.
+    """
+    cdf = np.cumsum(hist)
+    cdf_normalized = cdf / cdf[-1]
+
+    p_low = np.argmax(cdf_normalized >= 0.01)
+    p_high = np.argmax(cdf_normalized >= 0.99)
+
+    levels = np.arange(256, dtype=np.float32)
+    if p_high > p_low:
+        scale = 255.0 / (p_high - p_low)
+        offset = -scale * p_low
+        levels = (levels * scale + offset).clip(0, 255)
+    return levels.astype(np.uint8)
+
+
+@lru_cache(maxsize=64)
+def build_window_lut(
+    dtype: str,
+    slope: float,
+    intercept: float,
+    center: float,
+    width: float,
+    invert: bool = False,
+) -> np.ndarray:
+    """
+    Build the table applying the modality rescale and a linear VOI window.
+
+    The window follows the DICOM linear VOI LUT function (PS3.3 C.11.2.1.2.1).
+    Tables only depend on their arguments, so they are cached and shared.
+
+    Args:
+        dtype (str): Stored data type, as `np.dtype.str`.
+        slope (float): Rescale slope.
+        intercept (float): Rescale intercept.
+        center (float): Window center in modality units.
+        width (float): Window width in modality units.
+        invert (bool): Display low values white (MONOCHROME1).
+
+    Returns:
+        np.ndarray: uint8 table indexed by the unsigned bit pattern.
+    """
+    values = _lut_domain(dtype) * slope + intercept
+    lut = _window(values, center, width)
+    if invert:
+        lut = 255 - lut
+    lut.flags.writeable = False
+    return lut
+
+
+def _window(values: np.ndarray, center: float, width: float) -> np.ndarray:
+    if width <= 1:
+        return np.where(values > center - 0.5, 255, 0).astype(np.uint8)
+    scaled = ((values - (center - 0.5)) / (width - 1) + 0.5).clip(0, 1)
+    return np.rint(scaled * 255).astype(np.uint8)
+
+
+def _render_float(
+    pixel_array: np.ndarray,
+    modality: ModalityInfo,
+    center: float | None,
+    width: float | None,
+) -> np.ndarray:
+    if center is None:
+        normalized = cv2.normalize(pixel_array, None, 0, 255, cv2.NORM_MINMAX)
+        image = np.uint8(normalized)
+        hist = np.bincount(image.ravel(), minlength=256)
+        return cv2.LUT(image, normalized_stretch_lut(hist))
+
+    values = pixel_array.astype(np.float64) * modality.slope + modality.intercept
+    image = _window(values, center, width)
+    return 255 - image if modality.invert else image
+
+
+def _window_of_mode(
+    mode: str, modality: ModalityInfo
+) -> tuple[float | None, float | None]:
+    if mode in VOI_PRESETS:
+        return VOI_PRESETS[mode]
+    if mode == "dicom":
+        return modality.window_center, modality.window_width
+    return None, None
+
+
+@lru_cache(maxsize=8)
+def _lut_domain(dtype: str) -> np.ndarray:
+    # Stored value of every unsigned bit pattern, in index order
+    dtype = np.dtype(dtype)
+    unsigned = np.dtype(dtype.str.replace("i", "u"))
+    domain = np.arange(np.iinfo(unsigned).max + 1, dtype=unsigned).view(dtype)
+    domain = domain.astype(np.float64)
+    domain.flags.writeable = False
+    return domain
+
+
+def _first_item(dataset: Dataset, keyword: str, default: Dataset) -> Dataset:
+    sequence = dataset.get(keyword)
+    return sequence[0] if sequence else default
+
+
+def _first_value(value) -> float | None:
+    if value is None or value == "":
+        return None
+    if not isinstance(value, (int, float)):
+        # Multi-valued windows list alternatives; the first one is the default
+        value = value[0]
+    return float(value)
@@ -0,0 +1,70 @@
+import asyncio
+import importlib.util
+
+import httpx
+
+from src.config import Config
+
+
+class HttpClientPool:
+    """
+    Process-wide pooled HTTP client.
+
+    One `httpx.AsyncClient` is shared by every request made from the process, so
+    connections to the file host and to the backend are kept alive and reused
+    instead of paying a new TCP and TLS handshake per call. The client is bound
+    to the event loop it was created on; `startup` and `shutdown` are called
+    from the FastAPI lifespan and from the Celery worker process hooks.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._loop = None
+
+    def get(self) -> httpx.AsyncClient:
+        """
+        Return the shared client, creating it on first use.
+
+        Returns:
+            httpx.AsyncClient: Client bound to the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = self._create_client()
+            self._loop = loop
+        return self._client
+
+    async def startup(self):
+        """
+        Create the shared client on the running event loop.
+        """
+        self.get()
+
+    async def shutdown(self):
+        """
+        Close the shared client and its pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = Config.HTTP2 and importlib.util.find_spec("h2") is not None
+        if Config.HTTP2 and not http2:
+            print("HTTP/2 requested but the 'h2' package is not installed.")
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT
+            ),
+        )
+
+
+http_client_pool = HttpClientPool()
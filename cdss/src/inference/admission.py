@@ -0,0 +1,366 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import redis
+from celery import states
+from fastapi import HTTPException
+from kombu.exceptions import ChannelError
+
+from src.config import Config
+from src.inference.client import celery_app, enqueue_task
+from src.inference.status import read_task_status
+from src.metrics import SUBMISSIONS
+
+# Submissions of an API key are counted in fixed windows of this many seconds
+RATE_WINDOW_SECONDS = 60
+
+
+class RedisSubmissionStore:
+    """
+    Submitted task IDs and submission counts shared by every API process
+    through Redis.
+
+    Attributes:
+        client (redis.Redis): Client of the Redis server.
+        ttl_seconds (int): How long the task of a prediction ID is remembered.
+        prefix (str): Prefix of the keys.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "submission:"):
+        """
+        Initialize the store without connecting yet.
+
+        Args:
+            url (str): URL of the Redis server.
+            ttl_seconds (int): How long the task of a prediction ID is remembered.
+            prefix (str): Prefix of the keys.
+        """
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, prediction_id: str) -> str | None:
+        task_id = self.client.get(f"{self.prefix}task:{prediction_id}")
+        return None if task_id is None else task_id.decode()
+
+    def claim(
+        self, prediction_id: str, task_id: str, replace: str | None
+    ) -> str | None:
+        key = f"{self.prefix}task:{prediction_id}"
+
+        def swap(pipe: redis.client.Pipeline) -> str | None:
+            current = pipe.get(key)
+            if current is not None and current.decode() != replace:
+                return current.decode()
+            pipe.multi()
+            pipe.set(key, task_id, ex=self.ttl_seconds)
+            return None
+
+        return self.client.transaction(swap, key, value_from_callable=True)
+
+    def release(self, prediction_id: str):
+        self.client.delete(f"{self.prefix}task:{prediction_id}")
+
+    def hit(self, counter: str, window_seconds: int) -> int:
+        key = f"{self.prefix}count:{counter}"
+        pipe = self.client.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, window_seconds)
+        return pipe.execute()[0]
+
+
+class LocalSubmissionStore:
+    """
+    Submitted task IDs and submission counts of the current process only.
+
+    Attributes:
+        ttl_seconds (int): How long the task of a prediction ID is remembered.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        # Prediction ID to task ID and expiry, oldest first
+        self._tasks = OrderedDict()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, prediction_id: str) -> str | None:
+        with self._lock:
+            self._expire()
+            task_id, _ = self._tasks.get(prediction_id, (None, None))
+            return task_id
+
+    def claim(
+        self, prediction_id: str, task_id: str, replace: str | None
+    ) -> str | None:
+        with self._lock:
+            self._expire()
+            current, _ = self._tasks.get(prediction_id, (None, None))
+            if current is not None and current != replace:
+                return current
+            self._tasks.pop(prediction_id, None)
+            self._tasks[prediction_id] = (task_id, time.time() + self.ttl_seconds)
+            return None
+
+    def release(self, prediction_id: str):
+        with self._lock:
+            self._tasks.pop(prediction_id, None)
+
+    def hit(self, counter: str, window_seconds: int) -> int:
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, end) in self._counts.items() if end <= now]:
+                del self._counts[key]
+            count, end = self._counts.get(counter, (0, now + window_seconds))
+            self._counts[counter] = (count + 1, end)
+            return count + 1
+
+    def _expire(self):
+        now = time.time()
+        while self._tasks and next(iter(self._tasks.values()))[1] <= now:
+            self._tasks.popitem(last=False)
+
+
+class SubmissionControl:
+    """
+    Admission control of the prediction tasks submitted to the queues.
+
+    A prediction ID is enqueued once: submitting it again returns the task
+    already enqueued for it, unless that task failed or was revoked, so client
+    retries do not pile up duplicate work. Submissions are rate limited per API
+    key, and rejected while the queue of the model holds too many tasks, so
+    that an overload is pushed back to the clients with a 429 and a
+    Retry-After instead of growing the queue and the wait of every task in it.
+
+    Store errors are reported and the submission is let through; admission
+    control never fails a submission the queue could take.
+
+    Attributes:
+        store (RedisSubmissionStore | LocalSubmissionStore): Submitted task
+            IDs and submission counts.
+        rate_limit (int): Submissions per API key and minute, 0 for no limit.
+        max_queue_depth (int): Queued tasks above which a model queue takes no
+            more submissions, 0 for no limit.
+    """
+
+    def __init__(
+        self,
+        store: RedisSubmissionStore | LocalSubmissionStore,
+        rate_limit: int,
+        max_queue_depth: int,
+    ):
+        """
+        Initialize the admission control.
+
+        Args:
+            store (RedisSubmissionStore | LocalSubmissionStore): Submitted task
+                IDs and submission counts.
+            rate_limit (int): Submissions per API key and minute, 0 for no limit.
+            max_queue_depth (int): Queued tasks above which a model queue takes
+                no more submissions, 0 for no limit.
+        """
+        self.store = store
+        self.rate_limit = rate_limit
+        self.max_queue_depth = max_queue_depth
+        # Queue name to the time it was measured and its depth
+        self._depths = {}
+        self._lock = threading.Lock()
+
+    def check_rate(self, api_key: str):
+        """
+        Count a submission of an API key against its rate limit.
+
+        Args:
+            api_key (str): API key of the request.
+
+        Raises:
+            HTTPException: 429 with the seconds until the next window if the key
+                has used up its submissions.
+        """
+        if not self.rate_limit:
+            return
+        now = time.time()
+        window = int(now // RATE_WINDOW_SECONDS)
+        # The key itself is not stored
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        try:
+            count = self.store.hit(f"{key_hash}:{window}", RATE_WINDOW_SECONDS)
+        except redis.RedisError as e:
+            print(f"Submission rate check failed: {e}")
+            return
+        if count > self.rate_limit:
+            SUBMISSIONS.labels(outcome="rate_limited").inc()
+            retry_after = math.ceil((window + 1) * RATE_WINDOW_SECONDS - now)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many prediction submissions",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+    def check_queue(self, queue: str):
+        """
+        Check that a queue can take another task.
+
+        Args:
+            queue (str): Name of the queue.
+
+        Raises:
+            HTTPException: 429 with SUBMISSION_RETRY_AFTER_SECONDS if the queue
+                holds `max_queue_depth` tasks or more.
+        """
+        if not self.max_queue_depth:
+            return
+        if self.queue_depth(queue) >= self.max_queue_depth:
+            SUBMISSIONS.labels(outcome="queue_full").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many predictions are queued",
+                headers={"Retry-After": str(Config.SUBMISSION_RETRY_AFTER_SECONDS)},
+            )
+
+    def queue_depth(self, queue: str) -> int:
+        """
+        Number of tasks waiting in a queue, measured on the broker at most every
+        SUBMISSION_QUEUE_CHECK_SECONDS.
+
+        Args:
+            queue (str): Name of the queue.
+
+        Returns:
+            int: Tasks waiting in the queue, not counting those reserved by
+                workers. 0 if the queue does not exist yet.
+        """
+        with self._lock:
+            measured_at, depth = self._depths.get(queue, (None, 0))
+            if (
+                measured_at is not None
+                and time.monotonic() - measured_at
+                < Config.SUBMISSION_QUEUE_CHECK_SECONDS
+            ):
+                return depth
+
+        try:
+            with celery_app.connection_for_read() as connection:
+                depth = connection.default_channel.queue_declare(
+                    queue=queue, passive=True
+                ).message_count
+        except ChannelError:
+            depth = 0
+        except Exception as e:
+            print(f"Failed to measure the depth of the {queue} queue: {e}")
+        with self._lock:
+            self._depths[queue] = (time.monotonic(), depth)
+        return depth
+
+    def submit(
+        self,
+        prediction_id: str | None,
+        task_name: str,
+        *args,
+        queue: str | None = None,
+        priority: str = "interactive",
+    ) -> str:
+        """
+        Enqueue the task of a prediction, unless one is already enqueued for it.
+
+        Tasks without a prediction ID, e.g. series predictions nobody records,
+        are never deduplicated.
+
+        Args:
+            prediction_id (str | None): The prediction ID the task updates.
+            task_name (str): Fully qualified name of the registered task.
+            *args: Positional arguments forwarded to the task.
+            queue (str | None): Queue to send the task to, the default queue if None.
+            priority (str): 'interactive' or 'bulk', see `enqueue_task`.
+
+        Returns:
+            str: ID of the enqueued task, or of the task already enqueued for the
+                prediction.
+
+        Raises:
+            HTTPException: 429 if the queue is full, see `check_queue`.
+        """
+        if prediction_id is None:
+            self.check_queue(queue or celery_app.conf.task_default_queue)
+            task = enqueue_task(task_name, *args, queue=queue, priority=priority)
+            SUBMISSIONS.labels(outcome="enqueued").inc()
+            return task.id
+
+        replace = None
+        try:
+            existing = self.store.get(prediction_id)
+        except redis.RedisError as e:
+            print(f"Submission lookup failed: {e}")
+            existing = None
+        if existing is not None:
+            try:
+                state = read_task_status(existing)["state"]
+            except Exception as e:
+                # The task is unknown, so it is replaced like a failed one
+                print(f"Submission status lookup failed: {e}")
+                state = states.FAILURE
+            if state not in states.PROPAGATE_STATES:
+                SUBMISSIONS.labels(outcome="duplicate").inc()
+                return existing
+            # Retry a failed prediction with a new task
+            replace = existing
+
+        self.check_queue(queue or celery_app.conf.task_default_queue)
+
+        task_id = str(uuid.uuid4())
+        try:
+            existing = self.store.claim(prediction_id, task_id, replace)
+        except redis.RedisError as e:
+            print(f"Submission claim failed: {e}")
+            existing = None
+        if existing is not None:
+            # A concurrent submission of the prediction won
+            SUBMISSIONS.labels(outcome="duplicate").inc()
+            return existing
+
+        try:
+            enqueue_task(
+                task_name, *args, queue=queue, priority=priority, task_id=task_id
+            )
+        except Exception:
+            try:
+                self.store.release(prediction_id)
+            except redis.RedisError as e:
+                print(f"Submission release failed: {e}")
+            raise
+        SUBMISSIONS.labels(outcome="enqueued").inc()
+        return task_id
+
+
+def create_submission_control() -> SubmissionControl:
+    """
+    Build the admission control selected by the settings.
+
+    `auto` keeps the submissions in the Celery result backend when it is a
+    Redis server, so that every API process shares them, and in the process
+    otherwise.
+
+    Returns:
+        SubmissionControl: The configured admission control.
+    """
+    mode = Config.SUBMISSION_STORE
+    redis_url = Config.SUBMISSION_REDIS_URL or Config.CELERY_RESULT_BACKEND
+    if mode == "auto":
+        mode = "redis" if redis_url.startswith(("redis://", "rediss://")) else "local"
+
+    if mode == "redis":
+        store = RedisSubmissionStore(redis_url, Config.SUBMISSION_DEDUP_TTL_SECONDS)
+    else:
+        store = LocalSubmissionStore(Config.SUBMISSION_DEDUP_TTL_SECONDS)
+    return SubmissionControl(
+        store,
+        Config.SUBMISSION_RATE_LIMIT_PER_MINUTE,
+        Config.SUBMISSION_MAX_QUEUE_DEPTH,
+    )
+
+
+submission_control = create_submission_control()
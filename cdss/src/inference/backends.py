@@ -0,0 +1,185 @@
+import os
+from typing import Callable
+
+import torch
+
+from src.inference.specs import ModelSpec
+
+ONNX_INPUT = "images"
+ONNX_OUTPUT = "logits"
+ONNX_OPSET = 17
+
+TORCHSCRIPT_BACKENDS = ("torchscript", "int8_dynamic")
+
+
+class EagerRunner:
+    """
+    Runs a model module, eager or TorchScript, on batches of images.
+
+    Attributes:
+        model (torch.nn.Module): The model, in evaluation mode.
+        device (torch.device): Device the inputs are moved to.
+        channels_last (bool): Whether inputs are converted to channels-last
+            memory format, which suits the CPU convolution kernels better.
+    """
+
+    def __init__(
+        self, model: torch.nn.Module, device: torch.device, channels_last: bool
+    ):
+        """
+        Initialize the runner.
+
+        Args:
+            model (torch.nn.Module): The model, in evaluation mode.
+            device (torch.device): Device the model lives on.
+            channels_last (bool): Whether to run in channels-last memory format.
+        """
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        self.model = model
+        self.device = device
+        self.channels_last = channels_last
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        """
+        Run the model on a batch of preprocessed images.
+
+        Args:
+            images (torch.Tensor): Tensor of shape (batch_size, 3, height, width).
+
+        Returns:
+            torch.Tensor: Raw logits of shape (batch_size, num_classes).
+        """
+        images = images.to(self.device)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        with torch.no_grad():
+            return self.model(images)
+
+    @property
+    def parameter_bytes(self) -> int:
+        """
+        Size of the model parameters and buffers in bytes.
+        """
+        tensors = [*self.model.parameters(), *self.model.buffers()]
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class TorchScriptRunner(EagerRunner):
+    """
+    Runs a frozen TorchScript artifact, plain or with int8 dynamic quantization,
+    after fusing and optimizing its graph for inference.
+
+    Attributes:
+        path (str): Path of the artifact.
+    """
+
+    def __init__(self, path: str, channels_last: bool):
+        """
+        Load the artifact.
+
+        Args:
+            path (str): Path of the TorchScript artifact.
+            channels_last (bool): Whether to run in channels-last memory format.
+        """
+        model = torch.jit.optimize_for_inference(
+            torch.jit.load(path, map_location="cpu")
+        )
+        super().__init__(model, torch.device("cpu"), channels_last)
+        self.path = path
+
+    @property
+    def parameter_bytes(self) -> int:
+        """
+        Size of the artifact in bytes, frozen modules hold their weights as
+        constants rather than parameters.
+        """
+        return os.path.getsize(self.path)
+
+
+class OnnxRunner:
+    """
+    Runs an ONNX artifact, plain or with int8 static quantization, with ONNX
+    Runtime on the CPU.
+
+    Attributes:
+        path (str): Path of the artifact.
+        device (torch.device): Always the CPU.
+        session (onnxruntime.InferenceSession): The inference session.
+    """
+
+    def __init__(self, path: str, num_threads: int):
+        """
+        Create the inference session.
+
+        Args:
+            path (str): Path of the ONNX artifact.
+            num_threads (int): Intra-op threads of the session.
+        """
+        # Imported here so that workers serving only torch backends do not load it
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        self.path = path
+        self.device = torch.device("cpu")
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, images: torch.Tensor) -> torch.Tensor:
+        """
+        Run the model on a batch of preprocessed images.
+
+        Args:
+            images (torch.Tensor): Tensor of shape (batch_size, 3, height, width).
+
+        Returns:
+            torch.Tensor: Raw logits of shape (batch_size, num_classes).
+        """
+        inputs = {ONNX_INPUT: images.contiguous().numpy()}
+        return torch.from_numpy(self.session.run([ONNX_OUTPUT], inputs)[0])
+
+    @property
+    def parameter_bytes(self) -> int:
+        """
+        Size of the artifact in bytes.
+        """
+        return os.path.getsize(self.path)
+
+
+def load_runner(
+    spec: ModelSpec,
+    load_model: Callable[[torch.device], torch.nn.Module],
+    num_threads: int,
+):
+    """
+    Build the runner of the inference backend selected for a model.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+        load_model (Callable[[torch.device], torch.nn.Module]): Loads the eager
+            model with its weights on a device.
+        num_threads (int): Intra-op threads of ONNX Runtime sessions.
+
+    Returns:
+        EagerRunner | OnnxRunner: Callable from a batch of images to logits.
+    """
+    if spec.backend == "eager":
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        return EagerRunner(load_model(device), device, spec.channels_last)
+
+    path = spec.artifact_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Missing {spec.backend} artifact '{path}' of model '{spec.name}', export "
+            f"it with `python -m src.inference.export --model {spec.name} "
+            f"--backend {spec.backend}`"
+        )
+    if spec.backend in TORCHSCRIPT_BACKENDS:
+        return TorchScriptRunner(path, spec.channels_last)
+    return OnnxRunner(path, num_threads)
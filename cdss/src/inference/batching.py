@@ -0,0 +1,217 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable
+
+import torch
+
+
+class BatchingEngine:
+    """
+    Dynamic micro-batching in front of a classification service.
+
+    Requests submitted from any thread (Celery tasks, FastAPI handlers, scripts)
+    are collected until either `max_batch_size` items are waiting or
+    `max_wait_ms` has passed since the first one arrived. They are then stacked
+    into a single tensor, run through one forward pass, and each caller gets its
+    own result back through a future.
+
+    Attributes:
+        name (str): Model name, used for reporting.
+        max_batch_size (int): Largest batch passed to the model.
+        max_wait_ms (float): Longest time the first request of a batch waits.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[torch.Tensor], list],
+        preprocess: Callable[..., torch.Tensor] | None = None,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        name: str = "model",
+    ):
+        """
+        Initialize the batching engine.
+
+        Args:
+            predict_batch (Callable): Runs the model on a (N, C, H, W) tensor and
+                returns one result per item.
+            preprocess (Callable | None): Turns a submitted input into a (C, H, W)
+                tensor. It runs in the submitting thread, outside the batch loop.
+            max_batch_size (int): Largest batch passed to `predict_batch`.
+            max_wait_ms (float): Longest time to wait for a batch to fill up.
+            name (str): Model name, used for reporting.
+        """
+        self.name = name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._predict_batch = predict_batch
+        self._preprocess = preprocess
+        self._histogram = Counter()
+        # Moving average of the time of a forward pass
+        self._batch_seconds = 0.0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def submit(self, image) -> Future:
+        """
+        Queue a single image for prediction.
+
+        Args:
+            image: Tensor of shape (C, H, W), or any input accepted by `preprocess`.
+
+        Returns:
+            Future: Resolves to the result for this image.
+        """
+        if self._preprocess is not None:
+            image = self._preprocess(image)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, image, timeout: float | None = None):
+        """
+        Predict a single image, blocking until its batch has run.
+
+        Args:
+            image: Tensor of shape (C, H, W), or any input accepted by `preprocess`.
+            timeout (float | None): Seconds to wait for the result.
+
+        Returns:
+            The result produced by `predict_batch` for this image.
+        """
+        return self.submit(image).result(timeout=timeout)
+
+    async def predict_async(self, image):
+        """
+        Predict a single image from a coroutine without blocking the event loop.
+
+        Args:
+            image: Tensor of shape (C, H, W), or any input accepted by `preprocess`.
+
+        Returns:
+            The result produced by `predict_batch` for this image.
+        """
+        return await asyncio.wrap_future(self.submit(image))
+
+    def pending(self) -> int:
+        """
+        Number of requests waiting to be batched.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def estimated_wait(self, queued: int = 0) -> float:
+        """
+        Estimate how long a request submitted now waits for its result.
+
+        Args:
+            queued (int): Requests about to be submitted ahead of it.
+
+        Returns:
+            float: Seconds until its batch has run, from the queue depth and
+                the recent forward pass times.
+        """
+        batches = (self.pending() + queued) // self.max_batch_size + 1
+        return batches * self._batch_seconds + self.max_wait_ms / 1000
+
+    def batch_size_histogram(self) -> dict[int, int]:
+        """
+        Number of forward passes run per batch size since startup.
+        """
+        with self._lock:
+            return dict(sorted(self._histogram.items()))
+
+    def stop(self):
+        """
+        Stop the batching thread once the already queued requests are served.
+        Requests submitted while it stops fail.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._queue.put(None)
+            self._thread.join()
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[1].set_exception(
+                        RuntimeError(f"The {self.name} batching engine stopped")
+                    )
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so a Celery child process that inherits an
+        # engine from its parent starts its own batching thread on first use.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(
+                target=self._run, name=f"batching-{self.name}", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+
+            futures = [future for _, future in batch]
+            start = time.perf_counter()
+            try:
+                results = list(
+                    self._predict_batch(torch.stack([image for image, _ in batch]))
+                )
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name} returned {len(results)} results for a batch "
+                        f"of {len(batch)}"
+                    )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._histogram[len(batch)] += 1
+                self._batch_seconds = (
+                    elapsed
+                    if not self._batch_seconds
+                    else 0.8 * self._batch_seconds + 0.2 * elapsed
+                )
+            for future, result in zip(futures, results):
+                future.set_result(result)
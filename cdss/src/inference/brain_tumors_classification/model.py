@@ -48,6 +48,7 @@ class BrainTumorClassifier(nn.Module):
             torch.Tensor: Output tensor of shape (batch_size, num_classes).
         """
         x = self.features(x)
-        x = x.view(x.size(0), -1)
+        # reshape rather than view, so that channels-last inputs work too
+        x = x.reshape(x.size(0), -1)
         x = self.classifier(x)
         return x
@@ -1,36 +1,219 @@
-from celery import Celery
 import asyncio
-import httpx
+import os
+from concurrent.futures import Future
+
+import numpy as np
 import torch
+from celery.signals import (
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_shutdown,
+)
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import multiprocess, start_http_server
 
+from src.dicom.schema import RenderParams
 from src.dicom.service import DicomService
-from src.inference.brain_tumors_classification.service import (
-    BrainTumorClassificationService,
+
+from src.config import Config
+from src.http_client import http_client_pool
+from src.inference.client import (
+    celery_app,
+    BRAIN_TUMORS_MODEL,
+    CHEST_CT_MODEL,
+    PREDICT_TASK,
+    PREDICT_BRAIN_TUMORS_TASK,
+    PREDICT_CHEST_CTSCAN_TASK,
+    PREDICT_SERIES_TASK,
+)
+from src.inference.pipeline import WorkerPipeline
+from src.inference.registry import model_registry
+from src.inference.result_cache import prediction_cache
+from src.inference.series import aggregate_series
+from src.inference.status import report_stage
+from src.inference.threads import (
+    set_inter_op_threads,
+    set_intra_op_threads,
+    thread_budget,
 )
-from src.inference.chest_ct_cancer_classification.service import (
-    ChestCTCancerClassificationService,
+from src.inference.writeback import FAILED_PAYLOAD, result_writer
+from src.metrics import (
+    PIPELINE_IN_FLIGHT,
+    PREDICTION_FAILURES,
+    clear_multiprocess_dir,
+    metrics_registry,
+    span,
+    trace,
 )
 
-from src.config import Config
+if Config.WORKER_MODE == "pipelined":
+    # Defaults, overridden by `-P` and `--concurrency` on the command line
+    celery_app.conf.worker_pool = "threads"
+    celery_app.conf.worker_concurrency = Config.PIPELINE_WINDOW
 
-torch.set_num_threads(1)
+dicom_service = DicomService()
+worker_loop = None
+pipeline = None
+# Set in the parent worker process, inherited by the forked pool
+worker_models = None
+worker_threads = 1
 
-celery_app = Celery(
-    "tasks",
-    broker=Config.CELERY_BROKER_URL,
-    backend=Config.CELERY_RESULT_BACKEND,
-)
 
-dicom_service = DicomService()
-brain_tumor_service = None
-ct_scan_service = None
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the long-lived event loop owned by this worker process.
 
+    Returns:
+        asyncio.AbstractEventLoop: The loop all task coroutines run on.
+    """
+    global worker_loop
+    if worker_loop is None or worker_loop.is_closed():
+        worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(worker_loop)
+    return worker_loop
 
-async def update_prediction_result(
-    prediction_id: str, prediction: str, probability: float
-):
+
+def run_async(coroutine):
     """
-    Update the prediction result in the backend.
+    Run a coroutine to completion on the worker process event loop, or on the
+    pipeline loop in the pipelined mode.
+
+    Args:
+        coroutine: The coroutine to run.
+
+    Returns:
+        The coroutine's result.
+    """
+    if pipeline is not None:
+        return pipeline.run(coroutine)
+    return get_worker_loop().run_until_complete(coroutine)
+
+
+def start_pipeline(model_names: list[str] | None = None):
+    """
+    Start the event loop of the pipelined mode and load and warm up the models.
+
+    Args:
+        model_names (list[str] | None): Models to load, all of them if None.
+    """
+    global pipeline
+    pipeline = WorkerPipeline(
+        Config.PIPELINE_DOWNLOAD_CONCURRENCY,
+        Config.PIPELINE_DECODE_WORKERS,
+    )
+    pipeline.start()
+    run_async(http_client_pool.startup())
+    result_writer.start()
+
+    if Config.MODEL_PRELOAD != "lazy":
+        model_registry.load_all(model_names)
+        if Config.MODEL_WARMUP:
+            model_registry.warm_up_all()
+
+
+def stop_pipeline():
+    """
+    Send the due write-backs, close the pooled HTTP client and stop the event
+    loop of the pipelined mode.
+    """
+    global pipeline
+    if pipeline is not None:
+        result_writer.stop()
+        run_async(http_client_pool.shutdown())
+        pipeline.stop()
+        pipeline = None
+
+
+@worker_init.connect
+def init_worker(sender, **kwargs):
+    """
+    Start the metrics exporter, budget the inference threads and load the
+    models in the parent worker process, before the pool is forked.
+
+    Only the models whose queues the worker consumes from, as selected with
+    `-Q`, are loaded. In the pipelined mode, the whole worker is a single
+    process with one inference stage per model, and the stages, which run
+    concurrently, share the cores.
+    """
+    global worker_models, worker_threads
+    pipelined = Config.WORKER_MODE == "pipelined"
+    if pipelined and sender.pool_cls.__module__ != "celery.concurrency.thread":
+        print("The pipelined worker mode needs the threads pool, running in sequence")
+        pipelined = False
+
+    if Config.METRICS_ENABLED and Config.WORKER_METRICS_PORT is not None:
+        clear_multiprocess_dir()
+        start_http_server(Config.WORKER_METRICS_PORT, registry=metrics_registry())
+
+    queues = sender.app.amqp.queues.consume_from
+    worker_models = [
+        name for name, spec in model_registry.specs.items() if spec.task_queue in queues
+    ]
+    # Each inference stage of the pipeline runs a forward pass at the same time
+    worker_threads, inter_op_threads = thread_budget(
+        len(worker_models) if pipelined else sender.concurrency
+    )
+    set_inter_op_threads(inter_op_threads)
+    set_intra_op_threads(worker_threads)
+    print(
+        f"Serving models {worker_models} from queues {sorted(queues)} with "
+        f"{worker_threads} intra-op and {inter_op_threads} inter-op threads "
+        f"per task"
+    )
+
+    if pipelined:
+        start_pipeline(worker_models)
+    elif Config.MODEL_PRELOAD == "parent":
+        # Weights only: a forward pass would start thread pools that do not
+        # survive the fork, so warming up is left to each child
+        model_registry.load_all(worker_models)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """
+    Create the event loop and pooled HTTP client of a freshly forked worker,
+    start its result writer, and load and warm up its models.
+    """
+    global worker_loop
+    # A loop inherited from the parent process must not be reused after fork
+    worker_loop = None
+    run_async(http_client_pool.startup())
+    result_writer.start()
+    set_intra_op_threads(worker_threads)
+
+    if Config.MODEL_PRELOAD != "lazy":
+        model_registry.load_all(worker_models)
+        if Config.MODEL_WARMUP:
+            model_registry.warm_up_all()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """
+    Send the due write-backs, and close the pooled HTTP client and the event
+    loop of a worker process.
+    """
+    result_writer.stop()
+    if worker_loop is not None and not worker_loop.is_closed():
+        run_async(http_client_pool.shutdown())
+        worker_loop.close()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+@worker_shutdown.connect
+def shutdown_worker(**kwargs):
+    """
+    Stop the pipeline of a worker in the pipelined mode.
+    """
+    stop_pipeline()
+
+
+def update_prediction_result(prediction_id: str, prediction: str, probability: float):
+    """
+    Queue the prediction result for write-back to the backend.
 
     Args:
         prediction_id (str): The prediction ID.
@@ -40,112 +223,323 @@ async def update_prediction_result(
     Returns:
         None
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.patch(
-                f"{Config.BACKEND_URL}/cdss/{prediction_id}",
-                json={"result": prediction, "probability": probability},
-                headers={"x-api-key": Config.API_KEY},
-            )
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"Request failed: {e}")
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
+    result_writer.submit(
+        prediction_id, {"result": prediction, "probability": probability}
+    )
 
 
-async def fail_prediction(prediction_id: str):
+def fail_prediction(prediction_id: str, model_name: str):
     """
-    Update the prediction result in the backend.
+    Queue the failure of a prediction for write-back to the backend.
 
     Args:
         prediction_id (str): The prediction ID.
+        model_name (str): Name of the model that failed, for the metrics.
 
     Returns:
         None
     """
-    async with httpx.AsyncClient() as client:
+    PREDICTION_FAILURES.labels(model=model_name).inc()
+    result_writer.submit(prediction_id, FAILED_PAYLOAD)
+
+
+async def fetch_instance(
+    instance_url: str,
+    frame: int,
+    model_name: str,
+    model_version: str,
+    task_id: str | None = None,
+) -> tuple[str, dict | np.ndarray]:
+    """
+    Fetch a DICOM instance and look up its prediction before decoding it.
+
+    Args:
+        instance_url (str): The DICOM file instance URL.
+        frame (int): Frame to classify for multi-frame instances.
+        model_name (str): Name of the model, e.g. 'brain_tumors'.
+        model_version (str): Version of the model weights.
+        task_id (str | None): ID of the task to report the stages of.
+
+    Returns:
+        tuple[str, dict | np.ndarray]: The prediction cache key, and the cached
+            prediction on a hit or the processed pixel array on a miss.
+    """
+    report_stage(task_id, "downloading")
+    with await dicom_service.fetch_dicom(instance_url) as fetched:
+        key = prediction_cache.key(fetched.sha256, frame, model_name, model_version)
+        cached = prediction_cache.get(model_name, key)
+        if cached is not None:
+            return key, cached
+        report_stage(task_id, "decoding")
+        pixel_array = await run_in_threadpool(
+            dicom_service.read_pixel_array, fetched.file, RenderParams(frame=frame)
+        )
+        return key, pixel_array
+
+
+def decode_instance(model_name: str, fetched, frame: int) -> tuple[str, dict | Future]:
+    """
+    Look up the prediction of a fetched instance, or decode it and queue it on
+    the batching engine of the model. Runs on the decode pool of the pipeline.
+
+    Args:
+        model_name (str): Name of the model, e.g. 'brain_tumors'.
+        fetched (FetchedDicom): The downloaded DICOM file.
+        frame (int): Frame to classify for multi-frame instances.
+
+    Returns:
+        tuple[str, dict | Future]: The prediction cache key, and the cached
+            prediction on a hit or the future of the prediction on a miss.
+    """
+    service = model_registry.get_service(model_name)
+    key = prediction_cache.key(fetched.sha256, frame, model_name, service.version)
+    cached = prediction_cache.get(model_name, key)
+    if cached is not None:
+        return key, cached
+    pixel_array = dicom_service.read_pixel_array(
+        fetched.file, RenderParams(frame=frame)
+    )
+    return key, model_registry.get_engine(model_name).submit(pixel_array)
+
+
+async def predict_pipelined(
+    model_name: str,
+    prediction_id: str,
+    instance_url: str,
+    frame: int,
+    task_id: str | None = None,
+) -> dict:
+    """
+    Classify a DICOM instance through the stages of the worker pipeline.
+
+    Args:
+        model_name (str): Name of the model, e.g. 'brain_tumors'.
+        prediction_id (str): The prediction ID to update.
+        instance_url (str): The DICOM file instance URL.
+        frame (int): Frame to classify for multi-frame instances.
+        task_id (str | None): ID of the task to report the stages of.
+
+    Returns:
+        dict: Prediction result with class and probability.
+    """
+    with trace(
+        "predict_task", model=model_name, prediction_id=prediction_id, frame=frame
+    ):
         try:
-            response = await client.patch(
-                f"{Config.BACKEND_URL}/cdss/{prediction_id}/fail",
-                headers={"x-api-key": Config.API_KEY},
-            )
-            response.raise_for_status()
-        except httpx.RequestError as e:
-            print(f"Request failed: {e}")
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error occurred: {e.response.status_code} - {e.response.text}")
+            await run_in_threadpool(report_stage, task_id, "downloading")
+            async with pipeline.downloads:
+                with PIPELINE_IN_FLIGHT.labels(stage="download").track_inprogress():
+                    fetched = await dicom_service.fetch_dicom(instance_url)
+            with fetched, PIPELINE_IN_FLIGHT.labels(stage="decode").track_inprogress():
+                key, loaded = await pipeline.decode(
+                    decode_instance, model_name, fetched, frame
+                )
+
+            if isinstance(loaded, dict):
+                prediction = loaded
+            else:
+                await run_in_threadpool(report_stage, task_id, "inferring")
+                with PIPELINE_IN_FLIGHT.labels(stage="inference").track_inprogress():
+                    with span("inference", model=model_name):
+                        prediction = await asyncio.wrap_future(loaded)
+                await run_in_threadpool(prediction_cache.put, key, prediction)
 
+            await run_in_threadpool(report_stage, task_id, "writing_back")
+            with PIPELINE_IN_FLIGHT.labels(stage="writeback").track_inprogress():
+                await run_in_threadpool(
+                    update_prediction_result,
+                    prediction_id,
+                    prediction["class"],
+                    prediction["probability"],
+                )
+            return prediction
+        except Exception as e:
+            await run_in_threadpool(fail_prediction, prediction_id, model_name)
+            raise e
 
-@celery_app.task
-def predict_brain_tumors_task(prediction_id: str, instance_url: str):
+
+@celery_app.task(name=PREDICT_TASK)
+def predict_task(
+    model_name: str, prediction_id: str, instance_url: str, frame: int = 0
+):
     """
-    Celery task for predicting brain tumor type.
+    Celery task for classifying a DICOM instance with a registered model.
+
+    Results are memoized by file content, frame and model version, so a
+    re-submitted instance is written back without being decoded or classified.
+    The stages of the task are traced when TRACE_ENABLED is set, and reported
+    to the result backend as the PROGRESS state when TASK_PROGRESS_ENABLED is.
+    In the pipelined mode, they overlap with those of the other tasks of the
+    worker.
 
     Args:
+        model_name (str): Name of the model, e.g. 'brain_tumors'.
+        prediction_id (str): The prediction ID to update.
         instance_url (str): The DICOM file instance URL.
+        frame (int): Frame to classify for multi-frame instances.
 
     Returns:
         dict: Prediction result with class and probability.
     """
-    try:
-        loop = asyncio.get_event_loop()
-        image_bytes = loop.run_until_complete(
-            dicom_service.convert_dicom_to_image(instance_url)
+    # Unset when called directly, e.g. by the legacy per-model tasks
+    task_id = predict_task.request.id
+    if pipeline is not None:
+        return pipeline.run(
+            predict_pipelined(model_name, prediction_id, instance_url, frame, task_id)
         )
 
-        global brain_tumor_service
-        if brain_tumor_service is None:
-            brain_tumor_service = BrainTumorClassificationService(
-                "./src/inference/brain_tumors_classification/weights/brain_tumors_classification.pt"
+    with trace(
+        "predict_task", model=model_name, prediction_id=prediction_id, frame=frame
+    ):
+        try:
+            service = model_registry.get_service(model_name)
+            key, loaded = run_async(
+                fetch_instance(
+                    instance_url, frame, model_name, service.version, task_id
+                )
             )
 
-        prediction = brain_tumor_service.predict(image_bytes.getvalue())
-        loop.run_until_complete(
+            if isinstance(loaded, dict):
+                prediction = loaded
+            else:
+                report_stage(task_id, "inferring")
+                with span("inference", model=model_name):
+                    prediction = model_registry.get_engine(model_name).predict(loaded)
+                prediction_cache.put(key, prediction)
+            report_stage(task_id, "writing_back")
             update_prediction_result(
                 prediction_id, prediction["class"], prediction["probability"]
             )
-        )
 
-        return prediction
-    except Exception as e:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(fail_prediction(prediction_id))
-        raise e
+            return prediction
+        except Exception as e:
+            fail_prediction(prediction_id, model_name)
+            raise e
 
 
-@celery_app.task
-def predict_chest_ctscan_task(prediction_id: str, instance_url: str):
+@celery_app.task(name=PREDICT_BRAIN_TUMORS_TASK)
+def predict_brain_tumors_task(prediction_id: str, instance_url: str, frame: int = 0):
+    """
+    Celery task for predicting brain tumor type.
+
+    Args:
+        prediction_id (str): The prediction ID to update.
+        instance_url (str): The DICOM file instance URL.
+        frame (int): Frame to classify for multi-frame instances.
+
+    Returns:
+        dict: Prediction result with class and probability.
+    """
+    return predict_task(BRAIN_TUMORS_MODEL, prediction_id, instance_url, frame)
+
+
+@celery_app.task(name=PREDICT_CHEST_CTSCAN_TASK)
+def predict_chest_ctscan_task(prediction_id: str, instance_url: str, frame: int = 0):
     """
     Celery task for predicting chest CT cancer type.
 
     Args:
+        prediction_id (str): The prediction ID to update.
         instance_url (str): The DICOM file instance URL.
+        frame (int): Frame to classify for multi-frame instances.
 
     Returns:
         dict: Prediction result with class and probability.
     """
-    try:
-        loop = asyncio.get_event_loop()
-        image_bytes = loop.run_until_complete(
-            dicom_service.convert_dicom_to_image(instance_url)
-        )
+    return predict_task(CHEST_CT_MODEL, prediction_id, instance_url, frame)
 
-        global ct_scan_service
-        if ct_scan_service is None:
-            ct_scan_service = ChestCTCancerClassificationService(
-                "./src/inference/chest_ct_cancer_classification/weights/chest_ct_cancer_classification.pt"
-            )
 
-        prediction = ct_scan_service.predict(image_bytes.getvalue())
-        loop.run_until_complete(
-            update_prediction_result(
-                prediction_id, prediction["class"], prediction["probability"]
+async def fetch_series_arrays(instance_urls: list[str]) -> list:
+    """
+    Fetch and decode the instances of a series concurrently.
+
+    Args:
+        instance_urls (list[str]): DICOM file instance URLs.
+
+    Returns:
+        list: Pixel array, or the raised exception, for each instance in order.
+    """
+    semaphore = asyncio.Semaphore(Config.SERIES_FETCH_CONCURRENCY)
+
+    async def fetch(url: str):
+        async with semaphore:
+            return await dicom_service.convert_dicom_to_array(url)
+
+    return await asyncio.gather(
+        *(fetch(url) for url in instance_urls), return_exceptions=True
+    )
+
+
+@celery_app.task(name=PREDICT_SERIES_TASK)
+def predict_series_task(
+    model_name: str,
+    instance_urls: list[str],
+    aggregation: str = "max_probability",
+    prediction_id: str | None = None,
+    series_id: str | None = None,
+):
+    """
+    Celery task for predicting a whole series in one go.
+
+    Instances are fetched concurrently and run through the model in batches of
+    the model's maximum batch size. If a prediction ID is given, the series-level
+    result is written back to the backend.
+
+    Args:
+        model_name (str): Name of the model, e.g. 'brain_tumors'.
+        instance_urls (list[str]): DICOM file instance URLs of the series.
+        aggregation (str): 'max_probability' or 'mean_logit'.
+        prediction_id (str | None): The prediction ID to update, if any.
+        series_id (str | None): Identifier of the series, echoed in the result.
+
+    Returns:
+        dict: Per-instance predictions and the aggregated series prediction.
+    """
+    task_id = predict_series_task.request.id
+    with trace("predict_series_task", model=model_name, prediction_id=prediction_id):
+        try:
+            service = model_registry.get_service(model_name)
+            max_batch_size = service.spec.max_batch_size
+            # Instances are downloaded and decoded together
+            report_stage(task_id, "downloading")
+            arrays = run_async(fetch_series_arrays(instance_urls))
+
+            instances = [{"instance": url} for url in instance_urls]
+            decoded = []
+            for instance, array in zip(instances, arrays):
+                if isinstance(array, Exception):
+                    instance["error"] = str(array)
+                else:
+                    decoded.append((instance, service.preprocess_array(array)))
+            if not decoded:
+                raise ValueError("None of the series instances could be decoded")
+
+            report_stage(task_id, "inferring")
+            logits = []
+            for start in range(0, len(decoded), max_batch_size):
+                chunk = decoded[start : start + max_batch_size]
+                images = torch.stack([image for _, image in chunk])
+                batch_logits = service.forward_batch(images)
+                logits.append(batch_logits)
+                probabilities = torch.softmax(batch_logits, dim=1)
+                top_probs, predicted = torch.max(probabilities, 1)
+                for (instance, _), index, probability in zip(
+                    chunk, predicted.tolist(), top_probs.tolist()
+                ):
+                    instance["class"] = service.class_names[index]
+                    instance["probability"] = probability
+
+            aggregate = aggregate_series(
+                torch.cat(logits), service.class_names, aggregation
             )
-        )
+            if prediction_id is not None:
+                report_stage(task_id, "writing_back")
+                update_prediction_result(
+                    prediction_id, aggregate["class"], aggregate["probability"]
+                )
 
-        return prediction
-    except Exception as e:
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(fail_prediction(prediction_id))
-        raise e
+            return {"seriesId": series_id, "instances": instances, "series": aggregate}
+        except Exception as e:
+            if prediction_id is not None:
+                fail_prediction(prediction_id, model_name)
+            raise e
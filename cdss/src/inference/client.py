@@ -0,0 +1,89 @@
+from typing import Iterable
+
+from celery import Celery
+from kombu import Queue
+
+from src.config import Config
+
+# Task names registered by the worker in `src.inference.celery_jobs`.
+# The API process enqueues by name so it never has to import torch or the models.
+PREDICT_TASK = "src.inference.celery_jobs.predict_task"
+PREDICT_SERIES_TASK = "src.inference.celery_jobs.predict_series_task"
+# Per-model task names, still registered for messages enqueued by older versions
+PREDICT_BRAIN_TUMORS_TASK = "src.inference.celery_jobs.predict_brain_tumors_task"
+PREDICT_CHEST_CTSCAN_TASK = "src.inference.celery_jobs.predict_chest_ctscan_task"
+
+BRAIN_TUMORS_MODEL = "brain_tumors"
+CHEST_CT_MODEL = "chest_ct"
+
+# Messages enqueued without a queue, e.g. by older versions of the API
+DEFAULT_QUEUE = "celery"
+
+# Redis serves the lowest priority number first, AMQP brokers the highest
+MAX_PRIORITY = 9
+if Config.CELERY_BROKER_URL.startswith(("redis://", "rediss://", "sentinel://")):
+    TASK_PRIORITIES = {"interactive": 0, "bulk": MAX_PRIORITY}
+else:
+    TASK_PRIORITIES = {"interactive": MAX_PRIORITY, "bulk": 0}
+
+celery_app = Celery(
+    "tasks",
+    broker=Config.CELERY_BROKER_URL,
+    backend=Config.CELERY_RESULT_BACKEND,
+)
+celery_app.conf.update(
+    task_default_queue=DEFAULT_QUEUE,
+    task_default_priority=TASK_PRIORITIES["interactive"],
+    task_queue_max_priority=MAX_PRIORITY,
+    # Predictions take seconds: a worker reserves one task per process, so
+    # queued tasks go to whichever process frees up first, by priority
+    worker_prefetch_multiplier=Config.CELERY_PREFETCH_MULTIPLIER,
+    task_acks_late=Config.CELERY_ACKS_LATE,
+    task_reject_on_worker_lost=Config.CELERY_REJECT_ON_WORKER_LOST,
+)
+
+
+def configure_queues(queue_names: Iterable[str]):
+    """
+    Declare the default queue and the queues of the models.
+
+    A worker started without `-Q` consumes from every declared queue.
+
+    Args:
+        queue_names (Iterable[str]): Queues of the registered models.
+    """
+    names = dict.fromkeys([DEFAULT_QUEUE, *queue_names])
+    celery_app.conf.task_queues = [Queue(name, routing_key=name) for name in names]
+
+
+def enqueue_task(
+    task_name: str,
+    *args,
+    queue: str | None = None,
+    priority: str = "interactive",
+    task_id: str | None = None,
+    **kwargs,
+):
+    """
+    Enqueue a Celery task by name without importing its implementation.
+
+    Args:
+        task_name (str): Fully qualified name of the registered task.
+        *args: Positional arguments forwarded to the task.
+        queue (str | None): Queue to send the task to, the default queue if None.
+        priority (str): 'interactive' for requests a user is waiting on,
+            'bulk' for backfills that should yield to them.
+        task_id (str | None): ID to give the task, a new one if None.
+        **kwargs: Keyword arguments forwarded to the task.
+
+    Returns:
+        celery.result.AsyncResult: Handle of the submitted task.
+    """
+    return celery_app.send_task(
+        task_name,
+        args=args,
+        kwargs=kwargs,
+        queue=queue,
+        priority=TASK_PRIORITIES[priority],
+        task_id=task_id,
+    )
@@ -0,0 +1,239 @@
+"""
+Export the optimized inference artifacts of registered models from their weights.
+
+    python -m src.inference.export --model brain_tumors --backend torchscript onnx
+    python -m src.inference.export --backend int8_static --calibration scans/*.dcm
+
+The artifacts are written where the model's registry entry loads them from,
+see `ModelSpec.artifact_path`. Static int8 quantization needs a few
+representative DICOM files to calibrate the activation ranges.
+"""
+
+import argparse
+import os
+from typing import Optional
+
+import torch
+
+from src.dicom.schema import RenderParams
+from src.dicom.service import DicomService
+from src.inference.backends import (
+    ONNX_INPUT,
+    ONNX_OPSET,
+    ONNX_OUTPUT,
+    TORCHSCRIPT_BACKENDS,
+)
+from src.inference.service import ClassificationService
+from src.inference.specs import ARTIFACT_SUFFIXES, MODEL_SPECS, ModelSpec
+
+
+def example_input(spec: ModelSpec, batch_size: int = 1) -> torch.Tensor:
+    """
+    Build a blank input batch of the model's input size.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+        batch_size (int): Number of images in the batch.
+
+    Returns:
+        torch.Tensor: Tensor of shape (batch_size, 3, height, width).
+    """
+    return torch.zeros(batch_size, 3, *spec.input_size)
+
+
+def export_torchscript(
+    model: torch.nn.Module, spec: ModelSpec, path: str, quantize: bool = False
+):
+    """
+    Trace and freeze a model, optionally with int8 dynamic quantization.
+
+    Dynamic quantization stores the weights of the linear layers as int8 and
+    quantizes their activations on the fly, which mostly helps models with
+    large fully connected layers.
+
+    Args:
+        model (torch.nn.Module): Eager model on the CPU, in evaluation mode.
+        spec (ModelSpec): Registry entry of the model.
+        path (str): Path of the artifact to write.
+        quantize (bool): Whether to quantize the linear layers to int8.
+    """
+    example = example_input(spec)
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    if spec.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    # Inference optimizations are applied when loading, their MKL-DNN constants
+    # cannot be serialized
+    torch.jit.save(traced, path)
+
+
+def export_onnx(model: torch.nn.Module, spec: ModelSpec, path: str):
+    """
+    Export a model to ONNX with a dynamic batch dimension.
+
+    Args:
+        model (torch.nn.Module): Eager model on the CPU, in evaluation mode.
+        spec (ModelSpec): Registry entry of the model.
+        path (str): Path of the artifact to write.
+    """
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example_input(spec),),
+            path,
+            input_names=[ONNX_INPUT],
+            output_names=[ONNX_OUTPUT],
+            dynamic_axes={ONNX_INPUT: {0: "batch"}, ONNX_OUTPUT: {0: "batch"}},
+            opset_version=ONNX_OPSET,
+            dynamo=False,
+        )
+
+
+def export_int8_static(onnx_path: str, path: str, calibration: list[torch.Tensor]):
+    """
+    Quantize an ONNX model to int8 weights and activations.
+
+    Activation ranges are calibrated on the given images, and the result uses
+    quantize/dequantize pairs that ONNX Runtime fuses into int8 kernels.
+
+    Args:
+        onnx_path (str): Path of the float ONNX artifact.
+        path (str): Path of the artifact to write.
+        calibration (list[torch.Tensor]): Preprocessed images of shape
+            (3, height, width).
+    """
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    class TensorReader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(calibration)
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            return {ONNX_INPUT: image.unsqueeze(0).numpy()}
+
+    quantize_static(
+        onnx_path,
+        path,
+        TensorReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+
+
+def load_calibration(
+    service: ClassificationService, files: list[str]
+) -> list[torch.Tensor]:
+    """
+    Decode and preprocess DICOM files the way the prediction tasks do.
+
+    Args:
+        service (ClassificationService): Service of the model being exported.
+        files (list[str]): Paths of the DICOM files.
+
+    Returns:
+        list[torch.Tensor]: Preprocessed images of shape (3, height, width).
+    """
+    dicom_service = DicomService()
+    images = []
+    for file in files:
+        with open(file, "rb") as dicom_data:
+            pixel_array = dicom_service.read_pixel_array(dicom_data, RenderParams())
+        images.append(service.preprocess_array(pixel_array))
+    return images
+
+
+def export_model(
+    spec: ModelSpec,
+    backends: list[str],
+    calibration_files: list[str],
+    calibration: Optional[list[torch.Tensor]] = None,
+) -> dict[str, str]:
+    """
+    Export the artifacts of a model for the given backends.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+        backends (list[str]): Backends to export, e.g. ['torchscript', 'onnx'].
+        calibration_files (list[str]): DICOM files for static int8 calibration.
+        calibration (Optional[list[torch.Tensor]]): Already preprocessed calibration
+            images, used instead of the files when given.
+
+    Returns:
+        dict[str, str]: Path of the written artifact by backend.
+    """
+    service = ClassificationService(spec.model_copy(update={"backend": "eager"}))
+    model = service.runner.model.cpu()
+    os.makedirs(os.path.dirname(spec.artifact_path(backends[0])) or ".", exist_ok=True)
+
+    paths = {}
+    for backend in backends:
+        path = spec.artifact_path(backend)
+        if backend in TORCHSCRIPT_BACKENDS:
+            export_torchscript(model, spec, path, quantize=backend == "int8_dynamic")
+        elif backend == "onnx":
+            export_onnx(model, spec, path)
+        else:
+            if calibration is None:
+                if not calibration_files:
+                    raise ValueError("int8_static needs --calibration DICOM files")
+                calibration = load_calibration(service, calibration_files)
+            onnx_path = spec.artifact_path("onnx")
+            if not os.path.exists(onnx_path):
+                export_onnx(model, spec, onnx_path)
+            export_int8_static(onnx_path, path, calibration)
+        paths[backend] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--model",
+        nargs="+",
+        choices=list(MODEL_SPECS),
+        default=list(MODEL_SPECS),
+        help="Models to export, all by default",
+    )
+    parser.add_argument(
+        "--backend",
+        nargs="+",
+        choices=list(ARTIFACT_SUFFIXES),
+        default=["torchscript", "onnx", "int8_dynamic"],
+        help="Backends to export, all but int8_static by default",
+    )
+    parser.add_argument(
+        "--calibration",
+        nargs="*",
+        default=[],
+        help="DICOM files to calibrate static int8 quantization with",
+    )
+    args = parser.parse_args()
+
+    if "int8_static" in args.backend and not args.calibration:
+        parser.error("--backend int8_static needs --calibration DICOM files")
+
+    for name in args.model:
+        paths = export_model(MODEL_SPECS[name], args.backend, args.calibration)
+        for backend, path in paths.items():
+            size_mib = os.path.getsize(path) / 1024**2
+            print(f"{name} {backend}: {path} ({size_mib:.1f} MiB)")
+
+
+if __name__ == "__main__":
+    main()
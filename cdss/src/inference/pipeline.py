@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+class WorkerPipeline:
+    """
+    Event loop and stage limits of a worker in the pipelined mode.
+
+    In this mode tasks run on Celery's threads pool and hand their work to a
+    single event loop on a background thread, so that the downloads of some
+    tasks overlap the decoding and inference of others. Each stage bounds its
+    own concurrency: downloads are network-bound and run many at a time,
+    decoding and preprocessing run on a small thread pool, each model has one
+    batching inference stage, and the result writer sends write-backs in
+    batches. A task waiting for a busy stage keeps its place, so the number of
+    tasks the worker reserves, its window, bounds the work in flight and the
+    memory it holds.
+
+    Attributes:
+        loop (asyncio.AbstractEventLoop): Loop every task coroutine runs on.
+        downloads (asyncio.Semaphore): Slots of the download stage.
+    """
+
+    def __init__(self, download_concurrency: int, decode_workers: int):
+        """
+        Initialize the pipeline without starting its loop.
+
+        Args:
+            download_concurrency (int): Downloads in flight at the same time.
+            decode_workers (int): Threads decoding and preprocessing images.
+        """
+        self.loop = asyncio.new_event_loop()
+        self.downloads = asyncio.Semaphore(max(1, download_concurrency))
+        self._decode_pool = ThreadPoolExecutor(
+            max(1, decode_workers), thread_name_prefix="pipeline-decode"
+        )
+        self._thread = None
+
+    def start(self):
+        """
+        Start the event loop on a background thread.
+        """
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="pipeline-loop", daemon=True
+        )
+        self._thread.start()
+
+    def run(self, coroutine):
+        """
+        Run a coroutine on the pipeline loop, blocking the calling thread until
+        it completes.
+
+        Args:
+            coroutine: The coroutine to run.
+
+        Returns:
+            The coroutine's result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def decode(self, fn: Callable, *args):
+        """
+        Run a function on the decode pool, in the context of the calling task
+        so that its spans are traced.
+
+        Args:
+            fn (Callable): Decoding or preprocessing function.
+            *args: Arguments of the function.
+
+        Returns:
+            The function's result.
+        """
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(
+            self._decode_pool, functools.partial(context.run, fn, *args)
+        )
+
+    def stop(self):
+        """
+        Stop the event loop and the decode pool.
+        """
+        if self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+        self.loop.close()
+        self._decode_pool.shutdown()
@@ -0,0 +1,45 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from src.inference.specs import IMAGENET_MEAN, IMAGENET_STD
+
+
+def array_to_tensor(
+    pixel_array: np.ndarray,
+    size: tuple[int, int] = (224, 224),
+    mean: tuple[float, float, float] = IMAGENET_MEAN,
+    std: tuple[float, float, float] = IMAGENET_STD,
+) -> torch.Tensor:
+    """
+    Build a normalized model input tensor from a uint8 pixel array.
+
+    Equivalent to converting the array to an RGB PIL image and applying
+    `Resize(size)`, `ToTensor()` and `Normalize(mean, std)`, without going
+    through an encoded image. Grayscale arrays are resized on a single channel
+    and only expanded to three channels afterwards.
+
+    Args:
+        pixel_array (np.ndarray): Image of shape (H, W) or (H, W, 3), dtype uint8.
+        size (tuple[int, int]): Output (height, width).
+        mean (tuple[float, float, float]): Per-channel normalization mean.
+        std (tuple[float, float, float]): Per-channel normalization std.
+
+    Returns:
+        torch.Tensor: Float tensor of shape (3, height, width).
+    """
+    tensor = torch.from_numpy(np.ascontiguousarray(pixel_array))
+    if tensor.ndim == 2:
+        tensor = tensor.unsqueeze(-1)
+
+    # HWC uint8 -> 1CHW float in [0, 1]
+    tensor = tensor.permute(2, 0, 1).unsqueeze(0).float().div_(255.0)
+    if tensor.shape[-2:] != size:
+        tensor = F.interpolate(
+            tensor, size=size, mode="bilinear", antialias=True, align_corners=False
+        ).clamp_(0.0, 1.0)
+    tensor = tensor[0].expand(3, -1, -1)
+
+    mean_tensor = torch.tensor(mean).view(3, 1, 1)
+    std_tensor = torch.tensor(std).view(3, 1, 1)
+    return (tensor - mean_tensor).div_(std_tensor)
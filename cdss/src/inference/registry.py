@@ -0,0 +1,139 @@
+import os
+import resource
+
+from src.inference.batching import BatchingEngine
+from src.inference.service import ClassificationService
+from src.inference.specs import MODEL_SPECS, ModelSpec
+
+
+def current_rss_bytes() -> int:
+    """
+    Resident set size of the current process, falling back to its peak.
+
+    Returns:
+        int: Resident memory in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModelRegistry:
+    """
+    Loaded models of a worker process, keyed by registry name.
+
+    Models are loaded on first use, or all at once by `load_all` so that the
+    Celery parent process can load them before forking its pool and the
+    children share the weights copy-on-write. Each model gets a batching
+    engine in front of it, and load time, memory and warm-up time are recorded
+    per model.
+
+    Attributes:
+        specs (dict[str, ModelSpec]): Registry entries by name.
+        stats (dict[str, dict]): Load report of each loaded model.
+    """
+
+    def __init__(self, specs: dict[str, ModelSpec]):
+        """
+        Initialize the registry without loading any model.
+
+        Args:
+            specs (dict[str, ModelSpec]): Registry entries by name.
+        """
+        self.specs = specs
+        self.stats = {}
+        self._services = {}
+        self._engines = {}
+
+    def get_spec(self, model_name: str) -> ModelSpec:
+        """
+        Look up the registry entry of a model.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+
+        Returns:
+            ModelSpec: The registry entry.
+        """
+        if model_name not in self.specs:
+            raise KeyError(f"Unknown model '{model_name}'")
+        return self.specs[model_name]
+
+    def get_service(self, model_name: str) -> ClassificationService:
+        """
+        Return the classification service of a model, loading it on first use.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+
+        Returns:
+            ClassificationService: Service shared by every caller in this process.
+        """
+        if model_name not in self._services:
+            spec = self.get_spec(model_name)
+            rss_before = current_rss_bytes()
+            service = ClassificationService(spec)
+            self._services[model_name] = service
+            self.stats[model_name] = {
+                "backend": spec.backend,
+                "load_seconds": round(service.load_seconds, 3),
+                "parameter_mib": round(service.parameter_bytes / 1024**2, 1),
+                "rss_delta_mib": round((current_rss_bytes() - rss_before) / 1024**2, 1),
+            }
+            print(f"Loaded model '{model_name}':", self.stats[model_name])
+        return self._services[model_name]
+
+    def get_engine(self, model_name: str) -> BatchingEngine:
+        """
+        Return the batching engine in front of a model, building it on first use.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+
+        Returns:
+            BatchingEngine: Engine shared by every caller in this process.
+        """
+        if model_name not in self._engines:
+            service = self.get_service(model_name)
+            self._engines[model_name] = BatchingEngine(
+                service.predict_batch,
+                preprocess=service.preprocess_array,
+                max_batch_size=service.spec.max_batch_size,
+                max_wait_ms=service.spec.max_wait_ms,
+                name=model_name,
+            )
+        return self._engines[model_name]
+
+    def load_all(self, model_names: list[str] | None = None):
+        """
+        Load the given models, or every registered model, that are not loaded yet.
+
+        Args:
+            model_names (list[str] | None): Models to load, all of them if None.
+        """
+        for model_name in self.specs if model_names is None else model_names:
+            self.get_service(model_name)
+
+    def warm_up_all(self):
+        """
+        Run a warm-up forward pass through every loaded model.
+        """
+        for model_name, service in self._services.items():
+            warmup_ms = round(service.warm_up() * 1000, 1)
+            self.stats[model_name]["warmup_ms"] = warmup_ms
+            print(f"Warmed up model '{model_name}' in {warmup_ms} ms")
+
+    def report(self) -> dict:
+        """
+        Return the load report of every loaded model.
+
+        Returns:
+            dict: Load time, parameter size, resident memory growth and warm-up
+                time by model name.
+        """
+        return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+model_registry = ModelRegistry(MODEL_SPECS)
@@ -0,0 +1,218 @@
+import hashlib
+import json
+from collections import Counter
+
+import redis
+
+from src.config import Config
+from src.dicom.preview_cache import PreviewCache
+from src.metrics import PREDICTION_CACHE_LOOKUPS
+
+STATS_KEY = "prediction-cache:stats"
+
+
+class RedisResultStore:
+    """
+    Prediction results stored in Redis with an expiry.
+
+    Hit and miss counts are also kept in Redis, so they add up over every
+    worker process and can be read from the API process.
+
+    Attributes:
+        client (redis.Redis): Client of the Redis server.
+        ttl_seconds (int): Lifetime of an entry.
+        prefix (str): Prefix of the entry keys.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int, prefix: str = "prediction-cache:"):
+        """
+        Initialize the store without connecting yet.
+
+        Args:
+            url (str): URL of the Redis server.
+            ttl_seconds (int): Lifetime of an entry.
+            prefix (str): Prefix of the entry keys.
+        """
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def put(self, key: str, data: bytes):
+        self.client.set(self.prefix + key, data, ex=self.ttl_seconds)
+
+    def count(self, field: str):
+        self.client.hincrby(STATS_KEY, field, 1)
+
+    def counts(self) -> Counter:
+        return Counter(
+            {
+                field.decode(): int(value)
+                for field, value in self.client.hgetall(STATS_KEY).items()
+            }
+        )
+
+
+class LocalResultStore(PreviewCache):
+    """
+    Prediction results kept in memory, and on disk when a directory is set.
+
+    Entries have no expiry, they are evicted least recently used first. Hit
+    and miss counts are those of the current process only.
+    """
+
+    def __init__(
+        self, max_memory_bytes: int, directory: str | None, max_disk_bytes: int
+    ):
+        super().__init__(max_memory_bytes, directory, max_disk_bytes, "prediction")
+        self.lookups = Counter()
+
+    def count(self, field: str):
+        self.lookups[field] += 1
+
+    def counts(self) -> Counter:
+        return Counter(self.lookups)
+
+
+class PredictionCache:
+    """
+    Cache of prediction results, keyed by the input and the model version.
+
+    The key combines the SHA-256 of the DICOM file, the frame, the model name
+    and its version, so re-submitting an instance skips decoding and
+    inference, and entries are invalidated when the weights, the backend
+    artifact, the labels or the preprocessing of the model change. Store errors
+    are reported and treated as misses; the cache never fails a prediction.
+
+    Attributes:
+        store (RedisResultStore | LocalResultStore | None): Backing store, None
+            to disable the cache.
+    """
+
+    def __init__(self, store: RedisResultStore | LocalResultStore | None):
+        """
+        Initialize the cache.
+
+        Args:
+            store (RedisResultStore | LocalResultStore | None): Backing store,
+                None to disable the cache.
+        """
+        self.store = store
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    @staticmethod
+    def key(content_hash: str, frame: int, model_name: str, model_version: str) -> str:
+        """
+        Build the cache key of a prediction.
+
+        Args:
+            content_hash (str): SHA-256 of the DICOM file.
+            frame (int): Classified frame of the instance.
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+            model_version (str): Version of the model, see `weights_version`.
+
+        Returns:
+            str: Hex digest identifying the prediction.
+        """
+        payload = json.dumps([content_hash, frame, model_name, model_version])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, model_name: str, key: str) -> dict | None:
+        """
+        Look up a prediction and count the hit or miss for the model.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+            key (str): Cache key from `key`.
+
+        Returns:
+            dict | None: The cached prediction, or None on a miss.
+        """
+        if self.store is None:
+            return None
+        try:
+            data = self.store.get(key)
+            outcome = "misses" if data is None else "hits"
+            PREDICTION_CACHE_LOOKUPS.labels(model=model_name, result=outcome).inc()
+            self.store.count(f"{model_name}:{outcome}")
+        except redis.RedisError as e:
+            print(f"Prediction cache lookup failed: {e}")
+            return None
+        return None if data is None else json.loads(data)
+
+    def put(self, key: str, prediction: dict):
+        """
+        Store a prediction.
+
+        Args:
+            key (str): Cache key from `key`.
+            prediction (dict): Predicted class and its probability.
+        """
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, json.dumps(prediction).encode())
+        except redis.RedisError as e:
+            print(f"Prediction cache update failed: {e}")
+
+    def hit_rates(self) -> dict[str, dict]:
+        """
+        Return the hit and miss counts and the hit rate of every model.
+
+        Returns:
+            dict[str, dict]: Hits, misses and hit rate by model name.
+        """
+        if self.store is None:
+            return {}
+        try:
+            counts = self.store.counts()
+        except redis.RedisError as e:
+            print(f"Prediction cache statistics failed: {e}")
+            return {}
+
+        rates = {}
+        for field, value in counts.items():
+            model_name, outcome = field.rsplit(":", 1)
+            rates.setdefault(model_name, {"hits": 0, "misses": 0})[outcome] = value
+        for stats in rates.values():
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return rates
+
+
+def create_prediction_cache() -> PredictionCache:
+    """
+    Build the prediction cache selected by the settings.
+
+    `auto` uses the Celery result backend when it is a Redis server, and a
+    local store otherwise.
+
+    Returns:
+        PredictionCache: The configured cache.
+    """
+    mode = Config.PREDICTION_CACHE
+    redis_url = Config.PREDICTION_CACHE_REDIS_URL or Config.CELERY_RESULT_BACKEND
+    if mode == "auto":
+        mode = "redis" if redis_url.startswith(("redis://", "rediss://")) else "local"
+
+    if mode == "redis":
+        return PredictionCache(
+            RedisResultStore(redis_url, Config.PREDICTION_CACHE_TTL_SECONDS)
+        )
+    if mode == "local":
+        return PredictionCache(
+            LocalResultStore(
+                Config.PREDICTION_CACHE_MAX_BYTES,
+                Config.PREDICTION_CACHE_DIR,
+                Config.PREDICTION_CACHE_DISK_MAX_BYTES,
+            )
+        )
+    return PredictionCache(None)
+
+
+prediction_cache = create_prediction_cache()
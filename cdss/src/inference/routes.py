@@ -1,17 +1,324 @@
-from fastapi import APIRouter
+import json
+from contextlib import aclosing
 
-from src.inference.brain_tumors_classification.routes import (
-    brain_tumors_classification_router,
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.auth.dependencies import ApiKeyHeader
+from src.config import Config
+from src.inference.admission import submission_control
+from src.inference.client import PREDICT_SERIES_TASK, PREDICT_TASK
+from src.inference.result_cache import prediction_cache
+from src.inference.schema import InferenceSchema, SeriesInferenceSchema
+from src.inference.specs import MODEL_SPECS, ModelSpec
+from src.inference.status import is_finished, read_task_status, watch_tasks
+from src.inference.sync import sync_inference
+
+inference_router = APIRouter()
+
+SUBMISSION_RESPONSES = {
+    429: {
+        "description": "The API key is over its rate limit or the model queue is "
+        "full, retry after the `Retry-After` header",
+    },
+}
+
+
+def build_model_router(spec: ModelSpec) -> APIRouter:
+    """
+    Build the prediction endpoints of a registered model.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+
+    Returns:
+        APIRouter: Router with the single-instance and series endpoints, and
+            the synchronous endpoint if the model is served in-process.
+    """
+    router = APIRouter()
+
+    @router.post(
+        "/",
+        summary=f"Submit a {spec.title} prediction task",
+        description=f"Submit an image for {spec.title} prediction. Submitting a "
+        "prediction again returns the task already submitted for it",
+        operation_id=f"submit_{spec.name}_prediction",
+        responses=SUBMISSION_RESPONSES,
+    )
+    async def submit_prediction(
+        inferenceSchema: InferenceSchema, api_key: str = Depends(ApiKeyHeader())
+    ):
+        """
+        Submit a prediction task, or return the one already submitted for the
+        prediction.
+
+        Args:
+            inferenceSchema (InferenceSchema): Schema containing the instance URL of the DICOM image
+                and the priority of the task.
+            api_key (str): API key of the client, rate limited.
+
+        Returns:
+            dict: Contains the task ID of the submitted Celery task.
+        """
+        await run_in_threadpool(submission_control.check_rate, api_key)
+        task_id = await run_in_threadpool(
+            submission_control.submit,
+            inferenceSchema.predictionId,
+            PREDICT_TASK,
+            spec.name,
+            inferenceSchema.predictionId,
+            inferenceSchema.instance,
+            inferenceSchema.frame,
+            queue=spec.task_queue,
+            priority=inferenceSchema.priority,
+        )
+        return {"task_id": task_id}
+
+    @router.post(
+        "/series",
+        summary=f"Submit a {spec.title} series prediction task",
+        description=f"Submit all instances of a series for a single {spec.title} "
+        "prediction. Submitting a prediction again returns the task already "
+        "submitted for it",
+        operation_id=f"submit_{spec.name}_series_prediction",
+        responses=SUBMISSION_RESPONSES,
+    )
+    async def submit_series_prediction(
+        seriesInferenceSchema: SeriesInferenceSchema,
+        api_key: str = Depends(ApiKeyHeader()),
+    ):
+        """
+        Submit a prediction task for a whole series, or return the one already
+        submitted for the prediction.
+
+        Args:
+            seriesInferenceSchema (SeriesInferenceSchema): Schema containing the instance URLs
+                of the series, how to aggregate their predictions and the priority of the task.
+            api_key (str): API key of the client, rate limited.
+
+        Returns:
+            dict: Contains the task ID of the submitted Celery task.
+        """
+        await run_in_threadpool(submission_control.check_rate, api_key)
+        task_id = await run_in_threadpool(
+            submission_control.submit,
+            seriesInferenceSchema.predictionId,
+            PREDICT_SERIES_TASK,
+            spec.name,
+            seriesInferenceSchema.instances,
+            seriesInferenceSchema.aggregation,
+            seriesInferenceSchema.predictionId,
+            seriesInferenceSchema.seriesId,
+            queue=spec.task_queue,
+            priority=seriesInferenceSchema.priority,
+        )
+        return {"task_id": task_id}
+
+    if sync_inference is None or not sync_inference.serves(spec.name):
+        return router
+
+    @router.post(
+        "/predict",
+        summary=f"Run a {spec.title} prediction",
+        description=f"Run a {spec.title} prediction in-process and return its result, "
+        "or submit a prediction task if the model is too busy",
+        operation_id=f"run_{spec.name}_prediction",
+        responses={
+            202: {"description": "Submitted as a prediction task"},
+            **SUBMISSION_RESPONSES,
+        },
+    )
+    async def run_prediction(
+        inferenceSchema: InferenceSchema, api_key: str = Depends(ApiKeyHeader())
+    ):
+        """
+        Run a prediction in the API process, falling back to a prediction task
+        when the estimated wait exceeds the latency budget.
+
+        Either way the result is also written back to the backend.
+
+        Args:
+            inferenceSchema (InferenceSchema): Schema containing the instance URL of the DICOM image
+                and the priority of the task, should it be submitted.
+            api_key (str): API key of the client, rate limited.
+
+        Returns:
+            dict: The predicted class and its probability, or with status 202 the
+                task ID of the submitted Celery task.
+        """
+        await run_in_threadpool(submission_control.check_rate, api_key)
+        if sync_inference.admit(spec.name):
+            return await sync_inference.predict(
+                spec.name,
+                inferenceSchema.predictionId,
+                inferenceSchema.instance,
+                inferenceSchema.frame,
+            )
+
+        task_id = await run_in_threadpool(
+            submission_control.submit,
+            inferenceSchema.predictionId,
+            PREDICT_TASK,
+            spec.name,
+            inferenceSchema.predictionId,
+            inferenceSchema.instance,
+            inferenceSchema.frame,
+            queue=spec.task_queue,
+            priority=inferenceSchema.priority,
+        )
+        return JSONResponse({"task_id": task_id}, status_code=202)
+
+    return router
+
+
+@inference_router.get(
+    "/models",
+    dependencies=[Depends(ApiKeyHeader())],
+    summary="List the registered models",
+    description="Returns the name, route and labels of every registered model",
 )
-from src.inference.chest_ct_cancer_classification.routes import (
-    chest_ct_cancer_classification_router,
+async def list_models():
+    """
+    List the models of the registry.
+
+    Returns:
+        list[dict]: Name, route prefix, title and labels of each model.
+    """
+    return [
+        {
+            "name": spec.name,
+            "route": f"/{spec.route}",
+            "title": spec.title,
+            "labels": spec.labels,
+        }
+        for spec in MODEL_SPECS.values()
+    ]
+
+
+@inference_router.get(
+    "/cache",
+    dependencies=[Depends(ApiKeyHeader())],
+    summary="Get the prediction cache hit rates",
+    description="Returns the prediction cache hits, misses and hit rate per model",
 )
+async def get_prediction_cache_stats():
+    """
+    Report the prediction cache hit rates.
 
-inference_router = APIRouter()
+    With the Redis cache the counts cover every worker, with the local cache
+    only this process.
+
+    Returns:
+        dict: Hits, misses and hit rate by model name.
+    """
+    return await run_in_threadpool(prediction_cache.hit_rates)
 
-inference_router.include_router(
-    brain_tumors_classification_router, prefix="/brain-tumors-classification"
+
+@inference_router.get(
+    "/tasks/events",
+    response_class=StreamingResponse,
+    dependencies=[Depends(ApiKeyHeader())],
+    summary="Follow the status of prediction tasks",
+    description="Streams the status of the given tasks as server-sent events: "
+    "their current status, then every change, including the stage of running "
+    "tasks, until they have all finished",
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": "`status` events with the status of a task, then a "
+            "`done` event, or a `timeout` event if some tasks have not finished",
+        },
+    },
 )
-inference_router.include_router(
-    chest_ct_cancer_classification_router, prefix="/chest-ct-cancer-classification"
+async def stream_task_events(
+    ids: list[str] = Query(
+        ...,
+        min_length=1,
+        max_length=Config.TASK_EVENTS_MAX_TASKS,
+        description="Task IDs, repeated",
+    ),
+    timeout: float = Query(
+        Config.TASK_EVENTS_TIMEOUT,
+        gt=0,
+        le=Config.TASK_EVENTS_TIMEOUT,
+        description="Seconds after which to stop following the tasks",
+    ),
+):
+    """
+    Stream the status of many tasks as server-sent events.
+
+    Args:
+        ids (list[str]): IDs of the tasks to follow.
+        timeout (float): Seconds after which to stop following them.
+
+    Returns:
+        StreamingResponse: The event stream.
+    """
+
+    async def events():
+        finished = set()
+        async with aclosing(watch_tasks(ids, timeout)) as statuses:
+            async for status in statuses:
+                if status is None:
+                    # Keeps proxies from closing an idle connection
+                    yield b": keep-alive\n\n"
+                    continue
+                if is_finished(status):
+                    finished.add(status["task_id"])
+                yield f"event: status\ndata: {json.dumps(status)}\n\n".encode()
+        event = "done" if finished.issuperset(ids) else "timeout"
+        yield f"event: {event}\ndata: {{}}\n\n".encode()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@inference_router.get(
+    "/tasks/{task_id}",
+    dependencies=[Depends(ApiKeyHeader())],
+    summary="Get the status of a prediction task",
+    description="Returns the state of a task, with the stage of a running task, the "
+    "result of a finished one or the error of a failed one. With `wait`, waits up "
+    "to that many seconds for the status to change before answering",
 )
+async def get_task_status(
+    task_id: str,
+    wait: float = Query(
+        0,
+        ge=0,
+        le=Config.TASK_EVENTS_TIMEOUT,
+        description="Seconds to wait for a change of an unfinished task",
+    ),
+):
+    """
+    Report the status of a task, long-polling for its next change with `wait`.
+
+    Args:
+        task_id (str): The task ID.
+        wait (float): Seconds to wait for a change of an unfinished task.
+
+    Returns:
+        dict: Task ID, state, and the stage, result or error when there is one.
+    """
+    if not wait:
+        return await run_in_threadpool(read_task_status, task_id)
+
+    current = None
+    async with aclosing(watch_tasks([task_id], wait)) as statuses:
+        async for status in statuses:
+            if status is None:
+                continue
+            if current is not None or is_finished(status):
+                return status
+            current = status
+    return current
+
+
+for model_spec in MODEL_SPECS.values():
+    inference_router.include_router(
+        build_model_router(model_spec), prefix=f"/{model_spec.route}"
+    )
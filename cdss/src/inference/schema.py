@@ -1,6 +1,20 @@
-from pydantic import BaseModel
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+TaskPriority = Literal["interactive", "bulk"]
 
 
 class InferenceSchema(BaseModel):
     predictionId: str
     instance: str
+    frame: int = Field(0, ge=0)
+    priority: TaskPriority = "interactive"
+
+
+class SeriesInferenceSchema(BaseModel):
+    predictionId: Optional[str] = None
+    seriesId: Optional[str] = None
+    instances: list[str] = Field(..., min_length=1)
+    aggregation: Literal["max_probability", "mean_logit"] = "max_probability"
+    priority: TaskPriority = "interactive"
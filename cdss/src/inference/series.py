@@ -0,0 +1,36 @@
+import torch
+
+AGGREGATIONS = ("max_probability", "mean_logit")
+
+
+def aggregate_series(
+    logits: torch.Tensor, class_names: list[str], method: str = "max_probability"
+) -> dict:
+    """
+    Combine per-instance model outputs into a single series-level prediction.
+
+    Args:
+        logits (torch.Tensor): Raw model outputs of shape (num_instances, num_classes).
+        class_names (list[str]): Class names corresponding to output labels.
+        method (str): 'max_probability' takes, for each class, its highest
+            probability over all instances and picks the class with the largest
+            one. 'mean_logit' averages the logits over the instances before the
+            softmax.
+
+    Returns:
+        dict: Aggregated class, its probability and the number of instances used.
+    """
+    if method == "max_probability":
+        probabilities = torch.softmax(logits, dim=1).max(dim=0).values
+    elif method == "mean_logit":
+        probabilities = torch.softmax(logits.mean(dim=0), dim=0)
+    else:
+        raise ValueError(f"Unknown aggregation method: {method}")
+
+    probability, index = torch.max(probabilities, 0)
+    return {
+        "class": class_names[index.item()],
+        "probability": probability.item(),
+        "aggregation": method,
+        "instances": logits.shape[0],
+    }
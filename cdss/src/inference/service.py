@@ -0,0 +1,214 @@
+import hashlib
+import importlib
+import io
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from src.inference.backends import load_runner
+from src.inference.preprocessing import array_to_tensor
+from src.metrics import FORWARD_BATCH_SIZE, FORWARD_SECONDS, PREPROCESS_SECONDS, span
+from src.inference.specs import ModelSpec
+
+
+def build_model(spec: ModelSpec) -> torch.nn.Module:
+    """
+    Instantiate the architecture of a registered model, without its weights.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+
+    Returns:
+        torch.nn.Module: Freshly initialized model.
+    """
+    module_name, class_name = spec.model_class.split(":")
+    model_class = getattr(importlib.import_module(module_name), class_name)
+    return model_class(**spec.model_kwargs)
+
+
+def weights_version(spec: ModelSpec) -> str:
+    """
+    Identify the weights a model is loaded with, from the content of the file,
+    and the labels and preprocessing of its registry entry.
+
+    Args:
+        spec (ModelSpec): Registry entry of the model.
+
+    Returns:
+        str: The backend, a short digest of its weights or artifact file and the
+            digest of its entry, see `ModelSpec.output_digest`.
+    """
+    path = spec.weights_path if spec.backend == "eager" else spec.artifact_path()
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return f"{spec.backend}-{digest.hexdigest()[:16]}-{spec.output_digest()}"
+
+
+class ClassificationService:
+    """
+    A service for image classification with a model from the registry.
+
+    Handles loading the model, preprocessing input images, and making predictions.
+    The model runs on the inference backend selected in its registry entry.
+
+    Attributes:
+        spec (ModelSpec): Registry entry of the model.
+        runner (EagerRunner | OnnxRunner): Runs the model on the selected backend.
+        device (torch.device): Device for computation (CPU or GPU).
+        transform (torchvision.transforms.Compose): Transformations for encoded images.
+        class_names (list[str]): List of class names corresponding to output labels.
+        load_seconds (float): Time taken to load the model or its artifact.
+        version (str): Version of the loaded weights, see `weights_version`.
+    """
+
+    def __init__(self, spec: ModelSpec):
+        """
+        Initialize the classification service.
+
+        Args:
+            spec (ModelSpec): Registry entry of the model.
+        """
+        self.spec = spec
+        self.class_names = spec.labels
+        self.transform = transforms.Compose(
+            [
+                transforms.Resize(spec.input_size),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=spec.mean, std=spec.std),
+            ]
+        )
+
+        start = time.perf_counter()
+        self.runner = load_runner(spec, self._load_model, torch.get_num_threads())
+        self.load_seconds = time.perf_counter() - start
+        self.device = self.runner.device
+        self.version = weights_version(spec)
+
+    def _load_model(self, device: torch.device) -> torch.nn.Module:
+        """
+        Build the model and load its pre-trained weights.
+
+        The weights are memory-mapped and assigned to the model without a copy, so
+        processes forked after loading, and processes loading the same file, share
+        the pages of the weights instead of holding private copies.
+
+        Args:
+            device (torch.device): Device to move the model to.
+
+        Returns:
+            torch.nn.Module: The loaded model.
+        """
+        model = build_model(self.spec)
+
+        state_dict = torch.load(
+            self.spec.weights_path, map_location="cpu", mmap=True, weights_only=True
+        )
+        model.load_state_dict(state_dict, strict=self.spec.strict, assign=True)
+        model.to(device)
+        model.eval()
+        return model
+
+    @property
+    def parameter_bytes(self) -> int:
+        """
+        Size of the model parameters and buffers, or of its artifact, in bytes.
+        """
+        return self.runner.parameter_bytes
+
+    def warm_up(self) -> float:
+        """
+        Run the model on a batch of blank images.
+
+        The first forward passes allocate buffers and select kernels, and
+        TorchScript optimizes its graph on the second run, all of which would
+        otherwise be paid for by the first predictions.
+
+        Returns:
+            float: Duration of the warm-up pass in seconds.
+        """
+        images = torch.zeros(1, 3, *self.spec.input_size)
+        start = time.perf_counter()
+        for _ in range(2):
+            self.forward_batch(images)
+        return time.perf_counter() - start
+
+    def predict(self, image_bytes: bytes):
+        """
+        Predict the class of an encoded image.
+
+        Args:
+            image_bytes (bytes): Byte representation of the image.
+
+        Returns:
+            dict: Predicted class and its probability.
+        """
+        with span("preprocess", PREPROCESS_SECONDS, model=self.spec.name):
+            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            images = self.transform(image).unsqueeze(0)
+        return self.predict_batch(images)[0]
+
+    def predict_array(self, pixel_array: np.ndarray):
+        """
+        Predict the class of a processed uint8 pixel array.
+
+        Args:
+            pixel_array (np.ndarray): Image of shape (H, W) or (H, W, 3).
+
+        Returns:
+            dict: Predicted class and its probability.
+        """
+        return self.predict_batch(self.preprocess_array(pixel_array).unsqueeze(0))[0]
+
+    def preprocess_array(self, pixel_array: np.ndarray) -> torch.Tensor:
+        """
+        Build the model input tensor from a processed uint8 pixel array.
+
+        Args:
+            pixel_array (np.ndarray): Image of shape (H, W) or (H, W, 3).
+
+        Returns:
+            torch.Tensor: Tensor of shape (3, height, width).
+        """
+        with span("preprocess", PREPROCESS_SECONDS, model=self.spec.name):
+            return array_to_tensor(
+                pixel_array, self.spec.input_size, self.spec.mean, self.spec.std
+            )
+
+    def predict_batch(self, images: torch.Tensor) -> list[dict]:
+        """
+        Predict the classes of a batch of preprocessed images.
+
+        Args:
+            images (torch.Tensor): Tensor of shape (batch_size, 3, height, width).
+
+        Returns:
+            list[dict]: Predicted class and its probability for each image.
+        """
+        output = self.forward_batch(images)
+        with torch.no_grad():
+            probabilities = torch.nn.functional.softmax(output, dim=1)
+            top_probs, predicted = torch.max(probabilities, 1)
+
+        return [
+            {"class": self.class_names[index], "probability": probability}
+            for index, probability in zip(predicted.tolist(), top_probs.tolist())
+        ]
+
+    def forward_batch(self, images: torch.Tensor) -> torch.Tensor:
+        """
+        Run the model on a batch of preprocessed images.
+
+        Args:
+            images (torch.Tensor): Tensor of shape (batch_size, 3, height, width).
+
+        Returns:
+            torch.Tensor: Raw logits of shape (batch_size, num_classes), on the CPU.
+        """
+        FORWARD_BATCH_SIZE.labels(model=self.spec.name).observe(len(images))
+        with span("forward", FORWARD_SECONDS, model=self.spec.name):
+            return self.runner(images).cpu()
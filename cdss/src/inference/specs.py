@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+from typing import Literal, Optional
+
+import yaml
+from pydantic import BaseModel, Field
+
+from src.config import Config
+from src.inference.client import BRAIN_TUMORS_MODEL, CHEST_CT_MODEL, configure_queues
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+InferenceBackend = Literal[
+    "eager", "torchscript", "onnx", "int8_dynamic", "int8_static"
+]
+
+# File name suffix of the artifact each exported backend is loaded from
+ARTIFACT_SUFFIXES = {
+    "torchscript": ".torchscript.pt",
+    "onnx": ".onnx",
+    "int8_dynamic": ".int8_dynamic.pt",
+    "int8_static": ".int8_static.onnx",
+}
+
+
+class ModelSpec(BaseModel):
+    """
+    Registry entry describing a classification model.
+
+    Everything needed to serve a model is declared here: its architecture,
+    weights, labels and preprocessing, the inference backend, how requests are
+    batched and the Celery queue its tasks are routed to. Models share a queue,
+    and so a pool of workers, when their entries set the same `queue`. Backends
+    other than `eager` run an artifact exported from the weights by
+    `python -m src.inference.export`. Routes and Celery tasks are generated
+    from the registry, so that adding a model does not take new code. This
+    module does not import torch, so the API process can read the registry
+    without loading the models.
+    """
+
+    name: str
+    route: str
+    title: str
+    model_class: str
+    model_kwargs: dict = Field(default_factory=dict)
+    weights_path: str
+    strict: bool = True
+    labels: list[str] = Field(..., min_length=2)
+    input_size: tuple[int, int] = (224, 224)
+    mean: tuple[float, float, float] = IMAGENET_MEAN
+    std: tuple[float, float, float] = IMAGENET_STD
+    max_batch_size: int = Field(8, ge=1)
+    max_wait_ms: float = Field(5.0, ge=0)
+    backend: InferenceBackend = "eager"
+    artifacts_dir: Optional[str] = None
+    channels_last: bool = False
+    queue: Optional[str] = None
+
+    @property
+    def task_queue(self) -> str:
+        """
+        Celery queue of the prediction tasks of the model.
+        """
+        return self.queue or f"{Config.CELERY_MODEL_QUEUE_PREFIX}{self.name}"
+
+    def output_digest(self) -> str:
+        """
+        Digest of the fields that change the predictions of the model besides
+        its weights: the architecture, the labels and the preprocessing.
+
+        Returns:
+            str: Short hex digest of those fields.
+        """
+        fields = self.model_dump(
+            include={
+                "model_class",
+                "model_kwargs",
+                "strict",
+                "labels",
+                "input_size",
+                "mean",
+                "std",
+            }
+        )
+        payload = json.dumps(fields, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def artifact_path(self, backend: Optional[InferenceBackend] = None) -> str:
+        """
+        Path of the exported artifact of a backend.
+
+        Artifacts are stored next to the weights unless `artifacts_dir` is set.
+
+        Args:
+            backend (Optional[InferenceBackend]): Backend of the artifact, defaults
+                to the backend of the model.
+
+        Returns:
+            str: Path of the artifact file.
+        """
+        backend = backend or self.backend
+        directory = self.artifacts_dir or os.path.dirname(self.weights_path)
+        return os.path.join(directory, f"{self.name}{ARTIFACT_SUFFIXES[backend]}")
+
+
+BUILTIN_MODELS = [
+    ModelSpec(
+        name=BRAIN_TUMORS_MODEL,
+        route="brain-tumors-classification",
+        title="brain tumor",
+        model_class="src.inference.brain_tumors_classification.model:BrainTumorClassifier",
+        model_kwargs={"num_classes": 4},
+        weights_path="./src/inference/brain_tumors_classification/weights/brain_tumors_classification.pt",
+        labels=["glioma", "meningioma", "notumor", "pituitary"],
+        max_batch_size=Config.BRAIN_TUMORS_MAX_BATCH_SIZE,
+        max_wait_ms=Config.BRAIN_TUMORS_MAX_WAIT_MS,
+    ),
+    ModelSpec(
+        name=CHEST_CT_MODEL,
+        route="chest-ct-cancer-classification",
+        title="chest CT cancer",
+        model_class="src.inference.chest_ct_cancer_classification.model:ChestCTCancerClassifier",
+        model_kwargs={"num_classes": 4},
+        weights_path="./src/inference/chest_ct_cancer_classification/weights/chest_ct_cancer_classification.pt",
+        strict=False,
+        labels=[
+            "adenocarcinoma_left.lower.lobe_T2_N0_M0_Ib",
+            "large.cell.carcinoma_left.hilum_T2_N2_M0_IIIa",
+            "normal",
+            "squamous.cell.carcinoma_left",
+        ],
+        max_batch_size=Config.CHEST_CT_MAX_BATCH_SIZE,
+        max_wait_ms=Config.CHEST_CT_MAX_WAIT_MS,
+    ),
+]
+
+
+def load_model_specs(registry_file: Optional[str] = None) -> dict[str, ModelSpec]:
+    """
+    Build the model registry from the built-in models and an optional YAML file.
+
+    The file holds a list of entries under `models`. An entry whose name matches
+    a known model overrides only the fields it sets; any other entry adds a
+    model and must set every required field. `enabled: false` removes a model.
+
+    Args:
+        registry_file (Optional[str]): Path of the YAML registry file, if any.
+
+    Returns:
+        dict[str, ModelSpec]: Model specs by name, in registration order.
+    """
+    specs = {spec.name: spec for spec in BUILTIN_MODELS}
+    if registry_file is None:
+        return specs
+
+    with open(registry_file) as file:
+        entries = (yaml.safe_load(file) or {}).get("models", [])
+
+    for entry in entries:
+        entry = dict(entry)
+        enabled = entry.pop("enabled", True)
+        name = entry["name"]
+        if not enabled:
+            specs.pop(name, None)
+        elif name in specs:
+            specs[name] = ModelSpec(**{**specs[name].model_dump(), **entry})
+        else:
+            specs[name] = ModelSpec(**entry)
+    return specs
+
+
+MODEL_SPECS = load_model_specs(Config.MODEL_REGISTRY_FILE)
+configure_queues(spec.task_queue for spec in MODEL_SPECS.values())
@@ -0,0 +1,173 @@
+import asyncio
+from typing import AsyncIterator
+
+import redis.asyncio
+from celery import states
+from celery.result import AsyncResult
+from fastapi.concurrency import run_in_threadpool
+
+from src.config import Config
+from src.inference.client import celery_app
+
+# State of a running task whose result holds the stage it reached, one of
+# `STAGES`
+PROGRESS_STATE = "PROGRESS"
+STAGES = ("downloading", "decoding", "inferring", "writing_back")
+
+
+def describe_task(task_id: str, state: str, info) -> dict:
+    """
+    Build the status of a task from its state and result in the result backend.
+
+    Args:
+        task_id (str): The task ID.
+        state (str): Celery state, or `PROGRESS_STATE`.
+        info: Result of a finished task, exception of a failed one, or the stage
+            of a running one.
+
+    Returns:
+        dict: Task ID, state, and the stage, result or error when there is one.
+    """
+    status = {"task_id": task_id, "state": state}
+    if state == PROGRESS_STATE and isinstance(info, dict):
+        status["stage"] = info.get("stage")
+    elif state == states.SUCCESS:
+        status["result"] = info
+    elif state in states.PROPAGATE_STATES and info is not None:
+        status["error"] = (
+            f"{type(info).__name__}: {info}"
+            if isinstance(info, BaseException)
+            else str(info)
+        )
+    return status
+
+
+def read_task_status(task_id: str) -> dict:
+    """
+    Read the status of a task from the result backend.
+
+    Unknown task IDs are reported as PENDING, like queued tasks.
+
+    Args:
+        task_id (str): The task ID.
+
+    Returns:
+        dict: Status of the task, see `describe_task`.
+    """
+    result = AsyncResult(task_id, app=celery_app)
+    return describe_task(task_id, result.state, result.info)
+
+
+def report_stage(task_id: str | None, stage: str):
+    """
+    Store the stage a running task reached in the result backend, which
+    publishes it to the clients following the task.
+
+    Args:
+        task_id (str | None): The task ID, None when called outside a task.
+        stage (str): One of `STAGES`.
+    """
+    if task_id is None or not Config.TASK_PROGRESS_ENABLED:
+        return
+    try:
+        celery_app.backend.store_result(task_id, {"stage": stage}, PROGRESS_STATE)
+    except Exception as e:
+        print("Failed to report the task stage:", e)
+
+
+def is_finished(status: dict) -> bool:
+    """
+    Whether a task has finished, successfully or not.
+
+    Args:
+        status (dict): Status of the task, see `describe_task`.
+
+    Returns:
+        bool: True if the task is in a ready state, e.g. SUCCESS or FAILURE.
+    """
+    return status["state"] in states.READY_STATES
+
+
+async def watch_tasks(
+    task_ids: list[str], timeout: float
+) -> AsyncIterator[dict | None]:
+    """
+    Follow the status of tasks until they have all finished.
+
+    With a Redis result backend, changes are received over the pub/sub channels
+    Celery publishes every stored state to, so waiting clients do not poll the
+    backend. Other backends are polled every TASK_EVENTS_POLL_SECONDS.
+
+    Args:
+        task_ids (list[str]): IDs of the tasks to follow.
+        timeout (float): Seconds after which to stop following them.
+
+    Returns:
+        AsyncIterator[dict | None]: The current status of every task, then each
+            change, and None after TASK_EVENTS_HEARTBEAT_SECONDS without any.
+    """
+    task_ids = list(dict.fromkeys(task_ids))
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    client = pubsub = None
+    if Config.CELERY_RESULT_BACKEND.startswith(("redis://", "rediss://")):
+        client = redis.asyncio.Redis.from_url(Config.CELERY_RESULT_BACKEND)
+        pubsub = client.pubsub()
+        # Subscribe before reading the current states, so no change is missed
+        await pubsub.subscribe(
+            *(celery_app.backend.get_key_for_task(task_id) for task_id in task_ids)
+        )
+
+    try:
+        latest = {}
+        for task_id in task_ids:
+            latest[task_id] = await run_in_threadpool(read_task_status, task_id)
+            yield latest[task_id]
+
+        last_sent = loop.time()
+        while not all(map(is_finished, latest.values())):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            wait = min(remaining, Config.TASK_EVENTS_HEARTBEAT_SECONDS)
+            if pubsub is not None:
+                changes = await next_published(pubsub, wait)
+            else:
+                await asyncio.sleep(min(wait, Config.TASK_EVENTS_POLL_SECONDS))
+                changes = [
+                    await run_in_threadpool(read_task_status, task_id)
+                    for task_id, status in latest.items()
+                    if not is_finished(status)
+                ]
+
+            for status in changes:
+                if latest.get(status["task_id"]) in (None, status):
+                    continue
+                latest[status["task_id"]] = status
+                last_sent = loop.time()
+                yield status
+            if loop.time() - last_sent >= Config.TASK_EVENTS_HEARTBEAT_SECONDS:
+                last_sent = loop.time()
+                yield None
+    finally:
+        if pubsub is not None:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+async def next_published(pubsub: redis.asyncio.client.PubSub, wait: float) -> list:
+    """
+    Wait for a state published by the result backend.
+
+    Args:
+        pubsub (PubSub): Subscription to the result keys of the tasks.
+        wait (float): Longest time to wait in seconds.
+
+    Returns:
+        list: The published status, or nothing if none came in time.
+    """
+    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=wait)
+    if message is None:
+        return []
+    meta = celery_app.backend.decode_result(message["data"])
+    return [describe_task(meta["task_id"], meta["status"], meta["result"])]
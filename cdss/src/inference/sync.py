@@ -0,0 +1,217 @@
+import asyncio
+import threading
+from collections import Counter
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from src.config import Config
+from src.dicom.schema import RenderParams
+from src.dicom.service import DicomService
+from src.inference.result_cache import prediction_cache
+from src.metrics import PREDICTION_FAILURES, span, trace
+
+
+class SyncInference:
+    """
+    In-process inference of the API for the synchronous prediction endpoints.
+
+    The models run in the API process, behind the same batching engines as in
+    the workers, so concurrent requests share forward passes. A request is
+    admitted only if the estimated wait for its batch, from the requests
+    already downloading, decoding or queued for the model and the recent
+    forward pass times, fits within the latency budget. Otherwise the caller
+    enqueues the Celery task instead. Results are returned to the caller and
+    also written back to the backend through the result writer, so the
+    prediction is recorded even if the caller gives up on the response.
+
+    The registry and the result writer are imported on startup, so that an
+    API without synchronous models never imports torch.
+
+    Attributes:
+        model_names (list[str]): Models served synchronously.
+        budget_ms (float): Longest estimated wait for a batch to be admitted.
+    """
+
+    def __init__(self, model_names: list[str], budget_ms: float):
+        """
+        Initialize the synchronous inference without loading any model.
+
+        Args:
+            model_names (list[str]): Models served synchronously.
+            budget_ms (float): Longest estimated wait for a batch to be admitted.
+        """
+        self.model_names = list(model_names)
+        self.budget_ms = budget_ms
+        self._dicom_service = DicomService()
+        self._registry = None
+        self._writer = None
+        # Admitted requests not yet queued on the batching engine
+        self._in_flight = Counter()
+        self._lock = threading.Lock()
+
+    def serves(self, model_name: str) -> bool:
+        """
+        Whether a model is served synchronously.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+
+        Returns:
+            bool: True if the model has a synchronous endpoint.
+        """
+        return model_name in self.model_names
+
+    def startup(self):
+        """
+        Load and warm up the models, budget their threads and start the result
+        writer. Blocks, so it is run in a thread from the API lifespan.
+        """
+        from src.inference.registry import model_registry
+        from src.inference.threads import (
+            set_inter_op_threads,
+            set_intra_op_threads,
+            thread_budget,
+        )
+        from src.inference.writeback import result_writer
+
+        intra_op_threads, inter_op_threads = thread_budget(1)
+        set_inter_op_threads(inter_op_threads)
+        set_intra_op_threads(intra_op_threads)
+
+        model_registry.load_all(self.model_names)
+        if Config.MODEL_WARMUP:
+            model_registry.warm_up_all()
+        for model_name in self.model_names:
+            # Times a first batch, which the wait estimates start from
+            model_registry.get_engine(model_name).predict(
+                np.zeros((64, 64), dtype=np.uint8)
+            )
+        print(
+            f"Serving models {self.model_names} synchronously with a "
+            f"{self.budget_ms} ms budget"
+        )
+
+        self._registry = model_registry
+        self._writer = result_writer
+        self._writer.start()
+
+    def shutdown(self):
+        """
+        Stop the batching engines once their queued requests are served, and
+        send the due write-backs.
+        """
+        if self._registry is None:
+            return
+        for model_name in self.model_names:
+            self._registry.get_engine(model_name).stop()
+        self._writer.stop()
+        self._registry = None
+
+    def admit(self, model_name: str) -> bool:
+        """
+        Reserve a place for a request if its estimated wait fits the budget.
+
+        An admitted request must be released with `release` once it has been
+        queued on the batching engine or has failed before.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+
+        Returns:
+            bool: True if the request is admitted.
+        """
+        if self._registry is None or not self.serves(model_name):
+            return False
+        engine = self._registry.get_engine(model_name)
+        with self._lock:
+            wait = engine.estimated_wait(self._in_flight[model_name])
+            if wait * 1000 > self.budget_ms:
+                return False
+            self._in_flight[model_name] += 1
+            return True
+
+    def release(self, model_name: str):
+        """
+        Release the place of an admitted request.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+        """
+        with self._lock:
+            self._in_flight[model_name] -= 1
+
+    async def predict(
+        self, model_name: str, prediction_id: str, instance_url: str, frame: int = 0
+    ) -> dict:
+        """
+        Classify a DICOM instance in-process, after `admit` has let it in.
+
+        Args:
+            model_name (str): Name of the model, e.g. 'brain_tumors'.
+            prediction_id (str): The prediction ID to update.
+            instance_url (str): The DICOM file instance URL.
+            frame (int): Frame to classify for multi-frame instances.
+
+        Returns:
+            dict: Prediction result with class and probability.
+        """
+        with trace(
+            "predict_sync", model=model_name, prediction_id=prediction_id, frame=frame
+        ):
+            try:
+                future = None
+                try:
+                    prediction, key, future = await self._submit(
+                        model_name, instance_url, frame
+                    )
+                finally:
+                    self.release(model_name)
+
+                if future is not None:
+                    with span("inference", model=model_name):
+                        prediction = await asyncio.wrap_future(future)
+                    await run_in_threadpool(prediction_cache.put, key, prediction)
+
+                await run_in_threadpool(
+                    self._writer.submit,
+                    prediction_id,
+                    {
+                        "result": prediction["class"],
+                        "probability": prediction["probability"],
+                    },
+                )
+                return prediction
+            except Exception as e:
+                from src.inference.writeback import FAILED_PAYLOAD
+
+                PREDICTION_FAILURES.labels(model=model_name).inc()
+                await run_in_threadpool(
+                    self._writer.submit, prediction_id, FAILED_PAYLOAD
+                )
+                raise e
+
+    async def _submit(self, model_name: str, instance_url: str, frame: int):
+        # Cached prediction, or the future of the prediction queued on the engine
+        service = self._registry.get_service(model_name)
+        with await self._dicom_service.fetch_dicom(instance_url) as fetched:
+            key = prediction_cache.key(
+                fetched.sha256, frame, model_name, service.version
+            )
+            cached = await run_in_threadpool(prediction_cache.get, model_name, key)
+            if cached is not None:
+                return cached, key, None
+            pixel_array = await run_in_threadpool(
+                self._dicom_service.read_pixel_array,
+                fetched.file,
+                RenderParams(frame=frame),
+            )
+        engine = self._registry.get_engine(model_name)
+        return None, key, await run_in_threadpool(engine.submit, pixel_array)
+
+
+sync_inference = (
+    SyncInference(Config.SYNC_INFERENCE_MODELS, Config.SYNC_INFERENCE_BUDGET_MS)
+    if Config.SYNC_INFERENCE_MODELS
+    else None
+)
@@ -0,0 +1,81 @@
+import os
+
+import cv2
+import torch
+
+from src.config import Config
+
+
+def available_cores() -> int:
+    """
+    Number of cores this process may run on.
+
+    Both the CPU affinity mask and a cgroup CPU quota, as set by
+    `docker run --cpus`, are taken into account.
+
+    Returns:
+        int: Usable cores, at least 1.
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+        if quota != "max":
+            cores = min(cores, int(quota) // int(period))
+    except (OSError, ValueError):
+        pass
+    return max(1, cores)
+
+
+def thread_budget(concurrency: int) -> tuple[int, int]:
+    """
+    Split the available cores between the concurrent tasks of a worker.
+
+    Each task gets an equal share of the cores for the intra-op threads of its
+    forward pass, so that a worker running few tasks at once still uses every
+    core and one running many does not oversubscribe them. The models are
+    sequential networks with no independent branches to run in parallel, so
+    one inter-op thread is enough. Both counts can be pinned with
+    INFERENCE_NUM_THREADS and INFERENCE_INTEROP_THREADS.
+
+    Args:
+        concurrency (int): Number of tasks the worker runs at the same time.
+
+    Returns:
+        tuple[int, int]: Intra-op and inter-op thread counts of each task.
+    """
+    intra_op = Config.INFERENCE_NUM_THREADS or max(
+        1, available_cores() // max(1, concurrency)
+    )
+    inter_op = Config.INFERENCE_INTEROP_THREADS or 1
+    return intra_op, inter_op
+
+
+def set_intra_op_threads(threads: int):
+    """
+    Set the threads of the torch and OpenCV pools of the current process.
+
+    Args:
+        threads (int): Intra-op thread count.
+    """
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+
+def set_inter_op_threads(threads: int):
+    """
+    Set the inter-op threads of torch, if the pool has not started yet.
+
+    Torch only allows this once per process, before any parallel work.
+
+    Args:
+        threads (int): Inter-op thread count.
+    """
+    try:
+        torch.set_num_interop_threads(threads)
+    except RuntimeError as e:
+        print(f"Could not set the inter-op threads: {e}")
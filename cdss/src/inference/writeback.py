@@ -0,0 +1,473 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Iterator, NamedTuple
+
+import httpx
+
+from src.config import Config
+from src.http_client import HttpClientPool
+from src.metrics import WRITEBACK_EVENTS, WRITEBACK_SECONDS, span
+
+# Answers worth retrying; any other client error is final, e.g. 409 for a
+# prediction that is no longer pending
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Answers of a backend without the bulk endpoint
+BULK_UNAVAILABLE_STATUSES = {404, 405, 501}
+
+FAILED_PAYLOAD = {"status": "failed"}
+
+
+class OutboxEntry(NamedTuple):
+    """
+    A write-back waiting in the outbox.
+    """
+
+    prediction_id: str
+    payload: dict
+    revision: int
+    attempts: int
+
+
+class ResultOutbox:
+    """
+    Durable queue of the write-backs the backend has not accepted yet.
+
+    Entries live in a SQLite database keyed by prediction ID, so a newer result
+    for a prediction replaces the pending one. The worker processes of a host,
+    and worker containers sharing the volume, use the same database. Each entry
+    is claimed for a lease before it is sent, so only one writer sends it at a
+    time, and entries left by a stopped or crashed worker are sent by the
+    others or after a restart.
+
+    Attributes:
+        path (str): Path of the database file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open the database, creating it if needed.
+
+        Args:
+            path (str): Path of the database file.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(sqlite3.connect(path, timeout=30)) as db:
+            # Persistent: readers do not block the writers of other processes
+            db.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    prediction_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    revision INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL,
+                    claimed_until REAL NOT NULL DEFAULT 0
+                )
+                """)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # A connection per transaction: connections cannot cross threads or forks
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def put(self, prediction_id: str, payload: dict):
+        """
+        Add a write-back, replacing any pending one of the same prediction.
+
+        Args:
+            prediction_id (str): The prediction ID.
+            payload (dict): Result and probability, or the failed status.
+        """
+        with self._transaction() as db:
+            db.execute(
+                """
+                INSERT INTO outbox (prediction_id, payload, next_attempt)
+                VALUES (?, ?, ?)
+                ON CONFLICT (prediction_id) DO UPDATE SET
+                    payload = excluded.payload,
+                    revision = revision + 1,
+                    attempts = 0,
+                    next_attempt = excluded.next_attempt,
+                    claimed_until = 0
+                """,
+                (prediction_id, json.dumps(payload), time.time()),
+            )
+
+    def claim(self, limit: int, lease_seconds: float) -> list[OutboxEntry]:
+        """
+        Claim the entries due for sending, oldest first.
+
+        Args:
+            limit (int): Largest number of entries to claim.
+            lease_seconds (float): Time after which unsettled entries can be
+                claimed again.
+
+        Returns:
+            list[OutboxEntry]: The claimed entries.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            rows = db.execute(
+                """
+                SELECT prediction_id, payload, revision, attempts FROM outbox
+                WHERE next_attempt <= ? AND claimed_until <= ?
+                ORDER BY next_attempt LIMIT ?
+                """,
+                (now, now, limit),
+            ).fetchall()
+            db.executemany(
+                "UPDATE outbox SET claimed_until = ? WHERE prediction_id = ?",
+                [(now + lease_seconds, row[0]) for row in rows],
+            )
+        return [
+            OutboxEntry(prediction_id, json.loads(payload), revision, attempts)
+            for prediction_id, payload, revision, attempts in rows
+        ]
+
+    def complete(self, entry: OutboxEntry):
+        """
+        Remove a sent entry, unless a newer write-back replaced it meanwhile.
+
+        Args:
+            entry (OutboxEntry): The claimed entry.
+        """
+        with self._transaction() as db:
+            db.execute(
+                "DELETE FROM outbox WHERE prediction_id = ? AND revision = ?",
+                (entry.prediction_id, entry.revision),
+            )
+
+    def retry(self, entry: OutboxEntry, delay: float):
+        """
+        Release a claimed entry to be sent again after a delay.
+
+        Args:
+            entry (OutboxEntry): The claimed entry.
+            delay (float): Seconds before the next attempt.
+        """
+        with self._transaction() as db:
+            db.execute(
+                """
+                UPDATE outbox
+                SET attempts = attempts + 1, next_attempt = ?, claimed_until = 0
+                WHERE prediction_id = ? AND revision = ?
+                """,
+                (time.time() + delay, entry.prediction_id, entry.revision),
+            )
+
+    def pending(self) -> int:
+        """
+        Number of write-backs in the outbox.
+        """
+        with self._transaction() as db:
+            return db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+class ResultWriter:
+    """
+    Buffered, retrying write-back of prediction results to the backend.
+
+    Results are stored in the outbox first, so the task that produced them can
+    finish without waiting for the backend, and nothing is lost when the
+    backend is down or the worker stops. A background thread sends them in
+    batches of up to `batch_size`, as soon as a batch is full or `flush_ms`
+    after the previous flush. A batch goes to the bulk endpoint if one is
+    configured, and otherwise, or once the backend answers that it has none,
+    as concurrent individual PATCHes over pooled connections. Failed sends are
+    retried with exponential backoff and full jitter, up to `max_attempts`.
+
+    Attributes:
+        outbox (ResultOutbox): Durable queue of the pending write-backs.
+        backend_url (str): Base URL of the backend.
+        bulk_path (str | None): Path of the bulk endpoint, None to disable it.
+        batch_size (int): Largest number of results sent in one flush.
+        flush_ms (float): Longest time a result waits for its batch to fill up.
+    """
+
+    def __init__(
+        self,
+        outbox: ResultOutbox,
+        backend_url: str,
+        api_key: str,
+        bulk_path: str | None = None,
+        batch_size: int = 32,
+        flush_ms: float = 100.0,
+        timeout: float = 10.0,
+        max_attempts: int = 20,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 300.0,
+    ):
+        """
+        Initialize the writer without starting its thread.
+
+        Args:
+            outbox (ResultOutbox): Durable queue of the pending write-backs.
+            backend_url (str): Base URL of the backend.
+            api_key (str): API key of the backend.
+            bulk_path (str | None): Path of the bulk endpoint, e.g. '/cdss/bulk'.
+            batch_size (int): Largest number of results sent in one flush.
+            flush_ms (float): Longest time a result waits for its batch to fill up.
+            timeout (float): Timeout of each request in seconds.
+            max_attempts (int): Attempts after which a result is dropped.
+            backoff_base_seconds (float): Delay cap of the first retry.
+            backoff_max_seconds (float): Largest delay cap of any retry.
+        """
+        self.outbox = outbox
+        self.backend_url = backend_url
+        self.bulk_path = bulk_path
+        self.batch_size = max(1, batch_size)
+        self.flush_ms = max(0.0, flush_ms)
+        self._api_key = api_key
+        self._timeout = timeout
+        # Covers the slowest batch, after which another writer may resend it
+        self._lease_seconds = 3 * timeout
+        self._max_attempts = max_attempts
+        self._backoff_base_seconds = backoff_base_seconds
+        self._backoff_max_seconds = backoff_max_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._wake = None
+        self._stopping = False
+        self._buffered = 0
+
+    def submit(self, prediction_id: str, payload: dict):
+        """
+        Store a write-back in the outbox and schedule it for sending.
+
+        Args:
+            prediction_id (str): The prediction ID.
+            payload (dict): Result and probability, or `FAILED_PAYLOAD`.
+        """
+        self.outbox.put(prediction_id, payload)
+        self._ensure_started()
+        with self._lock:
+            self._buffered += 1
+            if self._buffered >= self.batch_size:
+                self._wake.set()
+
+    def start(self):
+        """
+        Start the sending thread, which also sends the entries left in the
+        outbox by earlier runs.
+        """
+        self._ensure_started()
+
+    def stop(self):
+        """
+        Send the write-backs that are due and stop the sending thread. Those
+        that are not sent stay in the outbox.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+        self._thread = None
+        self._pid = None
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Delay before the next attempt, drawn uniformly up to an exponential cap.
+
+        Args:
+            attempts (int): Attempts made so far.
+
+        Returns:
+            float: Delay in seconds.
+        """
+        cap = min(self._backoff_max_seconds, self._backoff_base_seconds * 2**attempts)
+        return random.uniform(0, cap)
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each Celery child starts its own
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._wake = threading.Event()
+            self._stopping = False
+            self._buffered = 0
+            self._thread = threading.Thread(
+                target=self._run, name="result-writer", daemon=True
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        http_client = HttpClientPool()
+        # Consecutive failed flushes, which delay the next one
+        errors = 0
+        try:
+            while True:
+                delay = self.flush_ms / 1000
+                if errors:
+                    delay = max(delay, self.backoff(errors))
+                self._wake.wait(delay)
+                self._wake.clear()
+                # Read before flushing, so results submitted during the flush
+                # are sent by one more flush when stopping
+                stopping = self._stopping
+                with self._lock:
+                    self._buffered = 0
+                try:
+                    loop.run_until_complete(self._flush(http_client))
+                    errors = 0
+                except sqlite3.Error as e:
+                    errors += 1
+                    print(f"Write-back outbox error: {e}")
+                except Exception as e:
+                    # Claimed entries are sent again once their lease expires
+                    errors += 1
+                    print(f"Write-back flush failed: {type(e).__name__}: {e}")
+                if stopping:
+                    break
+        finally:
+            loop.run_until_complete(http_client.shutdown())
+            loop.close()
+
+    async def _flush(self, http_client: HttpClientPool):
+        client = http_client.get()
+        while True:
+            entries = self.outbox.claim(self.batch_size, self._lease_seconds)
+            if not entries:
+                return
+            outcomes = None
+            if self.bulk_path is not None:
+                outcomes = await self._send_bulk(client, entries)
+            if outcomes is None:
+                outcomes = await asyncio.gather(
+                    *(self._send_one(client, entry) for entry in entries),
+                    return_exceptions=True,
+                )
+            for entry, outcome in zip(entries, outcomes):
+                if isinstance(outcome, Exception):
+                    # Retried, and dropped after `max_attempts` like the others
+                    print(
+                        f"Write-back of prediction {entry.prediction_id} failed: {outcome}"
+                    )
+                    outcome = "retry"
+                self._settle(entry, outcome)
+            if len(entries) < self.batch_size:
+                return
+
+    def _headers(self) -> dict:
+        return {"x-api-key": self._api_key}
+
+    async def _send_one(self, client: httpx.AsyncClient, entry: OutboxEntry) -> str:
+        failed = entry.payload == FAILED_PAYLOAD
+        url = f"{self.backend_url}/cdss/{entry.prediction_id}"
+        try:
+            with span(
+                "writeback",
+                WRITEBACK_SECONDS,
+                outcome="failure" if failed else "result",
+            ):
+                response = await client.patch(
+                    f"{url}/fail" if failed else url,
+                    json=None if failed else entry.payload,
+                    headers=self._headers(),
+                    timeout=self._timeout,
+                )
+        except httpx.RequestError as e:
+            print(f"Request failed: {e}")
+            return "retry"
+        except httpx.InvalidURL as e:
+            print(f"Invalid write-back URL for prediction {entry.prediction_id!r}: {e}")
+            return "drop"
+        return self._outcome(response)
+
+    async def _send_bulk(
+        self, client: httpx.AsyncClient, entries: list[OutboxEntry]
+    ) -> list[str] | None:
+        body = {
+            "predictions": [
+                {"predictionId": entry.prediction_id, **entry.payload}
+                for entry in entries
+            ]
+        }
+        try:
+            with span("writeback", WRITEBACK_SECONDS, outcome="bulk"):
+                response = await client.patch(
+                    f"{self.backend_url}{self.bulk_path}",
+                    json=body,
+                    headers=self._headers(),
+                    timeout=self._timeout,
+                )
+        except httpx.RequestError as e:
+            print(f"Request failed: {e}")
+            return ["retry"] * len(entries)
+        if response.status_code in BULK_UNAVAILABLE_STATUSES:
+            print(
+                f"Bulk endpoint '{self.bulk_path}' unavailable "
+                f"({response.status_code}), sending results one by one"
+            )
+            self.bulk_path = None
+            return None
+        return [self._outcome(response)] * len(entries)
+
+    def _outcome(self, response: httpx.Response) -> str:
+        if response.is_success:
+            return "sent"
+        print(f"HTTP error occurred: {response.status_code} - {response.text}")
+        return "retry" if response.status_code in RETRY_STATUSES else "drop"
+
+    def _settle(self, entry: OutboxEntry, outcome: str):
+        if outcome == "retry" and entry.attempts + 1 >= self._max_attempts:
+            print(
+                f"Giving up the write-back of prediction {entry.prediction_id} "
+                f"after {entry.attempts + 1} attempts"
+            )
+            outcome = "drop"
+        if outcome == "retry":
+            self.outbox.retry(entry, self.backoff(entry.attempts))
+            WRITEBACK_EVENTS.labels(event="retried").inc()
+        else:
+            self.outbox.complete(entry)
+            WRITEBACK_EVENTS.labels(
+                event="sent" if outcome == "sent" else "dropped"
+            ).inc()
+
+
+def create_result_writer() -> ResultWriter:
+    """
+    Build the result writer configured by the settings.
+
+    Returns:
+        ResultWriter: The configured writer, not started yet.
+    """
+    return ResultWriter(
+        ResultOutbox(Config.WRITEBACK_OUTBOX_PATH),
+        Config.BACKEND_URL,
+        Config.API_KEY,
+        bulk_path=Config.WRITEBACK_BULK_PATH,
+        batch_size=Config.WRITEBACK_BATCH_SIZE,
+        flush_ms=Config.WRITEBACK_FLUSH_MS,
+        timeout=Config.WRITEBACK_TIMEOUT,
+        max_attempts=Config.WRITEBACK_MAX_ATTEMPTS,
+        backoff_base_seconds=Config.WRITEBACK_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds=Config.WRITEBACK_BACKOFF_MAX_SECONDS,
+    )
+
+
+result_writer = create_result_writer()
@@ -0,0 +1,267 @@
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from src.config import Config
+
+# prometheus_client picks its value storage when it is imported, so the
+# multiprocess directory has to be in the environment before the import below.
+# It is needed whenever metrics are recorded in forked or spawned children,
+# as in the Celery prefork pool and the preview render processes.
+if Config.PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", Config.PROMETHEUS_MULTIPROC_DIR)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CollectorRegistry,
+    Counter as PrometheusCounter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+SIZE_BUCKETS = tuple(2**exponent for exponent in range(14, 31, 2))
+
+DOWNLOAD_SECONDS = Histogram(
+    "cdss_dicom_download_seconds",
+    "Time to fetch a DICOM file, through the file cache when enabled",
+    buckets=LATENCY_BUCKETS,
+)
+DOWNLOAD_BYTES = Histogram(
+    "cdss_dicom_download_bytes",
+    "Size of the DICOM files downloaded from the file host",
+    buckets=SIZE_BUCKETS,
+)
+DECODE_SECONDS = Histogram(
+    "cdss_dicom_decode_seconds",
+    "Time to parse a DICOM file and decode one frame of its pixel data",
+    buckets=LATENCY_BUCKETS,
+)
+CONTRAST_SECONDS = Histogram(
+    "cdss_dicom_contrast_seconds",
+    "Time to resize, window and contrast-stretch a decoded frame",
+    ["window"],
+    buckets=LATENCY_BUCKETS,
+)
+ENCODE_SECONDS = Histogram(
+    "cdss_image_encode_seconds",
+    "Time to encode a rendered image",
+    ["format"],
+    buckets=LATENCY_BUCKETS,
+)
+PREPROCESS_SECONDS = Histogram(
+    "cdss_model_preprocess_seconds",
+    "Time to build the input tensor of one image",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+FORWARD_SECONDS = Histogram(
+    "cdss_model_forward_seconds",
+    "Time of a forward pass over a batch of images",
+    ["model"],
+    buckets=LATENCY_BUCKETS,
+)
+FORWARD_BATCH_SIZE = Histogram(
+    "cdss_model_forward_batch_size",
+    "Number of images in a forward pass",
+    ["model"],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+WRITEBACK_SECONDS = Histogram(
+    "cdss_backend_writeback_seconds",
+    "Time to write a prediction result, a failure or a bulk batch back to the backend",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+WRITEBACK_EVENTS = PrometheusCounter(
+    "cdss_backend_writebacks",
+    "Write-backs sent, scheduled for a retry or dropped",
+    ["event"],
+)
+BLACK_IMAGE_FALLBACKS = PrometheusCounter(
+    "cdss_black_image_fallbacks",
+    "Previews replaced by a black image because the DICOM file could not be rendered",
+    ["format"],
+)
+PREDICTION_FAILURES = PrometheusCounter(
+    "cdss_prediction_failures",
+    "Predictions reported to the backend as failed",
+    ["model"],
+)
+CACHE_EVENTS = PrometheusCounter(
+    "cdss_cache_events",
+    "Hits, misses and evictions of the DICOM file, preview and result caches",
+    ["cache", "event"],
+)
+SUBMISSIONS = PrometheusCounter(
+    "cdss_prediction_submissions",
+    "Prediction task submissions enqueued, deduplicated or rejected",
+    ["outcome"],
+)
+PREDICTION_CACHE_LOOKUPS = PrometheusCounter(
+    "cdss_prediction_cache_lookups",
+    "Prediction cache lookups by model and result",
+    ["model", "result"],
+)
+PIPELINE_IN_FLIGHT = Gauge(
+    "cdss_pipeline_in_flight",
+    "Tasks in each stage of the pipelined worker",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+
+current_trace = ContextVar("current_trace", default=None)
+
+
+class CacheStats(Counter):
+    """
+    Event counts of a cache, also counted in Prometheus.
+
+    Caches keep incrementing their `stats` as a plain `Counter`; every increase
+    is mirrored to `CACHE_EVENTS` under the cache name.
+
+    Attributes:
+        cache (str): Name of the cache, the value of the `cache` label.
+    """
+
+    def __init__(self, cache: str):
+        super().__init__()
+        self.cache = cache
+
+    def __setitem__(self, event: str, value: int):
+        increase = value - self.get(event, 0)
+        super().__setitem__(event, value)
+        if increase > 0:
+            CACHE_EVENTS.labels(cache=self.cache, event=event).inc(increase)
+
+
+class Trace:
+    """
+    Spans recorded while handling one request or task.
+
+    Attributes:
+        name (str): Name of the request or task.
+        attributes (dict): Identifiers of the request, e.g. the prediction ID.
+        spans (list[dict]): Name, start offset and duration of each stage.
+    """
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.spans = []
+        self.start = time.perf_counter()
+
+    def add(self, name: str, start: float, duration: float, attributes: dict):
+        self.spans.append(
+            {
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **attributes,
+            }
+        )
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Record the spans of a request or task, and print them when it is slow.
+
+    Traces are printed as one JSON line when tracing is enabled and the whole
+    request took at least TRACE_SLOW_MS.
+
+    Args:
+        name (str): Name of the request or task.
+        **attributes: Identifiers of the request, e.g. the prediction ID.
+    """
+    if not Config.TRACE_ENABLED:
+        yield None
+        return
+
+    current = Trace(name, attributes)
+    token = current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current_trace.reset(token)
+        total_ms = (time.perf_counter() - current.start) * 1000
+        if total_ms >= Config.TRACE_SLOW_MS:
+            record = {
+                "trace": name,
+                "duration_ms": round(total_ms, 2),
+                **attributes,
+                "spans": current.spans,
+            }
+            print(json.dumps(record, default=str))
+
+
+@contextmanager
+def span(name: str, histogram: Histogram | None = None, **labels):
+    """
+    Time a stage into a histogram and into the current trace, if any.
+
+    Args:
+        name (str): Name of the stage.
+        histogram (Histogram | None): Histogram observing the duration.
+        **labels: Label values of the histogram, also recorded on the span.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        if histogram is not None:
+            (histogram.labels(**labels) if labels else histogram).observe(duration)
+        current = current_trace.get()
+        if current is not None:
+            current.add(name, start, duration, labels)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Return the registry to expose, aggregating every process in multiprocess mode.
+
+    Returns:
+        CollectorRegistry: Registry for `generate_latest` or `start_http_server`.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def clear_multiprocess_dir():
+    """
+    Remove the metric files left over by the processes of a previous run.
+
+    Files of the current process are kept, its metrics are already mapped.
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory is None:
+        return
+    own_suffix = f"_{os.getpid()}.db"
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".db") and not entry.name.endswith(own_suffix):
+                os.remove(entry.path)
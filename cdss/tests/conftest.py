@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# The settings are read when `src.config` is imported, so the required ones are
+# set before any test module imports the application. Celery runs on in-memory
+# transports and the caches and the outbox live in a temporary directory.
+_tmp_dir = tempfile.mkdtemp(prefix="cdss-tests-")
+for name, value in {
+    "BACKEND_URL": "http://backend.invalid",
+    "API_KEY": "test-api-key",
+    "CLINIC_API_KEY": "test-clinic-api-key",
+    "CELERY_BROKER_URL": "memory://",
+    "CELERY_RESULT_BACKEND": "cache+memory://",
+    "DICOM_CACHE_DIR": os.path.join(_tmp_dir, "dicom"),
+    "WRITEBACK_OUTBOX_PATH": os.path.join(_tmp_dir, "writeback-outbox.db"),
+    "PREDICTION_CACHE": "off",
+    "METRICS_ENABLED": "false",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,51 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from src.config import Config
+from src.inference.admission import LocalSubmissionStore, submission_control
+
+SERIES_URL = "/api/v1/inference/chest-ct-cancer-classification/series"
+INSTANCE_URL = "/api/v1/inference/chest-ct-cancer-classification/"
+HEADERS = {"X-API-KEY": Config.API_KEY}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(submission_control, "store", LocalSubmissionStore(60))
+    return TestClient(main.app)
+
+
+def test_anonymous_series_are_not_deduplicated(client):
+    body = {"instances": ["http://files.invalid/a.dcm"]}
+    first = client.post(SERIES_URL, json=body, headers=HEADERS)
+    second = client.post(SERIES_URL, json=body, headers=HEADERS)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["task_id"] != second.json()["task_id"]
+
+
+def test_prediction_id_is_deduplicated(client):
+    body = {"predictionId": "p-1", "instance": "http://files.invalid/a.dcm"}
+    first = client.post(INSTANCE_URL, json=body, headers=HEADERS)
+    second = client.post(INSTANCE_URL, json=body, headers=HEADERS)
+    other = client.post(
+        INSTANCE_URL, json={**body, "predictionId": "p-2"}, headers=HEADERS
+    )
+
+    assert first.json()["task_id"] == second.json()["task_id"]
+    assert other.json()["task_id"] != first.json()["task_id"]
+
+
+def test_backend_error_replaces_the_existing_task(client, monkeypatch):
+    def unavailable(task_id):
+        raise ConnectionError("result backend unavailable")
+
+    body = {"predictionId": "p-3", "instance": "http://files.invalid/a.dcm"}
+    first = client.post(INSTANCE_URL, json=body, headers=HEADERS)
+    monkeypatch.setattr("src.inference.admission.read_task_status", unavailable)
+    second = client.post(INSTANCE_URL, json=body, headers=HEADERS)
+
+    assert second.status_code == 200
+    assert second.json()["task_id"] != first.json()["task_id"]
+    assert submission_control.store.get("p-3") == second.json()["task_id"]
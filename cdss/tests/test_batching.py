@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+import pytest
+import torch
+
+from src.inference.batching import BatchingEngine
+
+
+def image(value: float) -> torch.Tensor:
+    return torch.full((1, 2, 2), value)
+
+
+def first_pixels(batch: torch.Tensor) -> list[float]:
+    return batch[:, 0, 0, 0].tolist()
+
+
+def test_full_batch_is_flushed_without_waiting():
+    engine = BatchingEngine(first_pixels, max_batch_size=4, max_wait_ms=10_000)
+    try:
+        start = time.monotonic()
+        futures = [engine.submit(image(i)) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+        assert time.monotonic() - start < 5
+    finally:
+        engine.stop()
+
+    assert results == [0.0, 1.0, 2.0, 3.0]
+    assert engine.batch_size_histogram() == {4: 1}
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    engine = BatchingEngine(first_pixels, max_batch_size=8, max_wait_ms=200)
+    try:
+        futures = [engine.submit(image(i)) for i in range(3)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        engine.stop()
+
+    assert results == [0.0, 1.0, 2.0]
+    assert engine.batch_size_histogram() == {3: 1}
+
+
+def test_batch_errors_fail_every_request():
+    def fail(batch):
+        raise ValueError("forward pass failed")
+
+    engine = BatchingEngine(fail, max_batch_size=2, max_wait_ms=1_000)
+    try:
+        futures = [engine.submit(image(i)) for i in range(2)]
+        for future in futures:
+            with pytest.raises(ValueError, match="forward pass failed"):
+                future.result(timeout=5)
+    finally:
+        engine.stop()
+
+
+def test_missing_results_fail_every_request():
+    engine = BatchingEngine(
+        lambda batch: first_pixels(batch)[:1], max_batch_size=2, max_wait_ms=1_000
+    )
+    try:
+        futures = [engine.submit(image(i)) for i in range(2)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="1 results for a batch of 2"):
+                future.result(timeout=5)
+    finally:
+        engine.stop()
+
+
+def test_requests_submitted_while_stopping_fail():
+    running = threading.Event()
+    release = threading.Event()
+
+    def blocking(batch):
+        running.set()
+        release.wait(5)
+        return first_pixels(batch)
+
+    engine = BatchingEngine(blocking, max_batch_size=1, max_wait_ms=0)
+    served = engine.submit(image(1))
+    assert running.wait(5)
+
+    stopper = threading.Thread(target=engine.stop)
+    stopper.start()
+    # Wait for the stop sentinel to be queued behind the running batch
+    while engine.pending() == 0:
+        time.sleep(0.001)
+    late = engine.submit(image(2))
+    release.set()
+    stopper.join(5)
+
+    assert served.result(timeout=5) == 1.0
+    with pytest.raises(RuntimeError, match="stopped"):
+        late.result(timeout=5)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_child_starts_its_own_batching_thread():
+    engine = BatchingEngine(first_pixels, max_batch_size=4, max_wait_ms=1)
+    try:
+        assert engine.predict(image(1), timeout=5) == 1.0
+
+        pid = os.fork()
+        if pid == 0:
+            # The batching thread of the parent does not exist in the child
+            code = 1
+            try:
+                code = 0 if engine.predict(image(2), timeout=5) == 2.0 else 1
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+
+        assert engine.predict(image(3), timeout=5) == 3.0
+    finally:
+        engine.stop()
@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+
+from src.config import Config
+from src.dicom.service import DicomService
+
+
+def test_large_contact_sheet_is_shrunk_to_fit():
+    service = DicomService()
+    _, tile = cv2.imencode(".png", np.full((64, 64), 255, dtype=np.uint8))
+    tiles = [tile.tobytes()] * Config.PREVIEW_BATCH_MAX_INSTANCES
+
+    sheet = service.compose_contact_sheet(tiles, 1024, "webp")
+
+    image = cv2.imdecode(np.frombuffer(sheet, np.uint8), cv2.IMREAD_UNCHANGED)
+    height, width = image.shape[:2]
+    assert max(height, width) <= Config.PREVIEW_SHEET_MAX_SIDE
+    assert height * width <= Config.PREVIEW_SHEET_MAX_PIXELS
+    assert image.max() == 255
+
+
+def test_contact_sheet_grid_keeps_small_tiles():
+    assert DicomService.contact_sheet_grid(4, 256) == (256, 2, 2)
+    assert DicomService.contact_sheet_grid(5, 256, columns=5) == (256, 5, 1)
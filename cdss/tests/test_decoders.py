@@ -0,0 +1,67 @@
+import io
+
+import numpy as np
+import pydicom
+import pytest
+from pydicom.encaps import get_frame
+from pydicom.uid import JPEG2000Lossless
+
+from benchmarks.synthetic import can_encode, make_dicom, make_pixel_array
+from src.dicom.decoders import (
+    decode_j2k_reduced,
+    read_decode_header,
+    read_encapsulated_frame,
+)
+
+FRAMES = 8
+
+pytestmark = pytest.mark.skipif(
+    not can_encode(JPEG2000Lossless, "uint16"), reason="No JPEG 2000 encoder"
+)
+
+
+class CountingReader(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+@pytest.fixture(scope="module")
+def multi_frame_j2k():
+    frames = np.stack(
+        [make_pixel_array(256, 256, "uint16", seed) for seed in range(FRAMES)]
+    )
+    return frames, make_dicom(frames, JPEG2000Lossless)
+
+
+def test_reads_only_the_requested_frame(multi_frame_j2k):
+    _, data = multi_frame_j2k
+    pixel_data = pydicom.dcmread(io.BytesIO(data)).PixelData
+    header = read_decode_header(io.BytesIO(data))
+
+    for frame in (0, FRAMES - 1):
+        reader = CountingReader(data)
+        codestream = read_encapsulated_frame(reader, header, frame)
+
+        assert codestream == get_frame(pixel_data, frame, number_of_frames=FRAMES)
+        assert reader.bytes_read < len(data) / 2
+        assert reader.tell() == 0
+
+
+def test_reduced_decode_of_a_later_frame(multi_frame_j2k):
+    frames, data = multi_frame_j2k
+    file = io.BytesIO(data)
+    header = read_decode_header(file)
+
+    reduced = decode_j2k_reduced(file, header, FRAMES - 1, 1)
+
+    assert reduced.shape == (128, 128)
+    # The reduced image is closest to the requested frame, downsampled
+    downsampled = frames.reshape(FRAMES, 128, 2, 128, 2).mean(axis=(2, 4))
+    errors = np.abs(downsampled - reduced).mean(axis=(1, 2))
+    assert errors.argmin() == FRAMES - 1
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import threading
+
+import httpx
+from filelock import FileLock
+
+from src.dicom.cache import DicomFileCache
+
+CONTENT = b"DICM" * 1024
+URL = "http://files.invalid/a.dcm"
+
+
+def make_client(requests: list) -> httpx.AsyncClient:
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == "v1":
+            return httpx.Response(304)
+        return httpx.Response(200, content=CONTENT, headers={"ETag": "v1"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_hits_are_read_and_verified_off_the_event_loop(tmp_path, monkeypatch):
+    cache = DicomFileCache(str(tmp_path), 1024**2, ttl_seconds=3600, verify=True)
+    threads = []
+    read_entry = cache._read_entry
+
+    def recording_read_entry(key, meta):
+        threads.append(threading.current_thread())
+        return read_entry(key, meta)
+
+    monkeypatch.setattr(cache, "_read_entry", recording_read_entry)
+    requests = []
+
+    async def fetch_twice():
+        async with make_client(requests) as client:
+            for _ in range(2):
+                with await cache.fetch(URL, client) as fetched:
+                    assert fetched.file.read() == CONTENT
+                    assert fetched.sha256 == hashlib.sha256(CONTENT).hexdigest()
+            return threading.current_thread()
+
+    loop_thread = asyncio.run(fetch_twice())
+
+    assert len(requests) == 1
+    assert cache.stats["hits"] == 1
+    assert threads and all(thread is not loop_thread for thread in threads)
+
+
+def test_stale_entries_are_revalidated(tmp_path):
+    cache = DicomFileCache(str(tmp_path), 1024**2, ttl_seconds=0, verify=True)
+    requests = []
+
+    async def fetch_twice():
+        async with make_client(requests) as client:
+            for _ in range(2):
+                with await cache.fetch(URL, client) as fetched:
+                    assert fetched.file.read() == CONTENT
+
+    asyncio.run(fetch_twice())
+
+    assert len(requests) == 2
+    assert requests[1].headers["If-None-Match"] == "v1"
+    assert cache.stats["revalidations"] == 1
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def test_lock_files_are_bounded(tmp_path):
+    # Room for two entries, so every other fetch evicts
+    cache = DicomFileCache(str(tmp_path), 2 * len(CONTENT), ttl_seconds=3600)
+    urls = [f"http://files.invalid/{i}.dcm" for i in range(40)]
+
+    async def fetch_all():
+        async with make_client([]) as client:
+            for url in urls:
+                with await cache.fetch(url, client):
+                    pass
+
+    asyncio.run(fetch_all())
+
+    assert cache.stats["evictions"] == len(urls) - 2
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".lock")] == [
+        "evict.lock"
+    ]
+    stripes = {url_key(url)[:2] + ".lock" for url in urls}
+    assert set(os.listdir(tmp_path / "locks")) <= stripes
+
+
+def test_eviction_skips_locked_entries(tmp_path):
+    cache = DicomFileCache(str(tmp_path), len(CONTENT), ttl_seconds=3600)
+    old_url = "http://files.invalid/old.dcm"
+    new_urls = [
+        url
+        for url in (f"http://files.invalid/{i}.dcm" for i in range(10))
+        if url_key(url)[:2] != url_key(old_url)[:2]
+    ][:2]
+
+    async def fetch(url):
+        async with make_client([]) as client:
+            with await cache.fetch(url, client):
+                pass
+
+    asyncio.run(fetch(old_url))
+    # A revalidation of the old entry in another process holds its lock
+    with FileLock(cache._lock_path(url_key(old_url))):
+        asyncio.run(fetch(new_urls[0]))
+    assert os.path.exists(cache._path(url_key(old_url), ".dcm"))
+
+    asyncio.run(fetch(new_urls[1]))
+    assert not os.path.exists(cache._path(url_key(old_url), ".dcm"))
@@ -0,0 +1,31 @@
+import pytest
+
+from src.inference.service import weights_version
+from src.inference.specs import MODEL_SPECS
+
+
+@pytest.fixture
+def spec(tmp_path):
+    weights_path = tmp_path / "model.pt"
+    weights_path.write_bytes(b"weights")
+    return MODEL_SPECS["brain_tumors"].model_copy(
+        update={"weights_path": str(weights_path)}
+    )
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"labels": ["a", "b", "c", "d"]},
+        {"input_size": (256, 256)},
+        {"mean": (0.5, 0.5, 0.5)},
+        {"std": (0.5, 0.5, 0.5)},
+    ],
+)
+def test_version_changes_with_labels_and_preprocessing(spec, update):
+    assert weights_version(spec.model_copy(update=update)) != weights_version(spec)
+
+
+def test_version_ignores_serving_settings(spec):
+    update = {"max_batch_size": 32, "max_wait_ms": 1.0, "queue": "other"}
+    assert weights_version(spec.model_copy(update=update)) == weights_version(spec)
@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from benchmarks.preprocess_parity import (
+    PROBABILITY_TOLERANCE,
+    TENSOR_TOLERANCE,
+    build_services,
+    legacy_tensor,
+)
+from benchmarks.synthetic import make_dicom, make_pixel_array
+from src.dicom.service import DicomService
+from src.inference.preprocessing import array_to_tensor
+from src.inference.specs import MODEL_SPECS
+
+# Mean absolute difference allowed against the lossy JPEG round trip
+JPEG_MEAN_TOLERANCE = 0.02
+
+dicom_service = DicomService()
+
+
+@pytest.fixture(scope="module")
+def services(tmp_path_factory):
+    return build_services(str(tmp_path_factory.mktemp("weights")))
+
+
+@pytest.fixture(params=[("uint8", 0), ("uint16", 1)], ids=["uint8", "uint16"])
+def fixture_dicom(request) -> bytes:
+    dtype, seed = request.param
+    return make_dicom(make_pixel_array(256, 256, dtype, seed))
+
+
+@pytest.mark.parametrize("model_name", list(MODEL_SPECS))
+def test_predict_array_matches_legacy_paths(services, fixture_dicom, model_name):
+    service = services[model_name]
+    array = dicom_service.read_pixel_array(io.BytesIO(fixture_dicom))
+    tensor = array_to_tensor(array)
+    direct = service.predict_array(array)
+
+    png = dicom_service.encode_image(array, "png").getvalue()
+    png_diff = (legacy_tensor(service, png) - tensor).abs().max().item()
+    legacy_png = service.predict(png)
+    assert png_diff <= TENSOR_TOLERANCE
+    assert legacy_png["class"] == direct["class"]
+    assert abs(legacy_png["probability"] - direct["probability"]) <= (
+        PROBABILITY_TOLERANCE
+    )
+
+    # The JPEG/PIL path the workers used before `predict_array`
+    jpeg = dicom_service.process_dicom_data(
+        io.BytesIO(fixture_dicom), "jpeg"
+    ).getvalue()
+    jpeg_diff = (legacy_tensor(service, jpeg) - tensor).abs().mean().item()
+    assert jpeg_diff <= JPEG_MEAN_TOLERANCE
+    assert service.predict(jpeg)["class"] == direct["class"]
@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+from src.dicom.preview_cache import PreviewCache
+
+
+def disk_usage(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in os.listdir(directory)
+        if not name.endswith((".tmp", ".lock"))
+    )
+
+
+def test_disk_tier_is_scanned_only_when_full(tmp_path, monkeypatch):
+    cache = PreviewCache(0, str(tmp_path), max_disk_bytes=10_000)
+    scans = []
+    disk_entries = cache._disk_entries
+    monkeypatch.setattr(
+        cache, "_disk_entries", lambda: scans.append(1) or disk_entries()
+    )
+
+    for index in range(100):
+        cache.put(f"key-{index}", b"x" * 100)
+    assert not scans
+
+    # Evicting down to the low watermark leaves room for about 10 more writes
+    for index in range(100, 300):
+        cache.put(f"key-{index}", b"x" * 100)
+    assert 0 < len(scans) <= 20
+    assert disk_usage(str(tmp_path)) <= 10_000
+    assert cache.stats["disk_evictions"] > 0
+
+
+def test_running_size_counts_replaced_entries(tmp_path):
+    cache = PreviewCache(0, str(tmp_path), max_disk_bytes=10_000)
+    for _ in range(50):
+        cache.put("key", b"x" * 1000)
+    assert cache._disk_bytes == 1000
+    assert cache.stats["disk_evictions"] == 0
+
+
+def test_async_access_goes_through_both_tiers(tmp_path):
+    async def roundtrip():
+        await cache.aput("key", b"image")
+        memory_hit = await cache.aget("key")
+        cache._entries.clear()
+        disk_hit = await cache.aget("key")
+        miss = await cache.aget("other")
+        return memory_hit, disk_hit, miss
+
+    cache = PreviewCache(1024, str(tmp_path), max_disk_bytes=10_000)
+    assert asyncio.run(roundtrip()) == (b"image", b"image", None)
+    assert cache.stats["memory_hits"] == 1
+    assert cache.stats["disk_hits"] == 1
+    assert cache.stats["misses"] == 1
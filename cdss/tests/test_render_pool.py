@@ -0,0 +1,55 @@
+import asyncio
+import io
+from concurrent.futures import Future
+
+import pytest
+from fastapi import HTTPException
+
+from src.dicom.download import FetchedDicom
+from src.dicom.render_pool import RenderPool
+from src.dicom.schema import RenderParams
+
+
+class StalledExecutor:
+    """
+    Executor whose renders run until the test finishes them.
+    """
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        # Running futures cannot be cancelled, like a busy render process
+        future.set_running_or_notify_cancel()
+        self.futures.append(future)
+        return future
+
+
+def fetched_dicom() -> FetchedDicom:
+    return FetchedDicom(io.BytesIO(b"DICM"), "0" * 64, 4)
+
+
+def test_timed_out_render_keeps_its_slot_until_it_finishes():
+    pool = RenderPool(processes=1, queue_size=1, timeout=0.05)
+    executor = StalledExecutor()
+    pool._executor = executor
+
+    async def render():
+        return await pool.render(fetched_dicom(), "png", RenderParams(), [])
+
+    with pytest.raises(HTTPException) as timed_out:
+        asyncio.run(render())
+    assert timed_out.value.status_code == 504
+
+    # The abandoned render still runs in the executor
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(render())
+    assert rejected.value.status_code == 503
+    assert len(executor.futures) == 1
+
+    executor.futures[0].set_result([])
+    with pytest.raises(HTTPException) as timed_out:
+        asyncio.run(render())
+    assert timed_out.value.status_code == 504
+    assert len(executor.futures) == 2
@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from src.inference.sync import SyncInference
+from src.inference.writeback import FAILED_PAYLOAD
+
+MODEL = "brain_tumors"
+
+
+class FakeEngine:
+    """
+    Engine whose batches take 10 ms, with nothing queued.
+    """
+
+    def estimated_wait(self, queued: int = 0) -> float:
+        return (queued + 1) * 0.01
+
+
+class FakeRegistry:
+    def get_service(self, model_name: str) -> SimpleNamespace:
+        return SimpleNamespace(version="test")
+
+    def get_engine(self, model_name: str) -> FakeEngine:
+        return FakeEngine()
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, prediction_id: str, payload: dict):
+        self.submitted.append((prediction_id, payload))
+
+
+@pytest.fixture
+def inference():
+    inference = SyncInference([MODEL], budget_ms=25)
+    # Started without loading any model
+    inference._registry = FakeRegistry()
+    inference._writer = RecordingWriter()
+    return inference
+
+
+def test_admit_rejects_requests_over_the_budget(inference):
+    assert inference.admit(MODEL)
+    assert inference.admit(MODEL)
+    # Two admitted requests ahead put the estimated wait at 30 ms
+    assert not inference.admit(MODEL)
+
+    inference.release(MODEL)
+    assert inference.admit(MODEL)
+
+
+def test_admit_rejects_unserved_models(inference):
+    assert not inference.admit("chest_ct")
+    assert not SyncInference([MODEL], budget_ms=25).admit(MODEL)
+
+
+def test_failed_prediction_releases_its_place(inference, monkeypatch):
+    async def unreachable(instance_url):
+        raise HTTPException(status_code=502, detail="Failed to fetch the file")
+
+    monkeypatch.setattr(inference._dicom_service, "fetch_dicom", unreachable)
+
+    assert inference.admit(MODEL)
+    with pytest.raises(HTTPException):
+        asyncio.run(inference.predict(MODEL, "p-1", "http://files.invalid/a.dcm"))
+
+    assert inference._in_flight[MODEL] == 0
+    assert inference._writer.submitted == [("p-1", FAILED_PAYLOAD)]
+    assert inference.admit(MODEL)
+    assert inference.admit(MODEL)
@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+
+import pytest
+from celery import states
+
+from src.config import Config
+from src.inference.client import celery_app
+from src.inference.status import STAGES, report_stage, watch_tasks
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    # The in-memory result backend is polled, not subscribed to
+    monkeypatch.setattr(Config, "TASK_EVENTS_POLL_SECONDS", 0.01)
+
+
+def follow(task_id: str, steps: list) -> list[dict]:
+    """
+    Follow a task, applying the next step to the backend after each status.
+    The stream must end by itself well before its timeout.
+    """
+
+    async def collect():
+        received = []
+        async for status in watch_tasks([task_id], timeout=60):
+            if status is None:
+                continue
+            received.append(status)
+            if steps:
+                steps.pop(0)()
+        return received
+
+    return asyncio.run(asyncio.wait_for(collect(), 5))
+
+
+def test_stages_are_streamed_in_order_until_success():
+    task_id = str(uuid.uuid4())
+    steps = [lambda stage=stage: report_stage(task_id, stage) for stage in STAGES]
+    steps.append(
+        lambda: celery_app.backend.store_result(
+            task_id, {"class": "glioma"}, states.SUCCESS
+        )
+    )
+
+    received = follow(task_id, steps)
+
+    assert [status["state"] for status in received] == [
+        states.PENDING,
+        *["PROGRESS"] * len(STAGES),
+        states.SUCCESS,
+    ]
+    assert [status.get("stage") for status in received[1:-1]] == list(STAGES)
+    assert received[-1]["result"] == {"class": "glioma"}
+
+
+def test_failure_ends_the_stream():
+    task_id = str(uuid.uuid4())
+    steps = [
+        lambda: report_stage(task_id, "downloading"),
+        lambda: celery_app.backend.store_result(
+            task_id, ValueError("unreadable file"), states.FAILURE
+        ),
+    ]
+
+    received = follow(task_id, steps)
+
+    assert [status["state"] for status in received] == [
+        states.PENDING,
+        "PROGRESS",
+        states.FAILURE,
+    ]
+    assert received[-1]["error"] == "ValueError: unreadable file"
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from src.inference.writeback import ResultOutbox, ResultWriter
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def make_writer(tmp_path, **kwargs) -> ResultWriter:
+    return ResultWriter(
+        ResultOutbox(str(tmp_path / "outbox.db")),
+        "http://backend.invalid",
+        "api-key",
+        flush_ms=10,
+        backoff_base_seconds=0.01,
+        backoff_max_seconds=0.05,
+        **kwargs,
+    )
+
+
+def test_sender_survives_a_failed_flush(tmp_path, monkeypatch):
+    writer = make_writer(tmp_path)
+    flushes = []
+
+    async def flush(http_client):
+        flushes.append(threading.current_thread())
+        if len(flushes) == 1:
+            raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(writer, "_flush", flush)
+    writer.start()
+    try:
+        wait_for(lambda: len(flushes) >= 3)
+        assert writer._thread.is_alive()
+    finally:
+        writer.stop()
+
+
+def test_dead_sender_is_restarted(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.start()
+    first = writer._thread
+    writer._stopping = True
+    writer._wake.set()
+    first.join()
+
+    writer.start()
+    try:
+        assert writer._thread is not first
+        assert writer._thread.is_alive()
+    finally:
+        writer.stop()
+
+
+def test_invalid_url_is_dropped(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.submit("bad\x00id", {"result": "glioma", "probability": 0.9})
+    try:
+        wait_for(lambda: writer.outbox.pending() == 0)
+    finally:
+        writer.stop()